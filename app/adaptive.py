@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+from app.metrics import counter
+
+MODE_CHANGES = counter("passito_capture_mode_changes_total", "Adaptive capture mode switches",
+                       ("camera", "mode"))
+
+IDLE = "idle"
+ACTIVE = "active"
+HIGH_RES = "high_res"
+THROTTLED = "throttled"
+MODES = (IDLE, ACTIVE, HIGH_RES, THROTTLED)
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def parse_resolution(text):
+    """Parse '1280x720' into (1280, 720); empty means none."""
+    if not text:
+        return None
+    w, sep, h = text.lower().partition("x")
+    if not sep or not w.isdigit() or not h.isdigit():
+        raise ValueError(f"Invalid resolution '{text}' (expected WIDTHxHEIGHT)")
+    return int(w), int(h)
+
+
+def cpu_temperature():
+    """SoC temperature in degrees Celsius, or None where the kernel does not expose it."""
+    try:
+        with open(THERMAL_ZONE) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_load():
+    """1-minute load average per core, or None where unavailable."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        return None
+
+
+class SystemProbe:
+    """Temperature and load, re-read at most every `interval` seconds and shared by all cameras."""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.temperature = None
+        self.load = None
+        self._ts = 0.0
+
+    def poll(self):
+        now = time.monotonic()
+        if now - self._ts >= self.interval:
+            self._ts = now
+            self.temperature = cpu_temperature()
+            self.load = cpu_load()
+        return self.temperature, self.load
+
+
+class AdaptiveCapture:
+    """Picks capture rate, resolution and decode frequency for one camera.
+
+    Modes:
+      idle       nobody at the gate: frames are read at `idle_fps` and only the
+                 gate's motion/finder check runs on them.
+      active     motion, a finder pattern or a decode was seen in the last
+                 `hold_secs`: frames are read as fast as the camera delivers.
+      high_res   active, but `miss_limit` decodes failed while the gate saw a
+                 finder pattern (a small or distant code): the camera switches
+                 to `high_res` until the gate goes idle again.
+      throttled  active while the SoC is above `temp_limit` or load is above
+                 `load_limit`: capture is capped at `throttled_fps`, resolution stays at the
+                 base size and the gate stops its blind keep-alive decodes.
+
+    The capture thread calls `before_read` (which applies any resolution
+    change on that thread) and `delay`; the gate and decode results are fed in
+    through `note_gate` and `note_decode`.
+    """
+
+    def __init__(self, cap, name="0", gate=None, base_res=(640, 480), high_res=(1280, 720),
+                 idle_fps=5.0, throttled_fps=10.0, hold_secs=3.0, miss_limit=15, temp_limit=75.0,
+                 load_limit=1.5, probe=None):
+        self.cap = cap
+        self.name = name
+        self.gate = gate
+        self.base_res = base_res
+        self.high_res = high_res
+        self.idle_fps = idle_fps
+        self.throttled_fps = throttled_fps
+        self.hold_secs = hold_secs
+        self.miss_limit = miss_limit
+        self.temp_limit = temp_limit
+        self.load_limit = load_limit
+        self.probe = probe or SystemProbe()
+        self.mode = IDLE
+        self.resolution = base_res
+        self._want_res = base_res
+        self._last_activity = 0.0
+        self._last_finder = 0.0
+        self._misses = 0
+        self._last_read = 0.0
+        self._keepalive = gate.keepalive_every if gate is not None else None
+        self.changes = 0
+
+    @property
+    def target_fps(self):
+        """Capture rate for the current mode; 0 means as fast as the camera delivers."""
+        if self.mode == IDLE:
+            return self.idle_fps
+        if self.mode == THROTTLED:
+            return self.throttled_fps
+        return 0.0
+
+    def note_gate(self, accepted, reason=None):
+        """Record the gate's verdict on a frame; motion, a finder pattern or a held ROI count as activity."""
+        if accepted and reason in ("motion", "finder", "roi"):
+            self._last_activity = time.monotonic()
+            if reason == "finder":
+                self._last_finder = self._last_activity
+        self._update()
+
+    def note_decode(self, hit):
+        if hit:
+            self._last_activity = time.monotonic()
+            self._misses = 0
+        elif time.monotonic() - self._last_finder < 0.5:
+            # Something QR-shaped is held still in view but does not decode at this resolution
+            self._misses += 1
+        self._update()
+
+    def _update(self):
+        temperature, load = self.probe.poll()
+        hot = ((temperature is not None and temperature >= self.temp_limit)
+               or (load is not None and load >= self.load_limit))
+        busy = time.monotonic() - self._last_activity < self.hold_secs
+        if not busy:
+            mode = IDLE
+        elif hot:
+            mode = THROTTLED
+        elif self.mode == HIGH_RES or (self.high_res and self._misses >= self.miss_limit):
+            mode = HIGH_RES
+        else:
+            mode = ACTIVE
+        if mode != self.mode:
+            self._switch(mode, temperature, load)
+
+    def _switch(self, mode, temperature, load):
+        logging.debug("Camera %s capture mode %s -> %s (temp=%s, load=%s)",
+                      self.name, self.mode, mode, temperature, load)
+        self.mode = mode
+        self.changes += 1
+        self._misses = 0
+        MODE_CHANGES.labels(self.name, mode).inc()
+        self._want_res = self.high_res if mode == HIGH_RES else self.base_res
+        if self.gate is not None and self._keepalive is not None:
+            # Blind keep-alive decodes are the first thing to go when the SoC is hot
+            self.gate.keepalive_every = 1 << 30 if mode == THROTTLED else self._keepalive
+
+    def before_read(self):
+        """Apply a pending resolution change; must run on the thread that reads the camera."""
+        if self._want_res == self.resolution:
+            return
+        width, height = self._want_res
+        try:
+            import cv2
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        except Exception as e:
+            logging.debug("Camera %s cannot switch to %dx%d: %s", self.name, width, height, e)
+        self.resolution = self._want_res
+
+    def delay(self):
+        """Seconds to wait before the next read to keep to the mode's frame rate."""
+        now = time.monotonic()
+        fps = self.target_fps
+        wait = 0.0
+        if fps > 0:
+            wait = max(0.0, self._last_read + 1.0 / fps - now)
+        self._last_read = now + wait
+        return wait
@@ -0,0 +1,312 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.sync import TokenBucket
+from app.system import get_machine_id
+from app.server import API_LATENCY, encode_body, get_client
+from app.journal import JournalUploader, step
+from app.detector import decode_roi
+
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+
+class AsyncApiClient:
+    """aiohttp counterpart of app.server.ApiClient: one pooled keep-alive session."""
+
+    def __init__(self, api_url, auth_token, connect_timeout=3.05, read_timeout=5.0, pool_size=8):
+        if aiohttp is None:
+            raise RuntimeError("The async runtime needs aiohttp: pip install aiohttp")
+        self.api_url = api_url.rstrip('/')
+        self.auth_token = auth_token
+        self.available = None
+        self.features = None
+        self._timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._pool_size = pool_size
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self._timeout, headers={
+            'Authorization': f'Bearer {self.auth_token}',
+            'Content-Type': 'application/json',
+        })
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def request(self, endpoint, data, headers=None, compress=False):
+        """POST data to an endpoint; returns the decoded JSON or {"error": ...} (see ApiClient.request)."""
+        t0 = time.perf_counter()
+        status = None
+        body, extra = encode_body(data, compress)
+        if extra:
+            headers = dict(headers or {}, **extra)
+        try:
+            async with self.session.post(f"{self.api_url}/{endpoint}", data=body, headers=headers) as resp:
+                status = str(resp.status)
+                API_LATENCY.labels(endpoint, status).observe(time.perf_counter() - t0)
+                resp.raise_for_status()
+                body = await resp.json(content_type=None)
+            logging.info("Request successful: %s", body)
+            self.available = True
+            return body
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if status is None:
+                status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                API_LATENCY.labels(endpoint, status).observe(time.perf_counter() - t0)
+            logging.error("Request failed.")
+            logging.error(f"Reason: {str(e) or type(e).__name__}")
+            if isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+                self.available = False
+            if status is not None and status.isdigit():
+                return {"error": str(e) or type(e).__name__, "status_code": int(status)}
+            return {"error": str(e) or type(e).__name__}
+
+    async def test(self):
+        body = await self.request("test", {'name': 'RPI-Verifier', 'auth_token': self.auth_token})
+        if isinstance(body, dict) and isinstance(body.get("features"), list):
+            self.features = set(body["features"])
+        self.available = bool(isinstance(body, dict) and body.get("status") and not body.get("error"))
+        return self.available
+
+    async def is_active(self):
+        return await self.request("is_active", {'machine_id': get_machine_id()})
+
+
+class AsyncVerifier:
+    """Single event-loop runtime for the verifier.
+
+    Frames are read in an executor, decoding runs in a thread pool (OpenCV and
+    zbar release the GIL), and sync, journal upload and heartbeat are cooperative
+    tasks; audio stays on the feedback service's thread. Scans are micro-batched
+    like DataSync does and up to `max_inflight` sync requests overlap on one
+    loop. The detector supplies the camera, decoders, crypto, caches and journal,
+    and the same scan steps and sync exchanges the threaded pipeline runs
+    (CLIQRCodeDetector.scan, DataSync.exchange); only their transport is here.
+    """
+
+    def __init__(self, detector, api_url, auth_token, max_inflight=8, heartbeat_secs=60.0,
+                 rate=None, burst=None, max_batch=None):
+        self.detector = detector
+        self.api_url = api_url
+        self.auth_token = auth_token
+        self.max_inflight = max_inflight
+        self.heartbeat_secs = heartbeat_secs
+        # Batch size and window follow the detector's DataSync (SYNC_BATCH_SIZE, SYNC_BATCH_WINDOW_MS)
+        self.max_batch = max_batch or detector.sync.max_batch
+        self._bucket = TokenBucket(rate if rate is not None else float(os.getenv("SYNC_RATE", "0.5")),
+                                   burst if burst is not None else float(os.getenv("SYNC_BURST", "2")))
+        self._decode_pool = ThreadPoolExecutor(max_workers=detector.decode_workers,
+                                               thread_name_prefix="aio-decode")
+        self._capture_pool = ThreadPoolExecutor(max_workers=len(detector.sources),
+                                                thread_name_prefix="aio-capture")
+        self._local = threading.local()
+        # The detector gets no API credentials in this mode, so its DataSync starts no uploader;
+        # the journal backlog is drained by this one from the loop instead, never by its thread
+        self.uploader = None
+        if detector.journal is not None:
+            self.uploader = JournalUploader(detector.journal, api_url, auth_token,
+                                            endpoint=detector.sync.bulk_endpoint, sync=detector.sync)
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except KeyboardInterrupt:
+            logging.info("QR scanner terminated by user.")
+        finally:
+            self._decode_pool.shutdown(wait=False)
+            self._capture_pool.shutdown(wait=False)
+            self.detector.release_resources()
+
+    async def _main(self):
+        det = self.detector
+        self._sync_queue = asyncio.Queue()
+        # Decodes in flight across all cameras, capped at the pool size
+        self._decoding = set()
+        # Sync requests in flight; the loop only keeps weak references to tasks
+        self._sending = set()
+        self._inflight = asyncio.Semaphore(self.max_inflight)
+        logging.info("QR scanner active (async runtime). Press Ctrl+C to terminate.")
+        async with AsyncApiClient(self.api_url, self.auth_token,
+                                  connect_timeout=float(os.getenv("API_CONNECT_TIMEOUT", "3.05")),
+                                  read_timeout=float(os.getenv("API_READ_TIMEOUT", "5.0"))) as client:
+            self.client = client
+            # Features the server listed when registration called /test on the sync client
+            client.features = get_client(self.api_url, self.auth_token).features
+            # Feedback keeps its own thread: notify() never blocks the loop
+            tasks = [asyncio.create_task(self._heartbeat()),
+                     asyncio.create_task(self._sync_loop())]
+            # One capture task per camera, each with its own single-thread reader
+            tasks += [asyncio.create_task(self._capture_loop(idx)) for idx in range(len(det.sources))]
+            if self.uploader is not None:
+                tasks.append(asyncio.create_task(self._upload_loop(self.uploader)))
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for t in tasks:
+                    t.cancel()
+
+    def _decode(self, frame, roi):
+        # One decoder per pool thread
+        decoder = getattr(self._local, "decoder", None)
+        if decoder is None:
+            decoder = self._local.decoder = self.detector._decoder_factory()
+        return decode_roi(decoder, frame, roi)
+
+    @staticmethod
+    def _read(capture, controller):
+        controller.before_read()
+        return capture.read()
+
+    async def _capture_loop(self, idx=0):
+        loop = asyncio.get_running_loop()
+        det = self.detector
+        capture, gate, controller = det.captures[idx], det.gates[idx], det.controllers[idx]
+        decoding = self._decoding
+        while True:
+            if controller is not None:
+                delay = controller.delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Resolution switches must happen on the thread that reads the camera
+                ok, ref = await loop.run_in_executor(self._capture_pool, self._read, capture, controller)
+            else:
+                ok, ref = await loop.run_in_executor(self._capture_pool, capture.read)
+            if not ok:
+                await asyncio.sleep(0.05)
+                continue
+            if ref is None:
+                continue
+            roi = None
+            if gate is not None:
+                accept, roi = gate.check(ref.image)
+                if controller is not None:
+                    controller.note_gate(accept, gate.last_reason)
+                if not accept:
+                    ref.release()
+                    continue
+            # Never queue more decodes than there are workers; newer frames win
+            if len(decoding) >= det.decode_workers:
+                ref.release()
+                continue
+            task = asyncio.create_task(self._decode_and_verify(idx, ref, roi))
+            decoding.add(task)
+            task.add_done_callback(decoding.discard)
+
+    async def _decode_and_verify(self, idx, ref, roi):
+        loop = asyncio.get_running_loop()
+        det = self.detector
+        det._age_stats.record(ref.age)
+        t0 = time.perf_counter()
+        try:
+            data, points = await loop.run_in_executor(self._decode_pool, self._decode, ref.image, roi)
+        finally:
+            shape = ref.image.shape
+            ref.release()
+        det._decode_stats.record(time.perf_counter() - t0)
+        det.note_decoded(idx, roi, shape, data, points)
+        if not data:
+            return
+        # The detector's own scan steps; decrypting and the journal insert (SQLite) stay off the loop
+        steps = det.scan(data, idx)
+        request, _ = await asyncio.to_thread(step, steps)
+        if request is None:
+            return
+        fut = loop.create_future()
+        await self._sync_queue.put(request + (fut,))
+        step(steps, await fut)
+
+    async def _sync_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._sync_queue.get()]
+            # Give a burst a moment to gather so it goes out as one request
+            deadline = loop.time() + self.detector.sync.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._sync_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            delay = self._bucket.wait_time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._bucket.take()
+            while not self._sync_queue.empty() and len(batch) < self.max_batch:
+                batch.append(self._sync_queue.get_nowait())
+            await self._inflight.acquire()
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sent)
+
+    def _sent(self, task):
+        self._sending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Sync task failed", exc_info=task.exception())
+
+    async def _send(self, batch):
+        sync = self.detector.sync
+        try:
+            try:
+                results = await self._exchange(sync, batch)
+            finally:
+                self._inflight.release()
+            keys = sync.settle(batch, results)
+            if keys and sync.journal is not None:
+                await asyncio.to_thread(sync.journal.ack, keys)
+        except Exception:
+            # As in DataSync: no scan may be left waiting on a failed batch; the journal still holds them
+            logging.exception("Sync of %d scan(s) failed", len(batch))
+            for *_, fut in batch:
+                if not fut.done():
+                    fut.set_result(None)
+            return
+        sync.resolve(batch, results)
+
+    async def _exchange(self, sync, batch):
+        # DataSync decides what to send and what the replies mean; only the transport is async here
+        steps = sync.exchange(batch, self.client.features)
+        request, results = step(steps)
+        while request is not None:
+            endpoint, body, headers, compress = request
+            resp = await self.client.request(endpoint, body, headers=headers, compress=compress)
+            request, results = step(steps, resp)
+        return results
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_secs)
+            was = self.client.available
+            if await self.client.test() != was:
+                logging.info("API availability changed: %s", "up" if self.client.available else "down")
+
+    async def _upload_loop(self, uploader):
+        """Drain the journal backlog through `uploader` from the loop; its thread is never started."""
+        while True:
+            try:
+                drained = await self._drain(uploader)
+                await asyncio.to_thread(uploader.maybe_prune)
+            except sqlite3.Error as e:
+                logging.error("Scan journal error: %s", str(e))
+                drained = False
+            await asyncio.sleep(uploader.delay_after(drained))
+
+    async def _drain(self, uploader):
+        # The generator touches SQLite between requests, so each step runs in a worker thread
+        steps = uploader.drain(self.client.features)
+        request, result = await asyncio.to_thread(step, steps)
+        while request is not None:
+            endpoint, body, headers, compress = request
+            resp = await self.client.request(endpoint, body, headers=headers, compress=compress)
+            request, result = await asyncio.to_thread(step, steps, resp)
+        return result
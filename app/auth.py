@@ -1,26 +1,144 @@
 import os
 import json
+import stat
+import time
 import logging
-from app.system import get_machine_id, get_public_ip
+import tempfile
+import threading
+from app.system import get_machine_id, get_public_ip, public_ip_future
 from app.server import test_api_availability, send_request
 
+# Shortest wait between background IP lookups, however small PUBLIC_IP_TTL is
+MIN_IP_REFRESH_SECS = 60.0
 
-# Register the device
-def register_device(api_url, auth_token):
-    if not test_api_availability(api_url, auth_token):
-        exit(1)
+
+class RegistrationState:
+    """Registration config read from disk once and then kept in memory.
+
+    Saves write a temporary file next to the config and rename it over the
+    original, so a power cut mid-write never leaves a truncated config. The
+    public IP is cached with the time it was looked up (`ip_checked_at`).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded = False
+
+    def get(self):
+        """A copy of the state, or None if the file is missing, empty or invalid."""
+        with self._lock:
+            if not self._loaded:
+                self._data = _read_config(self.path)
+                self._loaded = True
+            return dict(self._data) if self._data is not None else None
+
+    def reload(self):
+        """Re-read the file on the next access (after it was edited by hand)."""
+        with self._lock:
+            self._loaded = False
+        return self.get()
+
+    @property
+    def registered(self):
+        state = self.get()
+        return state is not None and state.get('registered', False)
+
+    def ip_stale(self, ttl):
+        state = self.get() or {}
+        return not state.get('ip_address') or time.time() - state.get('ip_checked_at', 0) > ttl
+
+    def save(self, state):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".config-", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            mode = stat.S_IMODE(os.stat(self.path).st_mode) if os.path.exists(self.path) else 0o644
+            os.chmod(tmp, mode)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        with self._lock:
+            self._data = dict(state)
+            self._loaded = True
+
+    def update(self, **fields):
+        state = self.get() or {}
+        state.update(fields)
+        self.save(state)
+        return state
+
+
+def _read_config(config):
+    if os.path.exists(config):
+        try:
+            # Check if the file is not empty
+            if os.path.getsize(config) > 0:
+                with open(config, 'r') as f:
+                    return json.load(f)
+            else:
+                logging.warning("Configuration file is empty.")
+                return None
+        except json.JSONDecodeError as e:
+            logging.error("Configuration file parsing failed: %s", str(e))
+            return None
+    logging.warning("Configuration file not found or path not configured.")
+    return None
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+# Return the shared in-memory state for a config file (CONFIG_PATH by default), or None without one
+def registration_state(config_path=None):
+    config = config_path or os.environ.get('CONFIG_PATH')
+    if not config:
+        return None
+    key = os.path.abspath(config)
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = RegistrationState(key)
+        return state
+
+
+# Register the device; config_path, machine_id and ip_address default to this machine's.
+# With `background`, an already registered device does not wait for the API check or the
+# public IP refresh: both run on a daemon thread and startup goes on with the cached state.
+# That thread then keeps refreshing the public IP every PUBLIC_IP_TTL while the process runs.
+def register_device(api_url, auth_token, config_path=None, machine_id=None, ip_address=None,
+                    background=False):
+    state = registration_state(config_path)
+    ip_ttl = float(os.getenv("PUBLIC_IP_TTL", "86400"))
 
     # Check if the device is already registered
-    if is_device_registered():
+    if state is not None and state.registered:
         logging.info("Device registration verified.")
         logging.info("To re-register, delete the configuration file and restart the application.")
+        if background:
+            threading.Thread(target=_check_registered, args=(api_url, auth_token, state, ip_ttl),
+                             name="registration-check", daemon=True).start()
+            return True
+        if not test_api_availability(api_url, auth_token):
+            exit(1)
+        refresh_public_ip(api_url, auth_token, state, ip_ttl)
         return True
 
-        logging.info("Initiating device registration.")
+    logging.info("Initiating device registration.")
+    # The public IP lookup races its providers while /test is in flight
+    ip_probe = public_ip_future() if ip_address is None else None
+    if not test_api_availability(api_url, auth_token):
+        exit(1)
 
     # Gather device details
-    ip_address = get_public_ip()
-    machine_id = get_machine_id()
+    ip_address = ip_address or ip_probe.result()
+    machine_id = machine_id or get_machine_id()
 
     data = {
         'machine_id': machine_id,
@@ -28,43 +146,82 @@ def register_device(api_url, auth_token):
     }
 
     # Use send_request to register the device
-    if send_request(api_url, auth_token, "register", data):
-        save_registration_state(
-            {"registered": True, "machine_id": machine_id, "ip_address": ip_address})
+    if _accepted(send_request(api_url, auth_token, "register", data)):
+        save_registration_state({"registered": True, "machine_id": machine_id, "ip_address": ip_address,
+                                 "ip_checked_at": time.time()}, config_path)
         logging.info("Device registration completed successfully.")
+        if background and state is not None:
+            threading.Thread(target=_keep_ip_fresh, args=(api_url, auth_token, state, ip_ttl),
+                             name="public-ip-refresh", daemon=True).start()
         return True
     else:
         logging.error("Device registration unsuccessful.")
         return False
 
 
-# Load the registration state from a file
-def load_registration_state():
-    config = os.environ.get('CONFIG_PATH')
-    if config and os.path.exists(config):
+def _accepted(resp):
+    # send_request reports failures as {"error": ...} rather than a falsy value
+    return bool(resp) and not (isinstance(resp, dict) and resp.get("error"))
+
+
+def _check_registered(api_url, auth_token, state, ip_ttl):
+    if test_api_availability(api_url, auth_token):
+        refresh_public_ip(api_url, auth_token, state, ip_ttl)
+    else:
+        logging.warning("API unreachable at startup; scans are journaled until it answers.")
+    _keep_ip_fresh(api_url, auth_token, state, ip_ttl)
+
+
+def _keep_ip_fresh(api_url, auth_token, state, ip_ttl, retry_secs=300.0):
+    # Look the IP up again whenever the cached one reaches its TTL; a failed lookup retries sooner.
+    # A TTL of 0 or less disables the refresh rather than polling the IP providers in a tight loop.
+    if ip_ttl <= 0:
+        logging.info("PUBLIC_IP_TTL is %s; background public IP refresh disabled.", ip_ttl)
+        return
+    while True:
+        checked_at = (state.get() or {}).get('ip_checked_at', 0)
+        time.sleep(max(checked_at + ip_ttl - time.time(), min(ip_ttl, retry_secs), MIN_IP_REFRESH_SECS))
         try:
-            # Check if the file is not empty
-            if os.path.getsize(config) > 0:
-                with open(config, 'r') as f:
-                    return json.load(f)
-            else:
-                logging.warning("Configuration file is empty.")
-                return None
-        except json.JSONDecodeError as e:
-            logging.error("Configuration file parsing failed: %s", str(e))
-            return None
-    logging.warning("Configuration file not found or path not configured.")
-    return None
+            refresh_public_ip(api_url, auth_token, state, ip_ttl)
+        except Exception as e:
+            logging.warning("Public IP refresh failed: %s", str(e))
+
+
+# Look the public IP up again once the cached one is older than `ttl`; a changed address is re-registered
+def refresh_public_ip(api_url, auth_token, state, ttl):
+    if not state.ip_stale(ttl):
+        return
+    current = state.get() or {}
+    ip_address = get_public_ip()
+    if ip_address is None:
+        return
+    if ip_address != current.get('ip_address'):
+        logging.info("Public IP changed from %s to %s; updating registration.",
+                     current.get('ip_address'), ip_address)
+        resp = send_request(api_url, auth_token, "register",
+                            {'machine_id': current.get('machine_id') or get_machine_id(),
+                             'ip_address': ip_address})
+        if not _accepted(resp):
+            return
+    state.update(ip_address=ip_address, ip_checked_at=time.time())
+
+
+# Load the registration state (read from the file once, then from memory)
+def load_registration_state(config_path=None):
+    state = registration_state(config_path)
+    if state is None:
+        logging.warning("Configuration file not found or path not configured.")
+        return None
+    return state.get()
 
 # Save the registration state to a file
-def save_registration_state(state):
-    config = os.environ.get('CONFIG_PATH')
-    if config:
-        with open(config, 'w') as f:
-            json.dump(state, f)
+def save_registration_state(state, config_path=None):
+    registration = registration_state(config_path)
+    if registration is not None:
+        registration.save(state)
 
 
 # Check if the device is already registered by reading the config
-def is_device_registered():
-    state = load_registration_state()
-    return state is not None and state.get('registered', False)
+def is_device_registered(config_path=None):
+    state = registration_state(config_path)
+    return state is not None and state.registered
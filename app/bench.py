@@ -0,0 +1,366 @@
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import shutil
+import platform
+import resource
+import tempfile
+import logging
+import threading
+import numpy as np
+import cv2
+from app.camera import CameraSource
+from app.crypto import PassCrypto
+from app.payload import encode_compact
+from app.decoders import sample_frames
+from app.stub import StubApiServer
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".pgm", ".ppm")
+
+
+class ReplayCapture:
+    """In-memory frame source with the subset of the cv2.VideoCapture API the detector uses.
+
+    Frames are played `loops` times, then grab() returns False like a finished
+    video file.
+    """
+
+    def __init__(self, frames, loops=1):
+        self.frames = frames
+        self.loops = max(1, loops)
+        self._pos = -1
+        self._total = len(frames) * self.loops
+        self._open = bool(frames)
+
+    def isOpened(self):
+        return self._open
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if not self.frames:
+            return 0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frames[0].shape[1]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frames[0].shape[0]
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self._total
+        return 0
+
+    def grab(self):
+        if not self._open or self._pos + 1 >= self._total:
+            return False
+        self._pos += 1
+        return True
+
+    def retrieve(self, image=None):
+        frame = self.frames[self._pos % len(self.frames)]
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            # Write into the caller's buffer like a camera backend does
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        self._open = False
+
+
+def load_frame_dir(path):
+    """Load every image in a directory, in file-name order."""
+    files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTS))
+    frames = []
+    for f in files:
+        image = cv2.imread(f, cv2.IMREAD_COLOR)
+        if image is None:
+            logging.warning("Skipping unreadable frame %s", f)
+            continue
+        frames.append(image)
+    return frames
+
+
+def synthetic_frames(crypto, passes=5, compact=False):
+    """Gate-like frames showing `passes` freshly encrypted passes, plus blank frames.
+
+    With `compact` the passes use the binary layout from app.payload instead of JSON.
+    Returns (frames, pass_ids).
+    """
+    frames, ids = [], []
+    for i in range(passes):
+        pass_id = uuid.uuid4().hex[:12]
+        ids.append(pass_id)
+        # Kept short so the encrypted code stays at a QR version every backend reads reliably
+        if compact:
+            plaintext = encode_compact(pass_id, expires=time.time() + 86400)
+        else:
+            plaintext = json.dumps({"id": pass_id, "sid": f"b{i:04d}"}, separators=(",", ":"))
+        frames.extend(image for image, _ in sample_frames(crypto.encrypt(plaintext)))
+    return frames, ids
+
+
+def open_inputs(inputs, loops=1, passes=5, crypto=None, compact=False):
+    """CameraSources for the given video files and frame directories (synthetic if none).
+
+    Returns (sources, pass_ids); pass ids are only known for synthetic input.
+    """
+    sources, ids = [], []
+    for path in inputs:
+        if os.path.isdir(path):
+            frames = load_frame_dir(path)
+            if not frames:
+                raise RuntimeError(f"No readable frames in {path}")
+            sources.append(CameraSource(ReplayCapture(frames, loops), name=path))
+        elif os.path.isfile(path):
+            sources.append(CameraSource(path, name=path))
+        else:
+            raise RuntimeError(f"Bench input not found: {path}")
+    if not sources:
+        frames, ids = synthetic_frames(crypto, passes, compact)
+        sources.append(CameraSource(ReplayCapture(frames, loops), name="synthetic"))
+    return sources, ids
+
+
+def percentiles(samples):
+    """p50/p95/p99/max in milliseconds, nearest-rank."""
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def at(p):
+        return round(ordered[min(n - 1, max(0, int(np.ceil(p / 100 * n)) - 1))] * 1000, 3)
+
+    return {"count": n, "p50_ms": at(50), "p95_ms": at(95), "p99_ms": at(99),
+            "max_ms": round(ordered[-1] * 1000, 3)}
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def platform_info():
+    info = {"machine": platform.machine(), "python": platform.python_version(),
+            "opencv": cv2.__version__, "cpus": os.cpu_count(), "system": platform.system()}
+    try:
+        # Raspberry Pi and most SBCs expose the board name here
+        with open("/proc/device-tree/model", "rb") as f:
+            info["model"] = f.read().rstrip(b"\0").decode(errors="replace")
+    except OSError:
+        pass
+    return info
+
+
+class BenchRunner:
+    """Replays recorded frames through the detector's scan path and measures every stage.
+
+    Frames are processed one at a time in the calling thread (read, gate,
+    decode, decrypt and normalize) so per-stage latencies are not skewed by
+    pipeline drops. Decode results go through the detector's own
+    _handle_decoded and scan steps, with its decoded_sink and scan_sink
+    pointed at the bench; syncs go through its DataSync against a local
+    StubApiServer and are timed until the verdict arrives.
+    """
+
+    def __init__(self, inputs=(), decoder="auto", gate=True, loops=1, passes=5, dedup=True,
+                 sync_rate=0, stub_latency=0.0, secrets=None, passlist=False, compact=False,
+                 profile=None, profile_output="profile.folded"):
+        self.inputs = list(inputs)
+        self.decoder = decoder
+        self.gate = gate
+        self.loops = loops
+        self.passes = passes
+        self.dedup = dedup
+        self.sync_rate = sync_rate
+        self.stub_latency = stub_latency
+        self.secrets = secrets
+        self.passlist = passlist
+        self.compact = compact
+        # Seconds of sampling over the replay loop (0 for all of it); None disables the profiler
+        self.profile = profile
+        self.profile_output = profile_output
+
+    def run(self):
+        # Imported here so the module stays importable for tooling without pygame
+        from app.detector import CLIQRCodeDetector
+        from app.cache import DedupWindow
+
+        secrets = self.secrets or os.getenv("PASS_SECRETS", "passito").split(",")
+        sources, pass_ids = open_inputs(self.inputs, self.loops, self.passes, PassCrypto(secrets),
+                                       self.compact)
+        stub = StubApiServer(latency=self.stub_latency).start()
+        workdir = tempfile.mkdtemp(prefix="passito-bench-")
+        index = None
+        if self.passlist:
+            from app.passlist import PassIndex, PassListSync
+            # Synthetic passes are all listed; recorded ones fall through to the live sync
+            stub.passes = pass_ids
+            index = PassIndex(os.path.join(workdir, "passes.idx"))
+            PassListSync(index, stub.url, "bench").refresh_once()
+        detector = CLIQRCodeDetector(api_url=stub.url, auth_token="bench", decode_workers=1,
+                                     journal_path=os.path.join(workdir, "scans.db"), gate=self.gate,
+                                     decoder=self.decoder, secrets=secrets, sources=sources,
+                                     passlist=index, scan_log_dir=os.path.join(workdir, "scanlog"))
+        if not self.dedup:
+            detector.dedup = DedupWindow(ttl=0)
+            detector.verdicts.ttl = 0
+        detector.sync.set_rate(self.sync_rate)
+        try:
+            return self._measure(detector, stub)
+        finally:
+            detector.release_resources()
+            stub.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _measure(self, detector, stub):
+        from app.detector import decode_roi
+
+        decoder = detector._decoder_factory()
+        stages = {name: [] for name in ("read", "gate", "decode", "verify", "sync", "total")}
+        counts = {"frames": 0, "gated_out": 0, "decoded": 0, "verified": 0, "dropped": 0,
+                  "cached": 0, "offline": 0, "synced": 0,
+                  "sync_failed": 0}
+        futures = []
+        # Verdicts arrive on the sync thread; the replay waits on this for the last of them
+        synced = threading.Condition()
+        outcomes = {"cache": "cached", "passlist": "offline", "dropped": "dropped"}
+
+        def _on_scan(idx, source, verdict, seconds):
+            if source == "server":
+                with synced:
+                    counts["sync_failed" if verdict is None else "synced"] += 1
+            else:
+                counts[outcomes[source]] += 1
+
+        def _on_decoded(item):
+            t0 = time.perf_counter()
+            fut = detector._verify(*item)
+            t1 = time.perf_counter()
+            stages["verify"].append(t1 - t0)
+            if fut is None:
+                return
+
+            def _done(fut):
+                # Runs after the detector's own callback has logged the verdict
+                with synced:
+                    stages["sync"].append(time.perf_counter() - t1)
+                    synced.notify_all()
+
+            with synced:
+                futures.append(fut)
+            fut.add_done_callback(_done)
+
+        detector.decoded_sink = _on_decoded
+        detector.scan_sink = _on_scan
+
+        sampler = None
+        if self.profile is not None:
+            from app.profiler import SamplingProfiler
+            sampler = SamplingProfiler(duration=self.profile, output=self.profile_output, report=False).start()
+        rss_start = _rss_kb()
+        cpu0 = os.times()
+        wall0 = time.perf_counter()
+        for idx, capture in enumerate(detector.captures):
+            gate = detector.gates[idx]
+            while True:
+                t0 = time.perf_counter()
+                ok, ref = capture.read()
+                if not ok:
+                    break
+                t1 = time.perf_counter()
+                stages["read"].append(t1 - t0)
+                counts["frames"] += 1
+                if ref is None:
+                    continue
+                roi = None
+                if gate is not None:
+                    accept, roi = gate.check(ref.image)
+                    t2 = time.perf_counter()
+                    stages["gate"].append(t2 - t1)
+                    t1 = t2
+                    if not accept:
+                        counts["gated_out"] += 1
+                        ref.release()
+                        continue
+                data, points = decode_roi(decoder, ref.image, roi)
+                stages["decode"].append(time.perf_counter() - t1)
+                if data:
+                    counts["decoded"] += 1
+                # Same counters, ROI feedback and scan steps as the live pipeline
+                detector._handle_decoded(idx, roi, ref.image.shape, data, points)
+                ref.release()
+                stages["total"].append(time.perf_counter() - t0)
+        replay_secs = time.perf_counter() - wall0
+        with synced:
+            synced.wait_for(lambda: len(stages["sync"]) >= len(futures), timeout=30)
+        wall = time.perf_counter() - wall0
+        profile = sampler.stop() if sampler is not None else None
+        cpu1 = os.times()
+        cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+
+        frames = counts["frames"]
+        counts["verified"] = counts["decoded"] - counts["dropped"]
+        counts["duplicates"] = detector.dedup.hits
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "platform": platform_info(),
+            "config": {"inputs": self.inputs or ["synthetic"], "decoder": self.decoder,
+                       "gate": self.gate, "loops": self.loops, "dedup": self.dedup,
+                       "sync_rate": self.sync_rate, "stub_latency": self.stub_latency,
+                       "passlist": self.passlist, "compact": self.compact},
+            "frames": frames,
+            "counts": counts,
+            "fps": round(frames / replay_secs, 2) if replay_secs else None,
+            "hit_rate": round(counts["decoded"] / frames, 4) if frames else None,
+            "gate_reject_ratio": round(counts["gated_out"] / frames, 4) if frames else None,
+            "stages": {name: percentiles(samples) for name, samples in stages.items()},
+            "wall_secs": round(wall, 3),
+            "cpu_secs": round(cpu, 3),
+            "cpu_percent": round(cpu / wall * 100, 1) if wall else None,
+            "rss_kb": {"start": rss_start, "end": _rss_kb(),
+                       "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss},
+            "stub_requests": dict(stub.counts),
+            "profile": profile,
+        }
+
+
+def format_report(report):
+    """Human-readable summary of a bench report."""
+    lines = [f"Frames: {report['frames']}  fps: {report['fps']}  hit rate: {report['hit_rate']}  "
+             f"gate rejected: {report['gate_reject_ratio']}",
+             f"CPU: {report['cpu_secs']} s ({report['cpu_percent']}%)  "
+             f"RSS: {report['rss_kb']['end']} kB (peak {report['rss_kb']['peak']} kB)",
+             f"{'stage':<8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for name, s in report["stages"].items():
+        if s["count"]:
+            lines.append(f"{name:<8} {s['count']:>6} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} "
+                         f"{s['p99_ms']:>9.3f} {s['max_ms']:>9.3f}")
+    lines.append(f"Counts: {report['counts']}")
+    if report.get("profile"):
+        from app.profiler import format_summary
+        lines.append(format_summary(report["profile"]))
+    return "\n".join(lines)
+
+
+def write_report(report, path):
+    if path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
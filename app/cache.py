@@ -0,0 +1,151 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def payload_key(payload):
+    """Cache/dedup key for a normalized pass payload."""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+class DedupWindow:
+    """Time-ordered set where every key expires `ttl` seconds after it was first added.
+
+    Hits do not extend the window, so a pass held in front of the camera is
+    let through again once every `ttl` seconds.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def seen(self, key, now=None):
+        """Return True if key is inside the window; otherwise add it and return False."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                self.hits += 1
+                return True
+            self._entries[key] = now + self.ttl
+            return False
+
+    def _expire(self, now):
+        # Entries are in insertion order and share one ttl, so expired ones sit at the front
+        while self._entries:
+            key, expires = next(iter(self._entries.items()))
+            if expires > now:
+                break
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class VerdictCache:
+    """LRU cache of the server's last verdict per pass, with TTL and pass-expiry bounds.
+
+    Repeat scans of the same pass are answered locally until the entry expires,
+    is evicted, or the server invalidates it. Keys are local digests the server
+    cannot compute, so entries are also indexed by pass id, which both sides know.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (verdict, expires, pass_id)
+        self._entries = OrderedDict()
+        # pass_id -> keys cached for it (one per payload variant and camera action)
+        self._by_pass = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            verdict, expires, _ = entry
+            if expires <= now:
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key, verdict, pass_expiry=None, now=None, pass_id=None):
+        """Store a verdict; it is kept for `ttl` seconds or until the pass expires, if sooner.
+
+        `pass_id` lets the server invalidate the entry by pass (see apply_server_invalidation).
+        """
+        now = time.time() if now is None else now
+        expires = now + self.ttl
+        if pass_expiry is not None:
+            try:
+                expires = min(expires, float(pass_expiry))
+            except (TypeError, ValueError):
+                pass
+        if pass_id is not None:
+            pass_id = str(pass_id)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (verdict, expires, pass_id)
+            if pass_id is not None:
+                self._by_pass.setdefault(pass_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[2] is None:
+            return
+        keys = self._by_pass.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_pass[entry[2]]
+
+    def invalidate(self, keys=None):
+        """Drop the given keys, or everything when keys is None."""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                self._by_pass.clear()
+                return
+            for key in keys:
+                self._drop(key)
+
+    def invalidate_passes(self, pass_ids):
+        """Drop every entry cached for the given pass ids."""
+        with self._lock:
+            for pass_id in pass_ids:
+                for key in list(self._by_pass.get(str(pass_id), ())):
+                    self._drop(key)
+
+    def apply_server_invalidation(self, response):
+        """Honor an 'invalidate' field in a server response: '*' or a list of pass ids."""
+        if not isinstance(response, dict):
+            return
+        targets = response.get("invalidate")
+        if targets == "*":
+            self.invalidate()
+        elif isinstance(targets, list):
+            self.invalidate_passes(targets)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
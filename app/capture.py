@@ -0,0 +1,154 @@
+import time
+import threading
+import numpy as np
+import cv2
+
+
+class FrameRef:
+    """A leased frame in a FrameRing; call release() once done with `image`."""
+
+    __slots__ = ("ring", "slot", "image", "ts", "seq")
+
+    def __init__(self, ring, slot, image, ts, seq):
+        self.ring = ring
+        self.slot = slot
+        self.image = image
+        self.ts = ts
+        self.seq = seq
+
+    @property
+    def age(self):
+        """Seconds since the frame was grabbed."""
+        return time.monotonic() - self.ts
+
+    def retain(self):
+        self.ring.retain(self.slot)
+        return self
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.release(self.slot)
+            self.ring = None
+
+
+class FrameRing:
+    """Fixed set of preallocated frame buffers with per-slot reference counts.
+
+    The capture thread writes into a slot nobody holds, so consumers can keep
+    using a frame while newer ones arrive and no per-frame array is allocated.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.buffers = [np.empty(self.shape, dtype) for _ in range(slots)]
+        self._refs = [0] * slots
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def writable(self):
+        """Return a free slot index, or None if every slot is still leased."""
+        with self._lock:
+            n = len(self.buffers)
+            for i in range(n):
+                slot = (self._next + i) % n
+                if self._refs[slot] == 0:
+                    self._next = (slot + 1) % n
+                    return slot
+            return None
+
+    def retain(self, slot):
+        with self._lock:
+            self._refs[slot] += 1
+
+    def release(self, slot):
+        with self._lock:
+            if self._refs[slot] > 0:
+                self._refs[slot] -= 1
+
+    def leased(self):
+        with self._lock:
+            return sum(1 for r in self._refs if r)
+
+
+class FrameCapture:
+    """Reads one camera into a FrameRing with grab()/retrieve() into existing buffers.
+
+    The camera's own queue is kept at one frame where the backend allows it, so
+    every read returns the newest frame. With `gray=True` the backend is asked
+    for unconverted frames and a single luma plane is kept when it delivers
+    YUYV; otherwise frames stay BGR. Counters: `captured`, `dropped` (grabbed
+    but never handed out because every slot was busy) and `copies` (the backend
+    could not write into our buffer, so a frame was copied in).
+    """
+
+    def __init__(self, cap, slots=6, gray=False):
+        self.cap = cap
+        self.slots = slots
+        self.gray = gray
+        self.ring = None
+        self.captured = 0
+        self.dropped = 0
+        self.copies = 0
+        self._seq = 0
+        try:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        except Exception:
+            pass
+        if gray:
+            try:
+                self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            except Exception:
+                pass
+
+    def _plane(self, image):
+        # Unconverted V4L2 YUYV arrives as HxWx2 with luma in channel 0
+        if self.gray and image.ndim == 3 and image.shape[2] == 2:
+            return image[:, :, 0]
+        return image
+
+    def read(self):
+        """Grab the newest frame.
+
+        Returns (ok, ref): ok is False when the camera failed to deliver a frame;
+        ref is a retained FrameRef, or None when the frame had to be dropped.
+        """
+        if not self.cap.grab():
+            return False, None
+        ts = time.monotonic()
+        slot = self.ring.writable() if self.ring is not None else None
+        if slot is None and self.ring is not None:
+            # Every buffer is still in use downstream; this frame is stale by the time one frees up
+            self.dropped += 1
+            return True, None
+
+        if self.ring is None:
+            ret, image = self.cap.retrieve()
+            if not ret or image is None or image.size == 0:
+                return False, None
+            self.ring = FrameRing(self.slots, image.shape, image.dtype)
+            slot = self.ring.writable()
+            self.ring.buffers[slot][...] = image
+        else:
+            buf = self.ring.buffers[slot]
+            ret, image = self.cap.retrieve(image=buf)
+            if not ret or image is None or image.size == 0:
+                return False, None
+            if image is not buf and getattr(image, "base", None) is not buf:
+                if image.shape != buf.shape:
+                    # Resolution or format changed; start a fresh ring
+                    self.ring = FrameRing(self.slots, image.shape, image.dtype)
+                    slot = self.ring.writable()
+                    buf = self.ring.buffers[slot]
+                buf[...] = image
+                self.copies += 1
+
+        self.captured += 1
+        self._seq += 1
+        ring = self.ring
+        ring.retain(slot)
+        return True, FrameRef(ring, slot, self._plane(ring.buffers[slot]), ts, self._seq)
+
+    def stats(self):
+        return {"captured": self.captured, "dropped": self.dropped, "copies": self.copies,
+                "leased": self.ring.leased() if self.ring is not None else 0}
@@ -0,0 +1,286 @@
+import os
+import json
+import stat
+import time
+import socket
+import inspect
+import logging
+import tempfile
+import threading
+import socketserver
+
+# Only the standard library at module level: thin CLI clients import this and
+# should not pay for requests, cv2 or Cryptodome just to ask the daemon a question.
+
+
+def _private_dir():
+    # Fallback without XDG_RUNTIME_DIR (system services, containers, cron): a per-user directory
+    # only its owner can enter, so no other local user can bind the socket path first
+    return os.path.join(tempfile.gettempdir(), f"passito-{os.geteuid()}")
+
+
+def default_socket_path():
+    """CONTROL_SOCKET, else passito-verifier.sock in XDG_RUNTIME_DIR or a private temp dir; '' disables."""
+    path = os.getenv("CONTROL_SOCKET")
+    if path is not None:
+        return path
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    return os.path.join(runtime_dir or _private_dir(), "passito-verifier.sock")
+
+
+def _check_private_dir(path, create=False):
+    """Make sure the fallback directory of `path` is ours alone; other paths are left to the admin."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory != _private_dir():
+        return
+    if create:
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{directory} is not a private directory of this user; not trusting it")
+
+
+class ControlUnavailable(Exception):
+    """No verifier is listening on the control socket."""
+
+
+class ControlError(Exception):
+    """The verifier answered, but with an error."""
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    # Idle keep-alive connections (kiosk pollers) are dropped after this long
+    timeout = 60
+
+    def handle(self):
+        while True:
+            try:
+                line = self.rfile.readline()
+            except (socket.timeout, OSError):
+                return
+            if not line:
+                return
+            reply = self.server.dispatch(line)
+            try:
+                self.wfile.write(json.dumps(reply, separators=(',', ':'), default=str).encode() + b"\n")
+                self.wfile.flush()
+            except OSError:
+                return
+
+
+class ControlServer(socketserver.ThreadingUnixStreamServer):
+    """Line-delimited JSON API of a running verifier on a Unix-domain socket.
+
+    Each request is one line, {"cmd": NAME, "args": {...}}, answered by one line,
+    {"ok": true, "result": ...} or {"ok": false, "error": "..."}; a connection
+    may carry any number of them. Commands are the names `handler` lists in
+    its COMMANDS. The socket is owner/group only from the moment it is bound
+    and is removed on stop.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, handler):
+        _check_private_dir(path, create=True)
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a verifier that did not shut down cleanly
+                os.unlink(path)
+            else:
+                raise OSError(f"another verifier is already listening on {path}")
+            finally:
+                probe.close()
+        # bind() creates the socket file; the umask keeps it 0660 without a window before a chmod
+        umask = os.umask(0o117)
+        try:
+            super().__init__(path, _ControlHandler)
+        finally:
+            os.umask(umask)
+        self.path = path
+        self.handler = handler
+        self._thread = None
+
+    def dispatch(self, line):
+        try:
+            request = json.loads(line)
+            name = request["cmd"]
+            args = request.get("args") or {}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return {"ok": False, "error": "malformed request"}
+        if not isinstance(args, dict):
+            return {"ok": False, "error": "malformed request"}
+        if name not in self.handler.COMMANDS:
+            return {"ok": False, "error": f"unknown command: {name}"}
+        command = getattr(self.handler, name)
+        try:
+            inspect.signature(command).bind(**args)
+        except TypeError as e:
+            return {"ok": False, "error": f"bad arguments for {name}: {e}"}
+        try:
+            return {"ok": True, "result": command(**args)}
+        except Exception as e:
+            logging.exception("Control command %s failed", name)
+            return {"ok": False, "error": str(e)}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="control-socket", daemon=True)
+        self._thread.start()
+        logging.info("Control socket listening at %s", self.path)
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# Ask the running verifier; raises ControlUnavailable if none is listening
+def control_call(command, path=None, timeout=5.0, **args):
+    path = default_socket_path() if path is None else path
+    if not path:
+        raise ControlUnavailable("control socket disabled")
+    try:
+        _check_private_dir(path)
+    except FileNotFoundError:
+        raise ControlUnavailable(f"no verifier listening on {path}")
+    except PermissionError as e:
+        # Never hand payloads to whoever managed to create the directory
+        raise ControlUnavailable(str(e))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        sock.close()
+        raise ControlUnavailable(f"no verifier listening on {path} ({e})")
+    with sock, sock.makefile("rwb") as f:
+        f.write(json.dumps({"cmd": command, "args": args}).encode() + b"\n")
+        f.flush()
+        line = f.readline()
+    if not line:
+        raise ControlError("verifier closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise ControlError(reply.get("error") or "unknown error")
+    return reply.get("result")
+
+
+class VerifierControl:
+    """Commands the control socket serves from a running verifier's warm state."""
+
+    COMMANDS = ("status", "stats", "metrics", "test_api", "is_active", "config", "decrypt", "flush",
+                "reload")
+
+    def __init__(self, detector, api_url, auth_token, config_path=None):
+        self.detector = detector
+        self.api_url = api_url
+        self.auth_token = auth_token
+        self.config_path = os.path.abspath(config_path or os.environ.get("CONFIG_PATH", "config.json"))
+        # Set to the async runtime when it owns the API client
+        self.runtime = None
+        self.started = time.time()
+
+    def _config(self, reload=False):
+        # The registration state shared with app.auth; it is only read from disk on reload
+        from app.auth import registration_state
+        state = registration_state(self.config_path)
+        return (state.reload() if reload else state.get()) or {}
+
+    def _client(self):
+        from app.server import get_client
+        return get_client(self.api_url, self.auth_token)
+
+    def status(self):
+        det = self.detector
+        config = self._config()
+        client = getattr(self.runtime, "client", None) or self._client()
+        cameras = []
+        for source, controller in zip(det.sources, det.controllers):
+            entry = dict(source.meta or {}, name=source.name)
+            if controller is not None:
+                entry.update(mode=controller.mode, target_fps=controller.target_fps,
+                             resolution="%dx%d" % controller.resolution)
+            cameras.append(entry)
+        passlist = None
+        if det.passlist is not None:
+            age = det.passlist.age
+            passlist = {"version": det.passlist.version, "count": det.passlist.count,
+                        "age_secs": round(age, 1) if age != float("inf") else None}
+        return {
+            "pid": os.getpid(),
+            "version": os.getenv("VERSION"),
+            "uptime_secs": round(time.time() - self.started, 1),
+            "runtime": "async" if self.runtime is not None else "thread",
+            "api": {"url": self.api_url, "available": client.available,
+                    "features": sorted(client.features) if client.features else []},
+            "registered": bool(config.get("registered")),
+            "machine_id": config.get("machine_id"),
+            "ip_address": config.get("ip_address"),
+            "cameras": cameras,
+            "queues": det.queue_depths(),
+            "journal_dead_letters": det.journal.dead_count() if det.journal is not None else 0,
+            "verdict_cache": det.verdicts.stats(),
+            "dedup_entries": len(det.dedup),
+            "passlist": passlist,
+        }
+
+    def stats(self):
+        from app.metrics import REGISTRY
+        return REGISTRY.snapshot()
+
+    def metrics(self):
+        """Prometheus text format."""
+        from app.metrics import REGISTRY
+        return REGISTRY.render()
+
+    def test_api(self):
+        return {"ok": self._client().test()}
+
+    def is_active(self):
+        return self._client().is_active(self._config().get("machine_id"))
+
+    def config(self):
+        return {"path": self.config_path, "state": self._config()}
+
+    def decrypt(self, data, secret=None):
+        """Decrypt with the verifier's active keys, or only with `secret` if given."""
+        from app.payload import describe
+        result = self.detector.crypto.decrypt(data, secret=secret or None, raw=True)
+        if not result.ok:
+            return {"ok": False, "error": result.error, "key_id": result.key_id}
+        try:
+            return {"ok": True, "plaintext": describe(result.plaintext), "key_id": result.key_id}
+        except ValueError as e:
+            return {"ok": False, "error": f"invalid payload: {e}", "key_id": result.key_id}
+
+    def flush(self):
+        """Drop every cached verdict and the dedup window."""
+        det = self.detector
+        flushed = {"verdicts": det.verdicts.stats()["entries"], "dedup": len(det.dedup)}
+        det.verdicts.invalidate()
+        det.dedup.clear()
+        logging.info("Caches flushed over the control socket: %s", flushed)
+        return flushed
+
+    def reload(self):
+        """Re-read .env, the registration config, PASS_SECRETS and the pass list file."""
+        from dotenv import load_dotenv
+        load_dotenv(override=True)
+        config = self._config(reload=True)
+        added, removed = self.detector.crypto.set_secrets(os.getenv("PASS_SECRETS", "passito").split(","))
+        if removed:
+            # Verdicts may have come from passes under a key that is no longer trusted
+            self.detector.verdicts.invalidate()
+        passlist = self.detector.passlist.reload() if self.detector.passlist is not None else None
+        logging.info("Configuration reloaded: keys added=%s removed=%s", added, removed)
+        return {"config": config, "keys_added": added, "keys_removed": removed,
+                "key_ids": self.detector.crypto.key_ids, "passlist_reloaded": passlist}
@@ -0,0 +1,140 @@
+import os
+import base64
+import hashlib
+import binascii
+import threading
+from collections import namedtuple
+from Cryptodome.Cipher import AES
+
+IV_LEN = 12
+TAG_LEN = 16
+
+# ok: bool, plaintext: str (bytes when decrypted raw) or None, key_id: id of the key that verified, error: reason on failure
+DecryptResult = namedtuple("DecryptResult", "ok plaintext key_id error")
+
+
+def derive_key(secret):
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def key_id_for(key):
+    """Short public identifier for a key: first 4 bytes of its SHA-256, hex encoded."""
+    return hashlib.sha256(key).hexdigest()[:8]
+
+
+class PassCrypto:
+    """AES-GCM pass decryption with keys derived once per shared secret.
+
+    Several secrets can be active at once for key rotation. A payload may be
+    prefixed with "<key_id>:" to select its key directly; unprefixed payloads
+    are tried against the most recently successful key first, then the others.
+    """
+
+    def __init__(self, secrets=("passito",)):
+        self._keys = {}
+        self._secret_ids = {}
+        self._order = []
+        self._lock = threading.Lock()
+        for secret in secrets:
+            self.add_secret(secret)
+
+    def add_secret(self, secret, key_id=None):
+        """Register a secret and return its key id; re-adding a known secret is a dict lookup."""
+        known = self._secret_ids.get(secret)
+        if known is not None and key_id in (None, known):
+            return known
+        key = derive_key(secret)
+        key_id = key_id or key_id_for(key)
+        with self._lock:
+            self._keys[key_id] = key
+            self._secret_ids[secret] = key_id
+            if key_id not in self._order:
+                self._order.append(key_id)
+        return key_id
+
+    def remove_secret(self, key_id):
+        with self._lock:
+            self._keys.pop(key_id, None)
+            self._secret_ids = {s: k for s, k in self._secret_ids.items() if k != key_id}
+            if key_id in self._order:
+                self._order.remove(key_id)
+
+    def set_secrets(self, secrets):
+        """Make `secrets` the active set; returns (added, removed) key ids."""
+        before = set(self._order)
+        wanted = {self.add_secret(secret) for secret in secrets}
+        for key_id in before - wanted:
+            self.remove_secret(key_id)
+        return sorted(wanted - before), sorted(before - wanted)
+
+    @property
+    def key_ids(self):
+        return list(self._order)
+
+    def decrypt(self, encrypted_data, secret=None, raw=False):
+        """Decrypt a base64 IV|tag|ciphertext payload and return a DecryptResult.
+
+        With `raw` the plaintext is returned as bytes, undecoded (compact binary passes).
+        """
+        key_id = None
+        if ":" in encrypted_data[:17]:
+            key_id, encrypted_data = encrypted_data.split(":", 1)
+
+        try:
+            decoded = base64.b64decode(encrypted_data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            return DecryptResult(False, None, None, f"invalid base64 encoding - {e}")
+        if len(decoded) <= IV_LEN + TAG_LEN:
+            return DecryptResult(False, None, None, "payload too short")
+
+        # Slice views instead of copying the IV, tag and ciphertext out of the buffer
+        view = memoryview(decoded)
+        iv = view[:IV_LEN]
+        tag = view[IV_LEN:IV_LEN + TAG_LEN]
+        ciphertext = view[IV_LEN + TAG_LEN:]
+
+        if secret is not None:
+            # A one-off secret (e.g. the decrypt command) is tried alone and never joins the key ring
+            key = derive_key(secret)
+            candidates = [(key_id_for(key), key)]
+        elif key_id is not None:
+            if key_id not in self._keys:
+                return DecryptResult(False, None, key_id, "unknown key id")
+            candidates = [(key_id, self._keys[key_id])]
+        else:
+            keys = self._keys
+            candidates = [(kid, keys.get(kid)) for kid in list(self._order)]
+
+        for kid, key in candidates:
+            if key is None:
+                continue
+            cipher = AES.new(key, AES.MODE_GCM, nonce=iv)
+            try:
+                plaintext = cipher.decrypt_and_verify(ciphertext, tag)
+            except (ValueError, TypeError):
+                continue
+            if secret is None and kid != self._order[0]:
+                self._promote(kid)
+            if raw:
+                return DecryptResult(True, plaintext, kid, None)
+            try:
+                return DecryptResult(True, plaintext.decode(), kid, None)
+            except UnicodeDecodeError:
+                return DecryptResult(False, None, kid, "plaintext is not valid UTF-8")
+        return DecryptResult(False, None, key_id, "MAC check failed")
+
+    def _promote(self, key_id):
+        with self._lock:
+            if key_id in self._order:
+                self._order.remove(key_id)
+                self._order.insert(0, key_id)
+
+    def encrypt(self, plaintext, key_id=None, iv=None):
+        """Encrypt plaintext (str or bytes) into the base64 IV|tag|ciphertext format (for tests and tooling)."""
+        key_id = key_id or self._order[0]
+        iv = iv or os.urandom(IV_LEN)
+        cipher = AES.new(self._keys[key_id], AES.MODE_GCM, nonce=iv)
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode()
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        return base64.b64encode(iv + tag + ciphertext).decode()
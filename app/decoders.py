@@ -0,0 +1,226 @@
+import os
+import time
+import functools
+import logging
+import cv2
+import numpy as np
+
+try:
+    from pyzbar import pyzbar
+except Exception:
+    pyzbar = None
+
+
+class DecoderBackend:
+    """Common interface for QR decoders: decode(image) -> (data, points) or (None, None)."""
+
+    name = "base"
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def decode(self, image):
+        raise NotImplementedError
+
+
+class OpenCVDecoder(DecoderBackend):
+    """cv2.QRCodeDetector, falling back to multi-decode if single decode errors out."""
+
+    name = "opencv"
+
+    def __init__(self):
+        self.detector = cv2.QRCodeDetector()
+
+    def decode(self, image):
+        try:
+            data, points, _ = self.detector.detectAndDecode(image)
+            if data:
+                return data, points
+            return None, None
+        except cv2.error:
+            try:
+                ok, datas, points, _ = self.detector.detectAndDecodeMulti(image)
+                if ok and datas and datas[0]:
+                    return datas[0], points[0]
+            except cv2.error:
+                pass
+        return None, None
+
+
+class ZbarDecoder(DecoderBackend):
+    """pyzbar / libzbar, restricted to QR symbols."""
+
+    name = "zbar"
+
+    @classmethod
+    def available(cls):
+        return pyzbar is not None
+
+    def __init__(self):
+        self._symbols = [pyzbar.ZBarSymbol.QRCODE]
+
+    def decode(self, image):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        results = pyzbar.decode(gray, symbols=self._symbols)
+        if not results:
+            return None, None
+        result = results[0]
+        points = np.array([[p.x, p.y] for p in result.polygon], dtype=np.float32)
+        return result.data.decode('utf-8', errors='replace'), points
+
+
+class WeChatDecoder(DecoderBackend):
+    """OpenCV contrib's CNN-based WeChat QR decoder (opencv-contrib-python).
+
+    Model files are optional; set WECHAT_QR_MODEL_DIR to a directory holding
+    detect.prototxt, detect.caffemodel, sr.prototxt and sr.caffemodel to use them.
+    """
+
+    name = "wechat"
+
+    @classmethod
+    def available(cls):
+        return hasattr(cv2, "wechat_qrcode_WeChatQRCode")
+
+    def __init__(self, model_dir=None):
+        model_dir = model_dir or os.getenv("WECHAT_QR_MODEL_DIR")
+        if model_dir:
+            files = [os.path.join(model_dir, f) for f in
+                     ("detect.prototxt", "detect.caffemodel", "sr.prototxt", "sr.caffemodel")]
+            self.detector = cv2.wechat_qrcode_WeChatQRCode(*files)
+        else:
+            self.detector = cv2.wechat_qrcode_WeChatQRCode()
+
+    def decode(self, image):
+        try:
+            results, points = self.detector.detectAndDecode(image)
+        except cv2.error:
+            return None, None
+        if results and results[0]:
+            return results[0], points[0]
+        return None, None
+
+
+class CascadeDecoder(DecoderBackend):
+    """Try the cheapest backend first and escalate to the next one only on a miss."""
+
+    name = "cascade"
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def decode(self, image):
+        for backend in self.backends:
+            data, points = backend.decode(image)
+            if data:
+                return data, points
+        return None, None
+
+
+BACKENDS = {cls.name: cls for cls in (OpenCVDecoder, ZbarDecoder, WeChatDecoder)}
+
+
+def available_backends():
+    return [name for name, cls in BACKENDS.items() if cls.available()]
+
+
+def create_decoder(name, cascade_order=None):
+    """Build a decoder instance by name ('opencv', 'zbar', 'wechat' or 'cascade')."""
+    if name == "cascade":
+        order = cascade_order or available_backends()
+        return CascadeDecoder([BACKENDS[n]() for n in order])
+    cls = BACKENDS.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown decoder backend: {name}")
+    if not cls.available():
+        raise RuntimeError(f"Decoder backend '{name}' is not available on this system")
+    return cls()
+
+
+def sample_frames(text="passito-benchmark-sample-0123456789abcdef"):
+    """Synthesize a small set of 640x480 gate-like frames containing a QR code.
+
+    Frames vary the code size, position, rotation, blur and contrast, and one
+    frame is empty so backends that report false positives are penalized.
+    """
+    code = cv2.QRCodeEncoder.create().encode(text)
+    frames = []
+    rng = np.random.default_rng(7)
+    for scale, angle, blur, contrast in ((4, 0, 0, 1.0), (5, 10, 0, 0.8), (6, -15, 3, 1.0),
+                                         (4, 0, 0, 0.6), (5, 20, 5, 1.0), (7, 5, 5, 0.7)):
+        # Longer payloads give denser codes; shrink the modules so the code still fits the frame
+        scale = max(1, min(scale, int(400 / (code.shape[0] * 1.4))))
+        img = cv2.resize(code, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        pad = img.shape[1] // 5
+        img = cv2.copyMakeBorder(img, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=255)
+        h, w = img.shape[:2]
+        rot = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        img = cv2.warpAffine(img, rot, (w, h), borderValue=255)
+        frame = np.full((480, 640), 180, np.uint8)
+        frame += rng.integers(0, 30, frame.shape, dtype=np.uint8)
+        y = int(rng.integers(0, max(1, 480 - h)))
+        x = int(rng.integers(0, max(1, 640 - w)))
+        frame[y:y + h, x:x + w] = (img * contrast + (1 - contrast) * 128).astype(np.uint8)
+        if blur:
+            frame = cv2.GaussianBlur(frame, (blur, blur), 0)
+        frames.append((cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR), text))
+    frames.append((np.full((480, 640, 3), 160, np.uint8), None))
+    return frames
+
+
+def benchmark_backends(frames=None, rounds=3):
+    """Time every available backend on the sample frames.
+
+    Returns a list of dicts with name, hit_rate and avg_ms, fastest first.
+    """
+    frames = frames or sample_frames()
+    results = []
+    for name in available_backends():
+        try:
+            backend = create_decoder(name)
+        except Exception as e:
+            logging.debug("Decoder backend %s unavailable: %s", name, str(e))
+            continue
+        hits = 0
+        elapsed = 0.0
+        for _ in range(rounds):
+            for frame, expected in frames:
+                t0 = time.perf_counter()
+                data, _ = backend.decode(frame)
+                elapsed += time.perf_counter() - t0
+                if (data or None) == expected:
+                    hits += 1
+        total = rounds * len(frames)
+        results.append({"name": name, "hit_rate": hits / total, "avg_ms": elapsed / total * 1000})
+    results.sort(key=lambda r: r["avg_ms"])
+    return results
+
+
+def select_backend(min_hit_rate=0.8, frames=None):
+    """Pick the fastest backend that decodes the sample frames reliably.
+
+    Returns (name, results); falls back to 'opencv' if nothing meets the bar.
+    """
+    results = benchmark_backends(frames)
+    for r in results:
+        logging.debug("Decoder %-7s hit=%.0f%% avg=%.1f ms", r["name"], r["hit_rate"] * 100, r["avg_ms"])
+    reliable = [r for r in results if r["hit_rate"] >= min_hit_rate]
+    name = reliable[0]["name"] if reliable else "opencv"
+    logging.info("Selected QR decoder backend: %s", name)
+    return name, results
+
+
+def resolve_decoder(name):
+    """Turn a user choice ('auto', 'cascade', or a backend name) into a decoder factory.
+
+    The factory is a picklable partial so it can be shipped to worker processes.
+    """
+    if name == "auto":
+        name, _ = select_backend()
+    elif name == "cascade":
+        # Cheapest first, by measured speed on this hardware
+        order = [r["name"] for r in benchmark_backends()]
+        return functools.partial(create_decoder, "cascade", cascade_order=order)
+    create_decoder(name)  # fail fast if unavailable
+    return functools.partial(create_decoder, name)
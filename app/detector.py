@@ -1,183 +1,529 @@
+import os
 import json
 import time
 import threading
 from app.sync import DataSync
+from app.journal import ScanJournal, step
+from app.gate import FrameGate
+from app.decoders import resolve_decoder
+from app.pipeline import DropOldestQueue, LatestPerSource, StageStats, log_stage_stats
+from app.camera import CameraSource
+from app.procpool import ProcessDecodePool
+from app.capture import FrameCapture
+from app.crypto import PassCrypto, DecryptResult
+from app.feedback import FeedbackService, parse_led_pins, verdict_event
+from app.cache import DedupWindow, VerdictCache, payload_key
+from app.payload import is_compact, parse_compact, is_expired, compact_text
+from app.metrics import counter, gauge
+from app.scanlog import ScanLog
+from app.adaptive import AdaptiveCapture, SystemProbe, MODES, parse_resolution
 import cv2
-import base64, pygame, random
-import hashlib
-from Cryptodome.Cipher import AES
+import pygame
 import logging
 
+DECODE_ATTEMPTS = counter("passito_decode_attempts_total", "Frames handed to a QR decoder", ("camera",))
+DECODE_HITS = counter("passito_decode_hits_total", "Frames in which a QR code was decoded", ("camera",))
+DECRYPT_FAILURES = counter("passito_decrypt_failures_total", "Decoded payloads that failed decryption")
+INVALID_PAYLOADS = counter("passito_invalid_payloads_total",
+                           "Decrypted payloads that were neither valid JSON nor a valid compact pass")
+REJECTED_PASSES = counter("passito_rejected_passes_total",
+                          "Compact passes denied locally, by reason (expired, action)", ("reason",))
+
+
+def decode_roi(decoder, image, roi=None):
+    """Decode a frame, or only its (x0, y0, x1, y1) crop when the gate found one."""
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        image = image[y0:y1, x0:x1]
+    return decoder.decode(image)
+
 
 class CLIQRCodeDetector:
-    def __init__(self, output_file="qr_data.txt", api_url=None, auth_token=None):
-        self.output_file = output_file
-        self.seen_data = self._load_seen_data()
+    def __init__(self, api_url=None, auth_token=None, decode_workers=None, journal_path="scans.db",
+                 gate=True, decoder="auto", secrets=None, sources=None, decode_mode="thread", gray=False,
+                 passlist=None, scan_log_dir="scanlog"):
         self.detector = cv2.QRCodeDetector()
-        self.cap = cv2.VideoCapture(0)  # Initialize the camera
-        # Lower resolution for faster decode; adjust as needed
+        # One capture per camera source; all of them share the decoders, sync client and caches
+        self.sources = sources or [CameraSource(0)]
+        self.caps = []
         try:
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        except Exception:
-            pass
+            for source in self.sources:
+                self.caps.append(source.open())
+        except RuntimeError:
+            for cap in self.caps:
+                cap.release()
+            raise
+        self.cap = self.caps[0]
+        # Frames are read into a preallocated ring per camera instead of a fresh array each time
+        if decode_workers is None:
+            decode_workers = min(os.cpu_count() or 2, len(self.sources) + 1)
+        self.captures = [FrameCapture(cap, slots=decode_workers + 4, gray=gray) for cap in self.caps]
         self.api_url = api_url
         self.auth_token = auth_token
-        self.sync = DataSync(file_path=self.output_file,
-                             api_url=self.api_url, auth_token=self.auth_token)
-        # Preload buzzer sound to avoid runtime loading delays
-        try:
-            self._buzzer = pygame.mixer.Sound("sounds/buzzer.mp3")
-        except Exception:
-            self._buzzer = None
-        # Small dedup cache to prevent re-processing same payload quickly
-        self._recent_set = set()
-        self._recent_last_purge = time.time()
-        self._recent_ttl = 5.0
+        self.journal = ScanJournal(journal_path) if journal_path else None
+        # All sounds and LEDs go through one feedback thread, so the scan loop never waits on them
+        self.feedback = FeedbackService(led_pins=parse_led_pins(os.getenv("LED_PINS", "")))
+        self.sync = DataSync(api_url=self.api_url, auth_token=self.auth_token,
+                             journal=self.journal, feedback=self.feedback)
+        # Rotated NDJSON record of every scan and its verdict, written by a background thread
+        self.scan_log = None
+        if scan_log_dir:
+            self.scan_log = ScanLog(scan_log_dir,
+                                    segment_bytes=int(float(os.getenv("SCAN_LOG_SEGMENT_MB", "4")) * (1 << 20)),
+                                    keep=int(os.getenv("SCAN_LOG_KEEP", "16")))
+        # Keys are derived once per secret; PASS_SECRETS lists every active secret for rotation
+        self.crypto = PassCrypto(secrets or os.getenv("PASS_SECRETS", "passito").split(","))
+        # Short dedup window to prevent re-processing the same payload quickly, and a
+        # longer-lived cache of server verdicts to answer repeat scans without a round-trip
+        self.dedup = DedupWindow(ttl=5.0)
+        self.verdicts = VerdictCache(max_entries=int(os.getenv("VERDICT_CACHE_SIZE", "1024")),
+                                     ttl=float(os.getenv("VERDICT_CACHE_TTL", "60")))
+        # Optional prefetched pass list (app.passlist.PassIndex) for local verdicts
+        self.passlist = passlist
+        self.passlist_max_age = float(os.getenv("PASSLIST_MAX_AGE", "86400"))
+        self.pass_id_field = os.getenv("PASS_ID_FIELD", "id")
+
+        # Pipeline plumbing: newest-frame slot between capture and decode, bounded
+        # drop-oldest queue between decode and verify, and per-stage latency stats.
+        self.decode_workers = max(1, decode_workers)
+        # 'process' decodes in worker processes fed through shared memory, bypassing the GIL
+        self.decode_mode = decode_mode
+        self._decode_pool = None
+        self._frames = LatestPerSource()
+        self._decoded = DropOldestQueue(maxsize=8)
+        # Where decoded (data, idx) payloads go, and an optional callable(idx, source, verdict, seconds)
+        # told how each scan ended (source: server, cache, passlist or dropped); the bench swaps both
+        self.decoded_sink = self._decoded.put
+        self.scan_sink = None
+        self._stop = threading.Event()
+        self._player = None
+        # Motion and ROI state are per camera, so each one gets its own gate
+        self.gates = [FrameGate() if gate else None for _ in self.sources]
+        self.gate = self.gates[0]
+        # Capture rate, resolution and blind decodes follow gate activity and SoC temperature/load;
+        # the controller needs the gate's motion signal, so it is off when the gate is
+        self.probe = SystemProbe()
+        self.controllers = [self._make_controller(source, cap, g)
+                            for source, cap, g in zip(self.sources, self.caps, self.gates)]
+        # 'auto' benchmarks the available backends on this hardware and keeps the fastest;
+        # a factory resolved ahead of time (e.g. during startup warm-up) is used as is
+        self._decoder_factory = decoder if callable(decoder) else resolve_decoder(decoder)
+        self._capture_stats = StageStats("capture")
+        self._gate_stats = StageStats("gate")
+        self._decode_stats = StageStats("decode")
+        self._age_stats = StageStats("age")
+        self._verify_stats = StageStats("verify")
+        self._sync_stats = StageStats("sync")
+        self._stages = (self._capture_stats, self._gate_stats, self._age_stats, self._decode_stats,
+                        self._verify_stats, self._sync_stats)
+        self._stats_interval = 30.0
+        self._register_metrics()
 
         # Suppress ECI warnings
         cv2.setLogLevel(0)
 
-        if not self.cap.isOpened():
-            raise RuntimeError(
-                "Failed to access the camera. Ensure it's connected and not in use.")
-
-    def _load_seen_data(self):
-        """Load previously stored QR code data."""
-        seen_data = set()
+    def _make_controller(self, source, cap, gate):
+        idle_fps = float(os.getenv("CAPTURE_IDLE_FPS", "5"))
+        if gate is None or idle_fps <= 0:
+            return None
         try:
-            with open(self.output_file, "r") as file:
-                seen_data.update(line.strip() for line in file)
-        except FileNotFoundError:
-            pass
-        return seen_data
+            base = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 640),
+                    int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 480))
+        except Exception:
+            base = (640, 480)
+        return AdaptiveCapture(cap, name=source.name, gate=gate, base_res=base,
+                               high_res=parse_resolution(os.getenv("CAPTURE_HIGH_RES", "1280x720")),
+                               idle_fps=idle_fps,
+                               throttled_fps=float(os.getenv("CAPTURE_THROTTLED_FPS", "10")),
+                               temp_limit=float(os.getenv("CAPTURE_TEMP_LIMIT", "75")),
+                               load_limit=float(os.getenv("CAPTURE_LOAD_LIMIT", "1.5")), probe=self.probe)
+
+    def _register_metrics(self):
+        # Hot-path counters are bound per camera once; everything else is read at scrape time
+        names = [source.name for source in self.sources]
+        self._decode_attempts = [DECODE_ATTEMPTS.labels(name) for name in names]
+        self._decode_hits = [DECODE_HITS.labels(name) for name in names]
+        counter("passito_frames_captured_total", "Frames read from the camera", ("camera",)).set_function(
+            lambda: {(n,): c.captured for n, c in zip(names, self.captures)})
+        counter("passito_frames_dropped_total", "Frames dropped at capture or before decode",
+                ("camera", "where")).set_function(
+            lambda: dict([((n, "capture"), c.dropped) for n, c in zip(names, self.captures)]
+                         + [(("all", "decode_slot"), self._frames.dropped),
+                            (("all", "verify_queue"), self._decoded.dropped)]))
+        counter("passito_frames_gated_total", "Frames rejected by the motion/finder gate",
+                ("camera",)).set_function(
+            lambda: {(n,): g.rejected_total for n, g in zip(names, self.gates) if g is not None})
+        gauge("passito_queue_depth", "Items waiting between pipeline stages", ("queue",)).set_function(
+            lambda: {(name,): depth for name, depth in self.queue_depths().items()})
+        if self.journal is not None:
+            gauge("passito_journal_dead_letters", "Journaled scans the server kept rejecting, no longer resent"
+                  ).set_function(self.journal.dead_count)
+        counter("passito_dedup_hits_total", "Scans suppressed by the dedup window").set_function(
+            lambda: self.dedup.hits)
+        counter("passito_verdict_cache_total", "Verdict cache lookups", ("result",)).set_function(
+            lambda: {("hit",): self.verdicts.hits, ("miss",): self.verdicts.misses})
+        controlled = [(n, c) for n, c in zip(names, self.controllers) if c is not None]
+        gauge("passito_capture_mode", "Adaptive capture mode (1 for the current one)",
+              ("camera", "mode")).set_function(
+            lambda: {(n, m): int(c.mode == m) for n, c in controlled for m in MODES})
+        gauge("passito_capture_target_fps", "Capture rate the controller aims for (0 = camera rate)",
+              ("camera",)).set_function(lambda: {(n,): c.target_fps for n, c in controlled})
+        gauge("passito_capture_height_pixels", "Frame height requested from the camera",
+              ("camera",)).set_function(lambda: {(n,): c.resolution[1] for n, c in controlled})
+        gauge("passito_cpu_temperature_celsius", "SoC temperature as last read by the capture controller"
+              ).set_function(lambda: {} if self.probe.temperature is None else self.probe.temperature)
+        gauge("passito_cpu_load_per_core", "1-minute load average per core as last read by the capture controller"
+              ).set_function(lambda: {} if self.probe.load is None else round(self.probe.load, 3))
+
+    def queue_depths(self):
+        return {"decode": len(self._frames), "verify": len(self._decoded), "sync": self.sync.pending(),
+                "journal": self.journal.pending_count() if self.journal is not None else 0}
 
-    def _save_data(self, data):
-        """Save new QR code data to the output file."""
-        with open(self.output_file, "a") as file:
-            file.write(data + "\n")
+    def count_decode(self, idx, data):
+        self._decode_attempts[idx].inc()
+        if data:
+            self._decode_hits[idx].inc()
+
+    def log_scan(self, data, idx, verdict, source, t0, key=None):
+        """Append a scan and its verdict to the scan log; `source` is server, cache or passlist."""
+        elapsed = time.perf_counter() - t0
+        if self.scan_sink is not None:
+            self.scan_sink(idx, source, verdict, elapsed)
+        if self.scan_log is None:
+            return
+        record = dict(self.sources[idx].meta or {}, ts=round(time.time(), 3), camera=self.sources[idx].name,
+                      verdict=verdict_event(verdict), source=source,
+                      latency_ms=round(elapsed * 1000, 2), data=data)
+        if key is not None:
+            record["key"] = key
+        if isinstance(verdict, dict) and verdict.get("message"):
+            record["message"] = verdict["message"]
+        self.scan_log.append(record)
 
     def detect_and_save(self, player: pygame.mixer.music):
-        """Detect QR codes and save new ones in a CLI environment while syncing data in the background."""
+        """Detect QR codes and sync them using a capture / decode / verify pipeline.
+
+        The camera thread always publishes the newest frame, a small pool of decode
+        workers picks frames up as they become free, and a verify stage decrypts and
+        syncs decoded payloads. Stages are joined by bounded drop-oldest queues so a
+        slow sync never holds back frame capture.
+        """
         logging.info("QR scanner active. Press Ctrl+C to terminate.")
+        self._player = player
+        self._stop.clear()
+        threads = [threading.Thread(target=self._verify_loop, name="qr-verify", daemon=True)]
+        for idx, source in enumerate(self.sources):
+            threads.append(threading.Thread(target=self._capture_loop, args=(idx,),
+                                            name=f"qr-capture-{source.name}", daemon=True))
+        if self.decode_mode == "process":
+            # Decoding happens in worker processes; these threads only feed and drain them
+            self._decode_pool = ProcessDecodePool(self.decode_workers, self._decoder_factory,
+                                                  slot_bytes=self._max_frame_bytes())
+            threads.append(threading.Thread(target=self._dispatch_loop, name="qr-dispatch", daemon=True))
+            threads.append(threading.Thread(target=self._collect_loop, name="qr-collect", daemon=True))
+        else:
+            for i in range(self.decode_workers):
+                threads.append(threading.Thread(target=self._decode_loop, name=f"qr-decode-{i}",
+                                                daemon=True))
+        for t in threads:
+            t.start()
         try:
-            last_data = None  # Track the last detected data to avoid redundant syncing
-            while True:
-                ret, frame = self.cap.read()
-                if not ret or frame is None or getattr(frame, 'size', 0) == 0:
-                    logging.debug("Failed to grab valid frame. Retrying...")
-                    time.sleep(0.05)
-                    continue
-
-                # Detect and decode QR code with safety guards
-                data = None
-                try:
-                    data, _, _ = self.detector.detectAndDecode(frame)
-                except cv2.error:
-                    # Fallback to multi-decode if single decode errors out
-                    try:
-                        datas, _, _ = self.detector.detectAndDecodeMulti(frame)
-                        if datas and len(datas) > 0:
-                            data = datas[0]
-                    except cv2.error:
-                        data = None
-
-                if data:
-                    logging.debug("QR detected with %d chars", len(data))
-                    decrypted_data = self.decrypt_qr_data(data, 'passito')
-
-                    # Convert to JSON object to standardize format
-                    try:
-                        # Convert string to dictionary (avoid sorting to reduce CPU)
-                        json_data = json.loads(decrypted_data)
-                        standardized_data = json.dumps(json_data, separators=(',', ':'))
-                    except json.JSONDecodeError:
-                        logging.warning("QR validation failed: decryption error or invalid JSON format")
-                        continue
-
-                    if standardized_data and decrypted_data != "Decryption failed!":  # Only process valid QR code data
-                        # Deduplicate recent payloads for a few seconds (valid path fast)
-                        now_ts = time.time()
-                        if (now_ts - self._recent_last_purge) > self._recent_ttl:
-                            self._recent_set.clear()
-                            self._recent_last_purge = now_ts
-                        if standardized_data in self._recent_set:
-                            # Minimal delay for valid duplicates
-                            time.sleep(0.01)
-                            continue
-                        self._recent_set.add(standardized_data)
-                        logging.info("QR verification successful: %s", standardized_data)
-                        logging.debug("Valid QR after decrypt; syncing...")
-                        last_data = standardized_data
-
-                        # Sync data synchronously to pause further detection until network call finishes
-                        t0 = time.perf_counter()
-                        self.sync.sync_with_server(standardized_data, player)
-                        logging.debug("Sync finished in %.1f ms", (time.perf_counter() - t0) * 1000)
-
-                        # Update seen data and save (not saving to file as per new instructions)
-                        # self.seen_data.add(standardized_data)
-                        # self._save_data(standardized_data)
-                    elif decrypted_data == "Decryption failed!":
-                        logging.warning("QR validation failed: decryption unsuccessful with provided key")
-
-                # Reduced delay to balance performance and efficiency
-                time.sleep(0.2)
+            while not self._stop.wait(self._stats_interval):
+                log_stage_stats(self._stages, self._stats_interval)
+                logging.debug("Verdict cache: %s, dedup hits=%d", self.verdicts.stats(), self.dedup.hits)
+                for source, gate in zip(self.sources, self.gates):
+                    if gate is not None:
+                        logging.debug("Frame gate [%s] rejected %.0f%% of %d frames",
+                                      source.name, gate.reject_ratio * 100, gate.checked)
+                        gate.reset_stats()
+                for source, capture, controller in zip(self.sources, self.captures, self.controllers):
+                    logging.debug("Capture [%s]: %s, mode=%s", source.name, capture.stats(),
+                                  controller.mode if controller is not None else "fixed")
+                if self._frames.dropped or self._decoded.dropped:
+                    logging.debug("Pipeline drops: frames=%d decoded=%d",
+                                  self._frames.dropped, self._decoded.dropped)
         except KeyboardInterrupt:
             logging.info("QR scanner terminated by user.")
         finally:
+            self._stop.set()
+            self._frames.close()
+            self._decoded.close()
+            for t in threads:
+                t.join(timeout=2.0)
+            if self._decode_pool is not None:
+                self._decode_pool.close()
+                self._decode_pool = None
             self.release_resources()
 
-    def release_resources(self):
-        """Release resources used by the camera."""
-        if self.cap.isOpened():
-            self.cap.release()
+    def _capture_loop(self, idx=0):
+        """Grab frames from one camera, keeping only its newest likely-QR frame for the decoders."""
+        capture, gate, controller = self.captures[idx], self.gates[idx], self.controllers[idx]
+        failures = 0
+        while not self._stop.is_set():
+            if controller is not None:
+                # Idle and throttled modes read fewer frames; resolution switches happen on this thread
+                if self._stop.wait(controller.delay()):
+                    break
+                controller.before_read()
+            with self._capture_stats.time():
+                ok, ref = capture.read()
+            if not ok:
+                logging.debug("Failed to grab valid frame from %s. Retrying...", self.sources[idx].name)
+                failures += 1
+                if failures == 20:
+                    # About a second without frames: tell the person at the gate once, not every retry
+                    logging.error("Camera %s stopped delivering frames", self.sources[idx].name)
+                    self.feedback.notify("error")
+                time.sleep(0.05)
+                continue
+            failures = 0
+            if ref is None:
+                continue
+            roi = None
+            if gate is not None:
+                with self._gate_stats.time():
+                    accept, roi = gate.check(ref.image)
+                if controller is not None:
+                    controller.note_gate(accept, gate.last_reason)
+                if not accept:
+                    ref.release()
+                    continue
+            replaced = self._frames.put(idx, (ref, roi))
+            if replaced is not None:
+                replaced[0].release()
 
-    def decrypt_qr_data(self, encrypted_data: str, shared_secret: str) -> str:
-        """Decrypt the QR code data."""
-        # Generate the key from the shared secret
-        key = hashlib.sha256(shared_secret.encode()).digest()
+    def _decode_loop(self):
+        """Decode the newest available frame; each worker owns its own decoder instance."""
+        decoder = self._decoder_factory()
+        while not self._stop.is_set():
+            item = self._frames.get(timeout=0.5)
+            if item is None:
+                continue
+            idx, (ref, roi) = item
+            self._age_stats.record(ref.age)
+            with self._decode_stats.time():
+                data, points = decode_roi(decoder, ref.image, roi)
+            shape = ref.image.shape
+            ref.release()
+            self._handle_decoded(idx, roi, shape, data, points)
 
-        # Decode the Base64-encoded encrypted string
-        try:
-            decoded = base64.b64decode(encrypted_data, validate=True)
-        except Exception as e:
-            logging.warning("Decryption failed: invalid base64 encoding - %s", str(e))
+    def _dispatch_loop(self):
+        """Copy the newest frames into the process pool's shared-memory slots."""
+        while not self._stop.is_set():
+            item = self._frames.get(timeout=0.5)
+            if item is None:
+                continue
+            idx, (ref, roi) = item
+            self._age_stats.record(ref.age)
+            frame = ref.image
+            # submit() copies the frame into shared memory, so the ring slot can be freed right after
+            self._decode_pool.submit(frame, roi, tag=(idx, roi, frame.shape, time.perf_counter()),
+                                     timeout=0.5)
+            ref.release()
+
+    def _collect_loop(self):
+        """Pick up decode results from the worker processes."""
+        while not self._stop.is_set():
+            result = self._decode_pool.get_result(timeout=0.5)
+            if result is None:
+                continue
+            data, points, (idx, roi, shape, t0) = result
+            self._decode_stats.record(time.perf_counter() - t0)
+            self._handle_decoded(idx, roi, shape, data, points)
+
+    def _handle_decoded(self, idx, roi, shape, data, points):
+        self.note_decoded(idx, roi, shape, data, points)
+        if data:
+            logging.debug("QR detected with %d chars", len(data))
+            self.decoded_sink((data, idx))
+
+    def note_decoded(self, idx, roi, shape, data, points):
+        """Feed one decode result back to the camera's counters, capture controller and gate."""
+        self.count_decode(idx, data)
+        if self.controllers[idx] is not None:
+            self.controllers[idx].note_decode(bool(data))
+        gate = self.gates[idx]
+        if gate is not None:
+            if data and points is not None:
+                x0, y0 = (roi[0], roi[1]) if roi is not None else (0, 0)
+                gate.note_hit(points + (x0, y0), shape)
+            elif roi is not None:
+                # The code left the crop; go back to full frames
+                gate.clear_roi()
+
+    def _max_frame_bytes(self):
+        """Largest frame any camera reports or may be switched to, with 640x480 BGR as the floor."""
+        size = 640 * 480 * 3
+        for cap, controller in zip(self.caps, self.controllers):
+            w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+            h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+            size = max(size, w * h * 3)
+            if controller is not None and controller.high_res:
+                size = max(size, controller.high_res[0] * controller.high_res[1] * 3)
+        return size
+
+    def _verify_loop(self):
+        """Decrypt, normalize, dedup and sync decoded payloads."""
+        while not self._stop.is_set():
+            item = self._decoded.get(timeout=0.5)
+            if item is None:
+                continue
+            with self._verify_stats.time():
+                self._verify(*item)
+
+    def _verify(self, data, idx=0):
+        """Run the scan steps for a payload, handing a server-bound scan to the sync scheduler.
+
+        Returns the sync Future when the server decides, None when the scan ended locally.
+        """
+        steps = self.scan(data, idx)
+        request, _ = step(steps)
+        if request is None:
+            return None
+        standardized_data, key, meta = request
+        # Hand off without waiting; the remaining steps run when the server answers
+        return self.sync.sync_with_server(standardized_data, self._player, key=key, meta=meta,
+                                          callback=lambda fut: step(steps, fut.result()))
+
+    def scan(self, data, idx=0):
+        """Generator with everything that happens to a decoded payload, without the sync transport.
+
+        Decrypts, normalizes and dedups it (see prepare_scan) and journals it.
+        When the server has to decide, yields (standardized_data, key, meta)
+        and expects the verdict sent back; scans decided locally or dropped
+        finish without yielding. Use app.journal.step to drive it; the
+        threaded pipeline, the async runtime and the bench all do.
+        """
+        meta = self.sources[idx].meta
+        t_scan = time.perf_counter()
+        prepared = self.prepare_scan(data, meta)
+        if prepared is None:
+            # Failed decryption or JSON, or a duplicate inside the dedup window
+            if self.scan_sink is not None:
+                self.scan_sink(idx, "dropped", None, time.perf_counter() - t_scan)
+            return
+        standardized_data, cache_key, verdict, pass_id = prepared
+        if verdict is not None:
+            key = None
+            if verdict.get("offline"):
+                # Decided from the pass list; the journal uploader reconciles it with the server
+                key = self.sync.record(standardized_data, meta)
+            self.log_scan(standardized_data, idx, verdict, "passlist" if verdict.get("offline") else "cache",
+                          t_scan, key)
+            return
+
+        # Journal before syncing so the scan survives a network outage or crash
+        key = self.sync.record(standardized_data, meta)
+        t0 = time.perf_counter()
+        resp = yield standardized_data, key, meta
+        # Stage latency is recorded when the server answers
+        self._sync_stats.record(time.perf_counter() - t0)
+        self.remember_verdict(cache_key, resp, pass_id)
+        self.log_scan(standardized_data, idx, resp, "server", t_scan, key)
+
+    def prepare_scan(self, data, meta=None):
+        """Decrypt, normalize and dedup a decoded payload.
+
+        JSON passes are normalized to compact JSON; compact binary passes
+        (app.payload) skip the JSON round-trip and are denied locally when
+        expired or issued for the other direction.
+
+        `meta` is the camera's gate/action metadata; the same pass scanned for a
+        different action is a different scan for dedup and verdict caching.
+
+        Returns None if the scan should be dropped, otherwise
+        (standardized_data, cache_key, cached_verdict, pass_id); a cached verdict has
+        already been announced and needs no sync. Verdicts taken from the local
+        pass list carry "offline": True and still need to be journaled.
+        """
+        result = self.decrypt_qr_data(data, raw=True)
+        if not result.ok:
+            logging.warning("QR validation failed: decryption unsuccessful with provided key")
+            return None
+        plaintext = result.plaintext
+        action = meta.get("action", "") if meta else ""
+
+        compact = None
+        if is_compact(plaintext):
+            # Fixed binary layout: fields come straight from the header and the bytes are already canonical
             try:
-                if self._buzzer:
-                    ch = self._buzzer.play()
-                    if ch is not None:
-                        while ch.get_busy():
-                            time.sleep(0.01)
-                    time.sleep(random.uniform(0.15, 0.35))
-            except Exception:
-                pass
-            return "Decryption failed!"
-
-        # Extract IV, Tag, and Ciphertext
-        iv = decoded[:12]         # First 12 bytes = IV
-        tag = decoded[12:28]      # Next 16 bytes = Tag
-        ciphertext = decoded[28:]  # Remaining bytes = Ciphertext
-
-        # Create AES cipher object for decryption
-        cipher = AES.new(key, AES.MODE_GCM, nonce=iv)
-
-        # Decrypt the ciphertext
-        try:
-            decrypted_data = cipher.decrypt_and_verify(ciphertext, tag)
-            return decrypted_data.decode()  # Convert bytes to string
-        except (ValueError, TypeError) as e:
-            logging.warning("Decryption failed: %s", str(e))
+                compact = parse_compact(plaintext)
+            except ValueError as e:
+                logging.warning("QR validation failed: %s", e)
+                INVALID_PAYLOADS.inc()
+                return None
+            standardized_data = compact_text(plaintext)
+            cache_key = payload_key(plaintext + (b"|" + action.encode() if meta else b""))
+            pass_id = compact.pass_id
+        else:
+            # Convert to JSON object to standardize format
             try:
-                if self._buzzer:
-                    ch = self._buzzer.play()
-                    if ch is not None:
-                        while ch.get_busy():
-                            time.sleep(0.01)
-                    time.sleep(random.uniform(0.15, 0.35))
-            except Exception:
-                pass
-            return "Decryption failed!"
+                # Convert string to dictionary (avoid sorting to reduce CPU)
+                json_data = json.loads(plaintext)
+                standardized_data = json.dumps(json_data, separators=(',', ':'))
+            except ValueError:
+                logging.warning("QR validation failed: decryption error or invalid JSON format")
+                INVALID_PAYLOADS.inc()
+                return None
+
+            if not standardized_data:
+                return None
+            cache_key = payload_key(standardized_data + ("|" + action if meta else ""))
+            pass_id = json_data.get(self.pass_id_field) if isinstance(json_data, dict) else None
+
+        # Deduplicate recent payloads; each entry expires on its own
+        if self.dedup.seen(cache_key):
+            return None
+        if compact is not None:
+            reason = None
+            if is_expired(compact):
+                reason = "expired"
+            elif compact.action and action and compact.action != action:
+                reason = "action"
+            if reason is not None:
+                logging.warning("Pass %s rejected locally (%s)", pass_id, reason)
+                REJECTED_PASSES.labels(reason).inc()
+                self.feedback.notify("denied")
+                return None
+        logging.info("QR verification successful: %s", standardized_data)
+
+        # Repeat scans of a pass the server already answered are served locally
+        verdict = self.verdicts.get(cache_key)
+        if verdict is None and self.passlist is not None and pass_id is not None:
+            verdict = self.passlist.verdict(pass_id, self.passlist_max_age)
+        if verdict is not None:
+            logging.info("Verdict served locally: %s", verdict)
+            self.feedback.notify("success" if verdict.get("status", True) else "denied")
+        else:
+            logging.debug("Valid QR after decrypt; syncing...")
+        return standardized_data, cache_key, verdict, pass_id
+
+    def remember_verdict(self, cache_key, resp, pass_id=None):
+        """Cache a server verdict and apply any invalidation it carries."""
+        if isinstance(resp, dict) and not resp.get("error"):
+            self.verdicts.apply_server_invalidation(resp)
+            self.verdicts.put(cache_key, resp, pass_expiry=resp.get("expires_at"), pass_id=pass_id)
+
+    def release_resources(self):
+        """Release resources used by the camera and the sync journal."""
+        for cap in self.caps:
+            if cap.isOpened():
+                cap.release()
+        self.sync.close()
+        self.feedback.close()
+        if self.scan_log is not None:
+            self.scan_log.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    def decrypt_qr_data(self, encrypted_data: str, shared_secret: str = None, raw: bool = False) -> DecryptResult:
+        """Decrypt the QR code data; invalid codes queue a buzzer without blocking."""
+        result = self.crypto.decrypt(encrypted_data, shared_secret, raw=raw)
+        if not result.ok:
+            logging.warning("Decryption failed: %s", result.error)
+            DECRYPT_FAILURES.inc()
+            self.feedback.notify("denied")
+        return result
 
 
 # if __name__ == "__main__":
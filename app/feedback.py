@@ -0,0 +1,195 @@
+import time
+import threading
+import logging
+
+# Lower is more urgent; a pending urgent event is always played first
+PRIORITY = {"denied": 0, "error": 1, "offline": 2, "success": 3}
+
+# 'offline' (scan journaled, server unreachable) has no sound by default; the LED sink shows it
+DEFAULT_SOUNDS = {"success": "sounds/success.mp3", "denied": "sounds/buzzer.mp3",
+                  "error": "sounds/wrong-buzzer.mp3"}
+
+_sounds = {}
+_sounds_lock = threading.Lock()
+
+
+# Decode a sound file once per process; None when audio is unavailable
+def load_sound(path):
+    with _sounds_lock:
+        if path in _sounds:
+            return _sounds[path]
+    sound = None
+    try:
+        # Imported here so the CLI can read DEFAULT_SOUNDS without loading pygame;
+        # Sound() decodes the whole file to PCM up front, so playing it costs no decoding
+        import pygame
+        sound = pygame.mixer.Sound(path)
+    except Exception:
+        sound = None
+    with _sounds_lock:
+        # Failures are not cached: the mixer may simply not be initialized yet
+        if sound is not None:
+            _sounds[path] = sound
+    return sound
+
+
+def verdict_event(resp):
+    """Feedback event for a sync result: None or an error means the scan is waiting in the journal."""
+    if not resp or (isinstance(resp, dict) and resp.get("error")):
+        return "offline"
+    return "success" if not isinstance(resp, dict) or resp.get("status", True) else "denied"
+
+
+class SoundSink:
+    """Plays pre-decoded sounds through pygame's mixer."""
+
+    def __init__(self, sounds):
+        self.sounds = {event: load_sound(path) for event, path in sounds.items()}
+        self._channel = None
+
+    def emit(self, event):
+        """Start the sound for an event; returns how long it plays, in seconds."""
+        sound = self.sounds.get(event)
+        if sound is None:
+            return 0.0
+        try:
+            self._channel = sound.play()
+            return sound.get_length()
+        except Exception:
+            return 0.0
+
+    def stop(self):
+        if self._channel is not None:
+            try:
+                self._channel.stop()
+            except Exception:
+                pass
+            self._channel = None
+
+
+class LedSink:
+    """Signals events on GPIO LEDs through gpiozero; blinking runs on gpiozero's own thread.
+
+    `pins` maps an event to a BCM pin number. 'error' falls back to the 'denied'
+    LED and 'offline' to the 'success' LED when they have no pin of their own.
+    """
+
+    PATTERNS = {"success": (0.6, 0.0, 1), "denied": (0.15, 0.15, 3), "error": (0.1, 0.1, 5),
+                "offline": (0.3, 0.3, 2)}
+    FALLBACK = {"error": "denied", "offline": "success"}
+
+    def __init__(self, pins):
+        try:
+            from gpiozero import LED
+        except Exception:
+            raise RuntimeError("LED feedback needs gpiozero: pip install gpiozero")
+        self.leds = {event: LED(pin) for event, pin in pins.items()}
+
+    def _led(self, event):
+        return self.leds.get(event) or self.leds.get(self.FALLBACK.get(event))
+
+    def emit(self, event):
+        led = self._led(event)
+        if led is None:
+            return 0.0
+        on, off, n = self.PATTERNS.get(event, (0.3, 0.0, 1))
+        led.blink(on_time=on, off_time=off, n=n, background=True)
+        return (on + off) * n
+
+    def stop(self):
+        for led in self.leds.values():
+            led.off()
+
+
+def parse_led_pins(spec):
+    """Parse 'success=17,denied=27' into {event: pin}."""
+    pins = {}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        event, _, pin = part.partition("=")
+        if event.strip() not in PRIORITY or not pin.strip().isdigit():
+            raise ValueError(f"Invalid LED pin spec '{part}' (expected event=BCM_PIN)")
+        pins[event.strip()] = int(pin)
+    return pins
+
+
+class FeedbackService:
+    """The verifier's single feedback path: one worker thread drives every sink.
+
+    `notify` never blocks. Pending events are coalesced (at most one pending
+    per event type, so a burst of scans gives one beep, not a dozen) and served
+    most-urgent first; a more urgent event cuts short whatever is playing.
+    """
+
+    def __init__(self, sounds=None, led_pins=None):
+        self.sinks = [SoundSink(DEFAULT_SOUNDS if sounds is None else sounds)]
+        if led_pins:
+            try:
+                self.sinks.append(LedSink(led_pins))
+            except Exception as e:
+                logging.warning("LED feedback disabled: %s", e)
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self.coalesced = 0
+
+    @property
+    def sounds(self):
+        return self.sinks[0].sounds
+
+    def notify(self, event):
+        """Queue an event ('success', 'denied', 'error', 'offline') without blocking."""
+        with self._cond:
+            if self._closed:
+                return
+            if event in self._pending:
+                self.coalesced += 1
+                return
+            self._pending.add(event)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="feedback", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _next(self):
+        # Called with the lock held
+        event = min(self._pending, key=lambda e: PRIORITY.get(e, len(PRIORITY)))
+        self._pending.discard(event)
+        return event
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    break
+                event = self._next()
+            duration = 0.0
+            for sink in self.sinks:
+                try:
+                    duration = max(duration, sink.emit(event))
+                except Exception as e:
+                    logging.debug("Feedback sink failed for %s: %s", event, e)
+            # Let the event finish so back-to-back events don't overlap, unless something more urgent arrives
+            deadline = time.monotonic() + duration
+            rank = PRIORITY.get(event, len(PRIORITY))
+            with self._cond:
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if any(PRIORITY.get(e, len(PRIORITY)) < rank for e in self._pending):
+                        for sink in self.sinks:
+                            sink.stop()
+                        break
+                    self._cond.wait(remaining)
+        for sink in self.sinks:
+            sink.stop()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
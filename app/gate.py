@@ -0,0 +1,110 @@
+import time
+import threading
+import cv2
+
+
+class FrameGate:
+    """Cheap pre-detection filter that decides whether a frame is worth a full QR decode.
+
+    Each frame is reduced to a small grayscale thumbnail and accepted when it
+    differs enough from the previous one (motion), when it contains nested-square
+    contours that look like QR finder patterns, or while a recently decoded code
+    is still expected in view. While a code was seen recently the gate also hands
+    back a region of interest around it so the decoder can work on a crop.
+    """
+
+    def __init__(self, size=(160, 120), motion_threshold=4.0, roi_hold_secs=1.5,
+                 roi_margin=0.5, keepalive_every=15):
+        self.size = size
+        self.motion_threshold = motion_threshold
+        self.roi_hold_secs = roi_hold_secs
+        self.roi_margin = roi_margin
+        # Let an occasional frame through regardless, so a pass held perfectly still is not missed
+        self.keepalive_every = keepalive_every
+        self._prev = None
+        self._since_accept = 0
+        self._roi = None
+        self._roi_ts = 0.0
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = 0
+        # Never reset, for metrics
+        self.rejected_total = 0
+        # Why the last frame was accepted: 'roi', 'motion', 'finder', 'keepalive' (None if rejected)
+        self.last_reason = None
+
+    @property
+    def reject_ratio(self):
+        return self.rejected / self.checked if self.checked else 0.0
+
+    def reset_stats(self):
+        self.checked = 0
+        self.rejected = 0
+
+    def check(self, frame):
+        """Return (accept, roi); roi is (x0, y0, x1, y1) in frame pixels or None."""
+        self.checked += 1
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        prev, self._prev = self._prev, small
+
+        roi = self._current_roi()
+        reason = "roi" if roi is not None else None
+        if reason is None and prev is not None and cv2.absdiff(small, prev).mean() >= self.motion_threshold:
+            reason = "motion"
+        if reason is None and self._has_finder_candidates(small):
+            reason = "finder"
+        if reason is None:
+            self._since_accept += 1
+            if self._since_accept >= self.keepalive_every:
+                reason = "keepalive"
+        self.last_reason = reason
+        accept = reason is not None
+
+        if accept:
+            self._since_accept = 0
+        else:
+            self.rejected += 1
+            self.rejected_total += 1
+        return accept, roi
+
+    @staticmethod
+    def _has_finder_candidates(small):
+        """Look for a contour nested two levels deep, the shape of a QR finder pattern."""
+        _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        if hierarchy is None:
+            return False
+        hierarchy = hierarchy[0]
+        for i in range(len(contours)):
+            child = hierarchy[i][2]
+            if child >= 0 and hierarchy[child][2] >= 0:
+                x, y, w, h = cv2.boundingRect(contours[i])
+                if w >= 3 and h >= 3 and 0.6 <= w / h <= 1.6:
+                    return True
+        return False
+
+    def note_hit(self, points, frame_shape):
+        """Remember where a code was decoded so following frames can be cropped to it."""
+        if points is None:
+            return
+        pts = points.reshape(-1, 2)
+        x0, y0 = pts.min(axis=0)
+        x1, y1 = pts.max(axis=0)
+        mx = (x1 - x0) * self.roi_margin
+        my = (y1 - y0) * self.roi_margin
+        h, w = frame_shape[:2]
+        with self._lock:
+            self._roi = (max(0, int(x0 - mx)), max(0, int(y0 - my)),
+                         min(w, int(x1 + mx)), min(h, int(y1 + my)))
+            self._roi_ts = time.monotonic()
+
+    def clear_roi(self):
+        with self._lock:
+            self._roi = None
+
+    def _current_roi(self):
+        with self._lock:
+            if self._roi is not None and time.monotonic() - self._roi_ts > self.roi_hold_secs:
+                self._roi = None
+            return self._roi
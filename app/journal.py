@@ -0,0 +1,298 @@
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+import logging
+from app.server import get_client
+from app.metrics import counter
+
+UPLOADED_SCANS = counter("passito_journal_uploaded_scans_total",
+                         "Journaled scans sent by the background uploader, by outcome", ("status",))
+
+# Value of `acked` for rows the server kept rejecting; they are kept for inspection but never resent
+DEAD_LETTER = 2
+# Client errors that are about the device or the moment (auth, timeout, throttling), not the rows sent
+_TRANSIENT_4XX = (401, 403, 408, 425, 429)
+
+
+def rejected(resp):
+    """True if the server refused a request outright (4xx), so resending it unchanged cannot help."""
+    status = resp.get("status_code") if isinstance(resp, dict) else None
+    return status is not None and 400 <= status < 500 and status not in _TRANSIENT_4XX
+
+
+class ScanJournal:
+    """Durable local journal of verified scans backed by SQLite in WAL mode.
+
+    Every verified scan is appended before any network call, so nothing is lost
+    when the API is unreachable. Rows stay pending until the server acknowledges
+    them, either through the live sync or the background uploader. `attempts`
+    counts how often the server rejected a row on its own; past the uploader's
+    limit the row is dead-lettered so it no longer blocks the rows behind it.
+    """
+
+    def __init__(self, path="scans.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL + synchronous=NORMAL batches fsyncs at checkpoint time instead of per insert
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scans ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " data TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " acked INTEGER NOT NULL DEFAULT 0,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " meta TEXT)")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(scans)")]
+        if "meta" not in columns:
+            # Journals created before per-camera metadata existed
+            self._conn.execute("ALTER TABLE scans ADD COLUMN meta TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scans_pending ON scans (acked, id)")
+
+    def append(self, data, meta=None):
+        """Record a verified scan (with optional gate/action metadata) and return its idempotency key."""
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("INSERT INTO scans (key, data, created, meta) VALUES (?, ?, ?, ?)",
+                               (key, data, time.time(), json.dumps(meta) if meta else None))
+        return key
+
+    def ack(self, keys):
+        if not keys:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE scans SET acked = 1 WHERE key = ?", [(k,) for k in keys])
+
+    def pending(self, limit=200, older_than=0.0):
+        """Return up to `limit` unacknowledged scans as (key, data, created, meta), oldest first."""
+        cutoff = time.time() - older_than
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, data, created, meta FROM scans WHERE acked = 0 AND created <= ?"
+                " ORDER BY id LIMIT ?", (cutoff, limit)).fetchall()
+        return [(key, data, created, json.loads(meta) if meta else {}) for key, data, created, meta in rows]
+
+    def mark_attempt(self, keys):
+        with self._lock:
+            self._conn.executemany("UPDATE scans SET attempts = attempts + 1 WHERE key = ?",
+                                   [(k,) for k in keys])
+
+    def dead_letter(self, keys, max_attempts):
+        """Retire the pending rows among `keys` rejected at least `max_attempts` times; returns how many."""
+        with self._lock:
+            cur = self._conn.executemany(
+                "UPDATE scans SET acked = ? WHERE key = ? AND acked = 0 AND attempts >= ?",
+                [(DEAD_LETTER, k, max_attempts) for k in keys])
+            return cur.rowcount
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scans WHERE acked = 0").fetchone()[0]
+
+    def dead_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scans WHERE acked = ?", (DEAD_LETTER,)).fetchone()[0]
+
+    def prune(self, max_age_secs=7 * 86400):
+        """Delete acknowledged rows older than `max_age_secs`."""
+        with self._lock:
+            self._conn.execute("DELETE FROM scans WHERE acked = 1 AND created < ?",
+                               (time.time() - max_age_secs,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JournalUploader:
+    """Background thread that drains pending journal rows to the bulk sync endpoint.
+
+    Batches carry per-item idempotency keys so a batch that is retried after a
+    timeout cannot be double-counted by the server. Failures back off
+    exponentially with jitter; pending rows survive restarts and are resumed.
+    `sync` is the DataSync whose bulk/gzip support detection is shared: when
+    the server has no bulk endpoint, rows go out as single requests to its
+    per-scan endpoint instead.
+
+    A batch the server rejects with a client error is halved until the bad
+    rows are isolated; a row rejected on its own `max_attempts` times is
+    dead-lettered, so one bad scan never holds back the rest of the journal.
+
+    The upload logic lives in `drain`, which does no network I/O itself, so
+    the async runtime drives the same code with its own client.
+    """
+
+    def __init__(self, journal, api_url, auth_token, endpoint="sync_bulk", batch_size=200,
+                 interval=5.0, grace_secs=10.0, max_backoff=300.0, sync=None, max_attempts=5):
+        self.journal = journal
+        self.api_url = api_url
+        self.auth_token = auth_token
+        self.endpoint = endpoint
+        self.sync = sync
+        self.batch_size = batch_size
+        self.interval = interval
+        # Leave fresh rows to the live sync path for a little while
+        self.grace_secs = grace_secs
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._backoff = 0.0
+        # Shrinks while a rejected batch is being bisected, grows back on success
+        self._limit = batch_size
+        self._last_prune = 0.0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="journal-uploader", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                drained = self.drain_once()
+                self.maybe_prune()
+            except sqlite3.Error as e:
+                logging.error("Scan journal error: %s", str(e))
+                drained = False
+            self._wake.wait(self.delay_after(drained))
+            self._wake.clear()
+
+    def delay_after(self, drained):
+        """Seconds to wait after a drain that returned `drained`."""
+        if drained is None:
+            return self.interval
+        return 0.0 if drained else self._backoff
+
+    def maybe_prune(self):
+        if time.time() - self._last_prune > 3600:
+            self.journal.prune()
+            self._last_prune = time.time()
+
+    def drain_once(self):
+        """Upload one batch. Returns True on success, False on failure, None if idle."""
+        client = get_client(self.api_url, self.auth_token)
+        steps = self.drain(client.features)
+        request, result = step(steps)
+        while request is not None:
+            endpoint, body, headers, compress = request
+            request, result = step(steps, client.request(endpoint, body, headers=headers, compress=compress))
+        return result
+
+    def drain(self, features):
+        """Generator behind drain_once, given the features the server listed.
+
+        Yields (endpoint, body, headers, compress) for each request to make and
+        expects its response sent back; returns what drain_once returns. Use
+        `step` to drive it.
+        """
+        rows = self.journal.pending(limit=self._limit, older_than=self.grace_secs)
+        if not rows:
+            return None
+        result = None
+        if self.sync is None or self.sync.bulk_allowed(features):
+            result = yield from self._upload_bulk(features, rows)
+        if result is None:
+            result = yield from self._upload_single(rows)
+        if result == "rejected":
+            if len(rows) > 1:
+                self._limit = max(1, len(rows) // 2)
+                self._backoff = 0.0
+                logging.warning("Server rejected a batch of %d journaled scans; retrying in batches of %d",
+                                len(rows), self._limit)
+                return False
+            self._reject([rows[0][0]])
+            result = False
+        if result:
+            self._backoff = 0.0
+            self._limit = min(self.batch_size, self._limit * 2)
+        else:
+            self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2)) * random.uniform(0.8, 1.2)
+            logging.warning("Upload of journaled scans failed; retrying in %.0f s", self._backoff)
+        return result
+
+    def _reject(self, keys):
+        """Count a rejection of rows sent on their own and dead-letter those past the limit."""
+        self.journal.mark_attempt(keys)
+        UPLOADED_SCANS.labels("rejected").inc(len(keys))
+        dead = self.journal.dead_letter(keys, self.max_attempts)
+        if dead:
+            UPLOADED_SCANS.labels("dead_lettered").inc(dead)
+            logging.error("Dead-lettered %d journaled scan(s) the server rejected %d times.", dead, self.max_attempts)
+
+    def _upload_bulk(self, features, rows):
+        """One bulk request for the rows.
+
+        Returns True or False, "rejected" on a client error, or None if the
+        server lacks the endpoint.
+        """
+        keys = [r[0] for r in rows]
+        items = [dict(meta, id=key, data=data, scanned_at=created) for key, data, created, meta in rows]
+        features = features or ()
+        compress = self.sync.gzip_allowed(features) if self.sync is not None else "gzip" in features
+        resp = yield (self.endpoint, {"items": items}, {"Idempotency-Key": keys[0] + "-" + keys[-1]}, compress)
+        if not resp or (isinstance(resp, dict) and resp.get("error")):
+            if self.sync is not None:
+                action = self.sync.bulk_rejected(resp.get("status_code") if isinstance(resp, dict) else None,
+                                                 compress)
+                if action == "plain":
+                    return (yield from self._upload_bulk(features, rows))
+                if action == "single":
+                    return None
+            if rejected(resp):
+                return "rejected"
+            UPLOADED_SCANS.labels("failed").inc(len(items))
+            return False
+        self.journal.ack(keys)
+        UPLOADED_SCANS.labels("ok").inc(len(items))
+        logging.info("Uploaded %d journaled scans.", len(items))
+        return True
+
+    def _upload_single(self, rows):
+        """Send the rows one by one to the per-scan endpoint, stopping at the first transient failure."""
+        endpoint = self.sync.endpoint if self.sync is not None else "sync"
+        acked, ok = [], True
+        for done, (key, data, created, meta) in enumerate(rows):
+            resp = yield (endpoint, dict(meta, id=key, data=data, scanned_at=created), {"Idempotency-Key": key},
+                          False)
+            if rejected(resp):
+                self._reject([key])
+                continue
+            if not resp or (isinstance(resp, dict) and resp.get("error")):
+                UPLOADED_SCANS.labels("failed").inc(len(rows) - done)
+                ok = False
+                break
+            acked.append(key)
+        self.journal.ack(acked)
+        UPLOADED_SCANS.labels("ok").inc(len(acked))
+        if acked:
+            logging.info("Uploaded %d journaled scans one by one.", len(acked))
+        return ok
+
+
+def step(steps, response=None):
+    """Resume a JournalUploader.drain generator with the last response.
+
+    Returns (request, None) while it has a request to make, then (None, result).
+    """
+    try:
+        return steps.send(response), None
+    except StopIteration as done:
+        return None, done.value
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import tempfile
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from app.auth import register_device
+from app.crypto import PassCrypto
+from app.journal import ScanJournal, UPLOADED_SCANS
+from app.metrics import standalone_histogram
+from app.server import get_client, API_LATENCY, API_RETRIES
+from app.stub import StubApiServer
+from app.sync import DataSync, answered
+
+
+class VirtualVerifier:
+    """One simulated gate: registers, heartbeats and syncs synthetic encrypted passes.
+
+    Each verifier has its own auth token (so its own pooled API session),
+    machine id, registration file and scan journal, and goes through the same
+    register_device, DataSync and JournalUploader code as a real device.
+    Scans arrive as a Poisson process at `scan_rate` per second.
+    """
+
+    def __init__(self, index, api_url, crypto, workdir, scan_rate=0.5, heartbeat_secs=10.0, sync_rate=None):
+        self.index = index
+        self.api_url = api_url
+        self.crypto = crypto
+        self.token = f"loadtest-{index:04d}"
+        self.machine_id = uuid.UUID(int=index + 1).hex
+        self.config_path = os.path.join(workdir, f"verifier-{index:04d}.json")
+        self.journal = ScanJournal(os.path.join(workdir, f"verifier-{index:04d}.db"))
+        self.scan_rate = scan_rate
+        self.heartbeat_secs = heartbeat_secs
+        self.sync_rate = sync_rate
+        self.sync = None
+        self.latency = standalone_histogram()
+        self.counts = {"register_attempts": 0, "scans": 0, "live_ok": 0, "live_failed": 0,
+                       "heartbeat_ok": 0, "heartbeat_failed": 0, "decrypt_failed": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _register(self, until):
+        # A real device exits when registration fails and is restarted by its supervisor
+        while time.time() < until:
+            self._count("register_attempts")
+            try:
+                if register_device(self.api_url, self.token, config_path=self.config_path,
+                                   machine_id=self.machine_id, ip_address="127.0.0.1"):
+                    return True
+            except SystemExit:
+                pass
+            time.sleep(2.0)
+        return False
+
+    def _scan(self):
+        pass_id = uuid.uuid4().hex[:12]
+        encrypted = self.crypto.encrypt(json.dumps({"id": pass_id, "sid": f"v{self.index:04d}"}))
+        result = self.crypto.decrypt(encrypted)
+        if not result.ok:
+            self._count("decrypt_failed")
+            return
+        data = json.dumps(json.loads(result.plaintext), separators=(',', ':'))
+        self._count("scans")
+        key = self.sync.record(data)
+        t0 = time.perf_counter()
+
+        def _on_verdict(fut):
+            if fut.result() is None:
+                self._count("live_failed")
+            else:
+                self._count("live_ok")
+                self.latency.observe(time.perf_counter() - t0)
+
+        self.sync.sync_with_server(data, key=key, callback=_on_verdict)
+
+    def run(self, scan_until, stop):
+        if not self._register(scan_until):
+            return
+        self.sync = DataSync(api_url=self.api_url, auth_token=self.token, journal=self.journal,
+                             rate=self.sync_rate)
+        client = get_client(self.api_url, self.token)
+        now = time.time()
+        # Spread the fleet's heartbeats instead of firing them in lockstep
+        next_beat = now + random.uniform(0, self.heartbeat_secs)
+        next_scan = now + random.expovariate(self.scan_rate) if self.scan_rate > 0 else float("inf")
+        while not stop.is_set():
+            now = time.time()
+            if now >= scan_until:
+                break
+            if now >= next_beat:
+                self._count("heartbeat_ok" if answered(client.is_active(self.machine_id)) else "heartbeat_failed")
+                next_beat = now + self.heartbeat_secs
+            if now >= next_scan:
+                self._scan()
+                next_scan = now + random.expovariate(self.scan_rate)
+            stop.wait(max(0.0, min(next_beat, next_scan, scan_until) - time.time()))
+
+    def pending(self):
+        return self.journal.pending_count()
+
+    def close(self):
+        if self.sync is not None:
+            self.sync.close()
+        self.journal.close()
+
+
+def _client_metrics():
+    # Process-wide client metrics; a worker forked from a busy parent starts with the parent's values
+    api = {labels: child.state() for labels, child in API_LATENCY.samples()}
+    retries = sum(child.value for _, child in API_RETRIES.samples())
+    uploaded = sum(child.value for (status,), child in UPLOADED_SCANS.samples() if status == "ok")
+    return api, retries, uploaded
+
+
+def run_verifiers(spec):
+    """Run a group of virtual verifiers in this process and return picklable results.
+
+    Scans stop at `scan_until`; the journals are then given up to
+    `drain_timeout` seconds to upload their backlog. Backlog (journaled scans
+    the server has not acknowledged) is sampled twice a second.
+    """
+    crypto = PassCrypto(spec["secrets"])
+    verifiers = [VirtualVerifier(i, spec["api_url"], crypto, spec["workdir"], scan_rate=spec["scan_rate"],
+                                 heartbeat_secs=spec["heartbeat_secs"], sync_rate=spec["sync_rate"])
+                 for i in spec["indices"]]
+    base_api, base_retries, base_uploaded = _client_metrics()
+    stop = threading.Event()
+    threads = [threading.Thread(target=v.run, args=(spec["scan_until"], stop), name=f"verifier-{v.index}",
+                                daemon=True) for v in verifiers]
+    for t in threads:
+        t.start()
+    backlog = []
+    drain_deadline = spec["scan_until"] + spec["drain_timeout"]
+    while True:
+        now = time.time()
+        pending = sum(v.pending() for v in verifiers)
+        backlog.append((now, pending))
+        if now >= drain_deadline or (now >= spec["scan_until"] and pending == 0):
+            break
+        time.sleep(0.5)
+    stop.set()
+    for t in threads:
+        t.join(timeout=5.0)
+
+    counts = {}
+    latency = standalone_histogram()
+    for v in verifiers:
+        for name, n in v.counts.items():
+            counts[name] = counts.get(name, 0) + n
+        latency.merge(v.latency.state())
+        v.close()
+    counts["registered"] = sum(1 for v in verifiers if v.sync is not None)
+    api_states, retries, uploaded = _client_metrics()
+    api = {}
+    for (endpoint, status), state in api_states.items():
+        before = base_api.get((endpoint, status))
+        if before is not None:
+            # Only this run's observations
+            counts_now, n, total, peak = state
+            state = ([a - b for a, b in zip(counts_now, before[0])], n - before[1], total - before[2], peak)
+        entry = api.setdefault(endpoint, {"statuses": {}, "state": None})
+        entry["statuses"][status] = entry["statuses"].get(status, 0) + state[1]
+        merged = standalone_histogram()
+        if entry["state"] is not None:
+            merged.merge(entry["state"])
+        merged.merge(state)
+        entry["state"] = merged.state()
+    return {"counts": counts, "latency": latency.state(), "api": api, "backlog": backlog,
+            "retries": retries - base_retries, "uploaded": uploaded - base_uploaded}
+
+
+def _summary(state):
+    child = standalone_histogram()
+    child.merge(state)
+    if not child.count:
+        return {"count": 0}
+    out = {"count": child.count, "mean_ms": round(child.sum / child.count * 1000, 3)}
+    for p in (50, 95, 99):
+        out[f"p{p}_ms"] = round(child.percentile(p) * 1000, 3)
+    out["max_ms"] = round(child.max * 1000, 3)
+    return out
+
+
+class LoadTest:
+    """Runs a fleet of virtual verifiers against a local stub API with injected faults.
+
+    Verifiers are split across `processes` worker processes (1 runs them as
+    threads in this process). The report covers client throughput, scan and
+    API tail latency, retry amplification (requests the server saw per
+    request the clients made) and how long the journal backlog took to drain
+    after an outage.
+    """
+
+    def __init__(self, verifiers=10, processes=1, duration=30.0, scan_rate=0.5, heartbeat_secs=10.0,
+                 latency=0.02, jitter=0.0, error_rate=0.0, outage=None, drain_timeout=120.0,
+                 sync_rate=None, secrets=None):
+        self.verifiers = verifiers
+        self.processes = max(1, min(processes, verifiers))
+        self.duration = duration
+        self.scan_rate = scan_rate
+        self.heartbeat_secs = heartbeat_secs
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # (start, seconds) relative to the start of the run
+        self.outage = outage
+        self.drain_timeout = drain_timeout
+        self.sync_rate = sync_rate
+        self.secrets = secrets or os.getenv("PASS_SECRETS", "passito").split(",")
+
+    def run(self):
+        stub = StubApiServer(latency=self.latency, jitter=self.jitter, error_rate=self.error_rate).start()
+        workdir = tempfile.mkdtemp(prefix="passito-loadtest-")
+        t0 = time.time()
+        outage = None
+        if self.outage:
+            outage = (t0 + self.outage[0], t0 + self.outage[0] + self.outage[1])
+            stub.outage(outage[0], self.outage[1])
+        groups = [list(range(self.verifiers))[i::self.processes] for i in range(self.processes)]
+        specs = [{"indices": g, "api_url": stub.url, "secrets": self.secrets, "workdir": workdir,
+                  "scan_rate": self.scan_rate, "heartbeat_secs": self.heartbeat_secs,
+                  "sync_rate": self.sync_rate, "scan_until": t0 + self.duration,
+                  "drain_timeout": self.drain_timeout} for g in groups]
+        logging.info("Load test: %d verifiers in %d process(es) for %.0f s against %s",
+                     self.verifiers, self.processes, self.duration, stub.url)
+        try:
+            if self.processes == 1:
+                results = [run_verifiers(specs[0])]
+            else:
+                with ProcessPoolExecutor(max_workers=self.processes) as pool:
+                    results = list(pool.map(run_verifiers, specs))
+        finally:
+            stub.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+        return self._report(results, stub, t0, outage)
+
+    def _report(self, results, stub, t0, outage):
+        counts, api, latency = {}, {}, standalone_histogram()
+        retries = uploaded = 0
+        for r in results:
+            for name, n in r["counts"].items():
+                counts[name] = counts.get(name, 0) + n
+            latency.merge(r["latency"])
+            retries += r["retries"]
+            uploaded += r["uploaded"]
+            for endpoint, entry in r["api"].items():
+                into = api.setdefault(endpoint, {"statuses": {}, "hist": standalone_histogram()})
+                for status, n in entry["statuses"].items():
+                    into["statuses"][status] = into["statuses"].get(status, 0) + n
+                into["hist"].merge(entry["state"])
+        client_requests = sum(e["hist"].count for e in api.values())
+        server_requests = sum(stub.counts.values())
+
+        # Fleet backlog per second: each process's highest sample in that second, summed;
+        # `settled` sums each process's last sample instead, so a drain late in a second still counts
+        per_second, settled = {}, {}
+        for r in results:
+            seen, last = {}, {}
+            for ts, pending in r["backlog"]:
+                sec = int(ts - t0)
+                seen[sec] = max(seen.get(sec, 0), pending)
+                last[sec] = pending
+            for sec in seen:
+                per_second[sec] = per_second.get(sec, 0) + seen[sec]
+                settled[sec] = settled.get(sec, 0) + last[sec]
+        timeline = [per_second[s] for s in sorted(per_second)]
+        recovery = None
+        if outage:
+            # Recovered once the backlog is back to what it was before the outage
+            start, end = outage[0] - t0, outage[1] - t0
+            baseline = max([n for s, n in per_second.items() if s < start] or [0])
+            recovery = next((s + 1 - end for s in sorted(settled) if s >= end and settled[s] <= baseline), None)
+
+        peak_rps = max(stub.timeline.values()) if stub.timeline else 0
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": {"verifiers": self.verifiers, "processes": self.processes, "duration": self.duration,
+                       "scan_rate": self.scan_rate, "heartbeat_secs": self.heartbeat_secs,
+                       "latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate,
+                       "outage": list(self.outage) if self.outage else None, "sync_rate": self.sync_rate},
+            "counts": dict(counts, uploaded=uploaded),
+            "throughput": {"scans_per_s": round(counts.get("scans", 0) / self.duration, 2),
+                           "live_verdicts_per_s": round(counts.get("live_ok", 0) / self.duration, 2)},
+            "scan_latency": _summary(latency.state()),
+            "api": {endpoint: dict(_summary(e["hist"].state()), statuses=e["statuses"])
+                    for endpoint, e in sorted(api.items())},
+            "retries": {"client_retries": retries, "client_requests": client_requests,
+                        "server_requests": server_requests,
+                        "amplification": round(server_requests / client_requests, 2) if client_requests else None,
+                        "peak_server_rps": peak_rps, "server_statuses": stub.statuses},
+            "backlog": {"peak": max(timeline or [0]), "end": sum(r["backlog"][-1][1] for r in results if r["backlog"]),
+                        "recovery_secs": recovery, "per_second": timeline},
+        }
+
+
+def format_report(report):
+    """Human-readable summary of a load test report."""
+    c, t, r, b = report["counts"], report["throughput"], report["retries"], report["backlog"]
+    lines = [f"Verifiers: {c.get('registered', 0)}/{report['config']['verifiers']} registered "
+             f"({c.get('register_attempts', 0)} attempts)",
+             f"Scans: {c.get('scans', 0)} ({t['scans_per_s']}/s)  live verdicts: {c.get('live_ok', 0)} "
+             f"({t['live_verdicts_per_s']}/s)  live failed: {c.get('live_failed', 0)}  "
+             f"uploaded from journal: {c.get('uploaded', 0)}",
+             f"Heartbeats: {c.get('heartbeat_ok', 0)} ok, {c.get('heartbeat_failed', 0)} failed",
+             f"{'latency':<12} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    rows = [("scan", report["scan_latency"])] + list(report["api"].items())
+    for name, s in rows:
+        if s.get("count"):
+            lines.append(f"{name:<12} {s['count']:>7} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+                         f"{s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+    lines.append(f"Requests: {r['client_requests']} client, {r['server_requests']} at server "
+                 f"(x{r['amplification']}), {r['client_retries']} transport retries, "
+                 f"peak {r['peak_server_rps']} req/s, statuses {r['server_statuses']}")
+    recovery = "n/a" if b["recovery_secs"] is None else f"{b['recovery_secs']} s"
+    lines.append(f"Backlog: peak {b['peak']}, end {b['end']}, recovery after outage {recovery}")
+    return "\n".join(lines)
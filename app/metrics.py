@@ -0,0 +1,348 @@
+import json
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Histogram resolution: 2**SUB_BITS buckets per power of two (~12% relative error)
+SUB_BITS = 3
+_SUB = 1 << SUB_BITS
+_LINEAR = _SUB * 2
+# Values are recorded in microseconds and clamped at ~19 hours
+_MAX_US = (1 << 36) - 1
+_NBUCKETS = _SUB * (36 - SUB_BITS) + _SUB
+
+# Exported `le` boundaries in seconds, fixed so dashboards can aggregate across devices
+EXPORT_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _bucket_index(us):
+    if us < _LINEAR:
+        return us
+    shift = us.bit_length() - SUB_BITS - 1
+    return _SUB * shift + (us >> shift)
+
+
+def _bucket_upper(idx):
+    """Exclusive upper bound, in microseconds, of a bucket."""
+    if idx < _LINEAR:
+        return idx + 1
+    shift = idx // _SUB - 1
+    return (idx % _SUB + _SUB + 1) << shift
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild:
+    """Log-linear (HDR-style) histogram of durations with bounded relative error."""
+
+    __slots__ = ("counts", "count", "sum", "max", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * _NBUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        idx = _bucket_index(min(_MAX_US, max(0, int(seconds * 1e6))))
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def state(self):
+        """Picklable (counts, count, sum, max), e.g. to combine histograms from worker processes."""
+        with self._lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    def merge(self, state):
+        """Add the observations of another histogram's `state()`."""
+        counts, count, total, peak = state
+        with self._lock:
+            for idx, n in enumerate(counts):
+                if n:
+                    self.counts[idx] += n
+            self.count += count
+            self.sum += total
+            self.max = max(self.max, peak)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in seconds."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = max(1, int(total * p / 100.0 + 0.5))
+        seen = 0
+        for idx, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return min(_bucket_upper(idx) / 1e6, self.max)
+        return self.max
+
+    def cumulative(self, bounds=EXPORT_BOUNDS):
+        """Counts at or below each bound, for Prometheus `le` buckets."""
+        with self._lock:
+            counts = list(self.counts)
+        out, seen, idx = [], 0, 0
+        for bound in bounds:
+            limit = bound * 1e6
+            while idx < _NBUCKETS and _bucket_upper(idx) <= limit:
+                seen += counts[idx]
+                idx += 1
+            out.append(seen)
+        return out
+
+
+class Metric:
+    """A named metric family; `labels(...)` returns the child to update on the hot path."""
+
+    kind = None
+    child_class = None
+
+    def __init__(self, name, help_text="", labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._callback = None
+        if not self.labelnames:
+            self._children[()] = self.child_class()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self.child_class())
+        return child
+
+    def set_function(self, fn):
+        """Read values at scrape time from fn(): a number, or {label_values_tuple: number}."""
+        self._callback = fn
+        return self
+
+    def samples(self):
+        """[(label_values, child_or_value)] for export."""
+        if self._callback is not None:
+            try:
+                value = self._callback()
+            except Exception as e:
+                logging.debug("Metric %s callback failed: %s", self.name, e)
+                return []
+            if isinstance(value, dict):
+                return [(tuple(str(v) for v in k) if isinstance(k, tuple) else (str(k),), v)
+                        for k, v in value.items()]
+            return [((), value)]
+        return list(self._children.items())
+
+
+class Counter(Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, n=1):
+        self._children[()].inc(n)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def set(self, value):
+        self._children[()].set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    child_class = _HistogramChild
+
+    def observe(self, seconds):
+        self._children[()].observe(seconds)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                          for k, v in pairs) + "}"
+
+
+class Registry:
+    """Get-or-create store of metric families, rendered as Prometheus text or a JSON snapshot."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames)
+            return metric
+
+    def counter(self, name, help_text="", labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text="", labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text="", labelnames=()):
+        return self._get(Histogram, name, help_text, labelnames)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for values, child in m.samples():
+                if isinstance(child, _HistogramChild):
+                    for bound, n in zip(EXPORT_BOUNDS, child.cumulative()):
+                        lines.append(f"{m.name}_bucket{_fmt_labels(m.labelnames, values, ('le', bound))} {n}")
+                    lines.append(f"{m.name}_bucket{_fmt_labels(m.labelnames, values, ('le', '+Inf'))} "
+                                 f"{child.count}")
+                    lines.append(f"{m.name}_sum{_fmt_labels(m.labelnames, values)} {child.sum:.6f}")
+                    lines.append(f"{m.name}_count{_fmt_labels(m.labelnames, values)} {child.count}")
+                else:
+                    value = getattr(child, "value", child)
+                    lines.append(f"{m.name}{_fmt_labels(m.labelnames, values)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Plain dict of every metric; histograms carry count, mean and p50/p95/p99/max in ms."""
+        out = {}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            series = []
+            for values, child in m.samples():
+                labels = dict(zip(m.labelnames, values))
+                if isinstance(child, _HistogramChild):
+                    if not child.count:
+                        continue
+                    entry = {"count": child.count, "mean_ms": round(child.sum / child.count * 1000, 3)}
+                    for p in (50, 95, 99):
+                        entry[f"p{p}_ms"] = round(child.percentile(p) * 1000, 3)
+                    entry["max_ms"] = round(child.max * 1000, 3)
+                    series.append(dict(labels=labels, **entry))
+                else:
+                    series.append({"labels": labels, "value": getattr(child, "value", child)})
+            out[m.name] = {"type": m.kind, "help": m.help, "series": series}
+        return out
+
+
+REGISTRY = Registry()
+
+
+# Shorthands for the process-wide registry
+def counter(name, help_text="", labelnames=()):
+    return REGISTRY.counter(name, help_text, labelnames)
+
+
+def gauge(name, help_text="", labelnames=()):
+    return REGISTRY.gauge(name, help_text, labelnames)
+
+
+def histogram(name, help_text="", labelnames=()):
+    return REGISTRY.histogram(name, help_text, labelnames)
+
+
+def standalone_histogram():
+    """A log-linear histogram outside any registry, never exported.
+
+    For tools that keep their own distributions, e.g. to merge `state()`s
+    collected from worker processes.
+    """
+    return _HistogramChild()
+
+
+def format_snapshot(snapshot):
+    """Human-readable dump of Registry.snapshot() output, one series per line."""
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        for entry in metric["series"]:
+            labels = ",".join(f"{k}={v}" for k, v in entry["labels"].items())
+            label = f"{name}{{{labels}}}" if labels else name
+            if metric["type"] == "histogram":
+                lines.append(f"{label:<60} n={entry['count']} mean={entry['mean_ms']}ms "
+                             f"p50={entry['p50_ms']}ms p95={entry['p95_ms']}ms p99={entry['p99_ms']}ms "
+                             f"max={entry['max_ms']}ms")
+            else:
+                lines.append(f"{label:<60} {entry['value']}")
+    return "\n".join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        registry = self.server.registry
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/metrics":
+            body, ctype = registry.render().encode(), "text/plain; version=0.0.4"
+        elif path == "/metrics.json":
+            body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logging.debug("metrics: " + fmt, *args)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves /metrics (Prometheus text) and /metrics.json from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, port, host="127.0.0.1", registry=None):
+        super().__init__((host, port), _MetricsHandler)
+        self.registry = registry or REGISTRY
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        logging.info("Metrics available at http://%s:%d/metrics", *self.server_address[:2])
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,291 @@
+import os
+import mmap
+import time
+import struct
+import hashlib
+import threading
+import logging
+from datetime import datetime, timezone
+from app.server import get_client
+from app.system import get_machine_id
+from app.metrics import counter
+
+MAGIC = b"PSLIST1\0"
+# magic, version, fetched_at, nslots, count, etag, cursor
+HEADER = struct.Struct("<8sQdII64s64s")
+# Offset of fetched_at in HEADER, rewritten in place when the server confirms the list
+FETCHED_AT = struct.Struct("<d")
+FETCHED_AT_OFFSET = struct.calcsize("<8sQ")
+# key digest, expiry (unix seconds, 0 = none), state
+ENTRY = struct.Struct("<16sIB3x")
+EMPTY_KEY = bytes(16)
+MAX_EXPIRES = (1 << 32) - 1
+
+VALID = 1
+REVOKED = 2
+
+LOCAL_VERDICTS = counter("passito_local_verdicts_total", "Scans decided from the local pass list", ("result",))
+
+
+def pass_digest(pass_id):
+    """Fixed-size index key for a pass id."""
+    return hashlib.blake2b(str(pass_id).encode(), digest_size=16).digest()
+
+
+def _slot_count(count):
+    # Power of two at no more than 50% load keeps linear probes short
+    n = 16
+    while n < count * 2:
+        n <<= 1
+    return n
+
+
+class PassIndex:
+    """Read-only, memory-mapped hash index of pass states, replaced atomically on update.
+
+    The file is a fixed header followed by an open-addressing table of 24-byte
+    entries, so a lookup is one hash and, on average, one or two slot reads
+    without parsing or loading the whole list into Python objects.
+    """
+
+    def __init__(self, path="passes.idx"):
+        self.path = path
+        self.version = 0
+        self.fetched_at = 0.0
+        self.count = 0
+        self.etag = None
+        self.cursor = None
+        self._mm = None
+        self._mask = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Map the current file; keeps the previous mapping if the file is missing or invalid."""
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(mm) < HEADER.size:
+            logging.warning("Ignoring truncated pass index %s", self.path)
+            return False
+        magic, version, fetched_at, nslots, count, etag, cursor = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or len(mm) < HEADER.size + nslots * ENTRY.size:
+            logging.warning("Ignoring invalid pass index %s", self.path)
+            return False
+        with self._lock:
+            # The old mapping is not closed here: a concurrent lookup may still be reading it
+            self._mm, self._mask = mm, nslots - 1
+            self.version, self.fetched_at, self.count = version, fetched_at, count
+            self.etag = etag.rstrip(b"\0").decode() or None
+            self.cursor = cursor.rstrip(b"\0").decode() or None
+        return True
+
+    @property
+    def age(self):
+        """Seconds since the list was last confirmed with the server (inf if never)."""
+        return time.time() - self.fetched_at if self.fetched_at else float("inf")
+
+    def lookup(self, pass_id):
+        """Return (state, expires_at) for a pass id, or None if it is not in the list."""
+        mm, mask = self._mm, self._mask
+        if mm is None:
+            return None
+        key = pass_digest(pass_id)
+        slot = int.from_bytes(key[:8], "little") & mask
+        for _ in range(mask + 1):
+            off = HEADER.size + slot * ENTRY.size
+            stored, expires, state = ENTRY.unpack_from(mm, off)
+            if stored == key:
+                return state, expires
+            if stored == EMPTY_KEY:
+                return None
+            slot = (slot + 1) & mask
+        return None
+
+    def entries(self):
+        """{digest: (state, expires)} for every entry; used to apply deltas."""
+        mm = self._mm
+        out = {}
+        if mm is None:
+            return out
+        for slot in range(self._mask + 1):
+            stored, expires, state = ENTRY.unpack_from(mm, HEADER.size + slot * ENTRY.size)
+            if stored != EMPTY_KEY:
+                out[stored] = (state, expires)
+        return out
+
+    def write(self, entries, version, etag=None, cursor=None, fetched_at=None):
+        """Write a new index file next to the current one, swap it in, and remap."""
+        nslots = _slot_count(len(entries))
+        mask = nslots - 1
+        buf = bytearray(HEADER.size + nslots * ENTRY.size)
+        HEADER.pack_into(buf, 0, MAGIC, version, fetched_at or time.time(), nslots, len(entries),
+                         (etag or "").encode()[:64], (cursor or "").encode()[:64])
+        for key, (state, expires) in entries.items():
+            slot = int.from_bytes(key[:8], "little") & mask
+            while buf[HEADER.size + slot * ENTRY.size:HEADER.size + slot * ENTRY.size + 16] != EMPTY_KEY:
+                slot = (slot + 1) & mask
+            ENTRY.pack_into(buf, HEADER.size + slot * ENTRY.size, key, expires, state)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.reload()
+
+    def touch(self):
+        """Record that the server confirmed the list is current (e.g. a 304), in memory and on disk."""
+        now = time.time()
+        if self._mm is not None:
+            try:
+                # The mapping is shared, so this also updates what lookups and other readers see
+                with open(self.path, "r+b") as f:
+                    f.seek(FETCHED_AT_OFFSET)
+                    f.write(FETCHED_AT.pack(now))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logging.warning("Could not record pass list confirmation in %s: %s", self.path, e)
+        self.fetched_at = now
+
+    def verdict(self, pass_id, max_age):
+        """Local verdict dict for a pass id, or None when the server must decide.
+
+        Unknown passes and a list older than `max_age` seconds fall through to
+        the live sync; listed passes are accepted or denied locally.
+        """
+        if pass_id is None or self.age > max_age:
+            return None
+        found = self.lookup(pass_id)
+        if found is None:
+            LOCAL_VERDICTS.labels("unknown").inc()
+            return None
+        state, expires = found
+        if state == REVOKED:
+            LOCAL_VERDICTS.labels("revoked").inc()
+            return {"status": False, "message": "Pass revoked", "offline": True}
+        if expires and expires < time.time():
+            LOCAL_VERDICTS.labels("expired").inc()
+            return {"status": False, "message": "Pass expired", "offline": True}
+        LOCAL_VERDICTS.labels("valid").inc()
+        return {"status": True, "message": "Verified offline", "offline": True}
+
+
+def normalize_expiry(value):
+    """Unix seconds for an expiry given in seconds, milliseconds or ISO-8601; 0 for none.
+
+    Raises ValueError for anything else, or a time the index cannot store.
+    """
+    if value is None or value == "" or value == 0:
+        return 0
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            value = moment.timestamp()
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"unsupported expiry {value!r}")
+    if value > 1e11:
+        # Milliseconds; seconds will not get this large before the year 5000
+        value /= 1000.0
+    if not 0 <= value <= MAX_EXPIRES:
+        raise ValueError(f"expiry {value!r} out of range")
+    return int(value)
+
+
+def _entry_id(item):
+    # Entries are either bare pass ids or {"id": ..., "expires_at": ...}
+    return item.get("id") if isinstance(item, dict) else item
+
+
+class PassListSync:
+    """Keeps a PassIndex current by polling the server for snapshots or deltas.
+
+    Each poll sends the last version cursor and an If-None-Match ETag. The
+    server answers 304 when nothing changed, or a body with
+    {"version", "cursor", "full", "valid": [...], "revoked": [...]}: a full
+    snapshot replaces the list, otherwise the entries are applied as a delta.
+    """
+
+    def __init__(self, index, api_url, auth_token, endpoint="passes", interval=300.0):
+        self.index = index
+        self.api_url = api_url
+        self.auth_token = auth_token
+        self.endpoint = endpoint
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._unsupported = False
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="passlist-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logging.error("Pass list refresh failed: %s", str(e))
+            if self._unsupported:
+                break
+            self._stop.wait(self.interval)
+
+    def refresh_once(self):
+        """Fetch and apply one update. Returns True if the index changed."""
+        index = self.index
+        data = {"machine_id": get_machine_id(), "since": index.cursor if index.version else None}
+        status, body, etag = get_client(self.api_url, self.auth_token).fetch(
+            self.endpoint, data, etag=index.etag if index.version else None)
+        if status == 304:
+            index.touch()
+            return False
+        if status == 404:
+            logging.warning("Server has no /%s endpoint; offline pass list disabled", self.endpoint)
+            self._unsupported = True
+            return False
+        if status != 200 or not isinstance(body, dict):
+            logging.warning("Pass list refresh failed (status %s)", status)
+            return False
+
+        entries = {} if body.get("full", not index.version) else index.entries()
+        skipped = 0
+        for item in body.get("valid") or ():
+            pass_id = _entry_id(item)
+            if pass_id is None:
+                continue
+            try:
+                expires = normalize_expiry(item.get("expires_at") if isinstance(item, dict) else None)
+            except ValueError as e:
+                if not skipped:
+                    logging.warning("Skipping pass list entry %s: %s", pass_id, e)
+                skipped += 1
+                continue
+            entries[pass_digest(pass_id)] = (VALID, expires)
+        for item in body.get("revoked") or ():
+            pass_id = _entry_id(item)
+            if pass_id is not None:
+                entries[pass_digest(pass_id)] = (REVOKED, 0)
+        for item in body.get("removed") or ():
+            entries.pop(pass_digest(_entry_id(item)), None)
+        if skipped > 1:
+            logging.warning("Skipped %d pass list entries with an invalid expiry", skipped)
+
+        version = int(body.get("version") or index.version + 1)
+        index.write(entries, version, etag=etag, cursor=str(body.get("cursor") or version))
+        logging.info("Pass list updated to version %d (%d entries)", version, len(entries))
+        return True
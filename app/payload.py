@@ -0,0 +1,76 @@
+import time
+import base64
+import struct
+from collections import namedtuple
+
+# Compact pass layout, version 1 (big-endian, inside the usual AES-GCM envelope):
+#   byte 0      schema version (1); JSON plaintext always starts with '{', so the two never collide
+#   byte 1      action: 0 any, 1 check-in, 2 check-out
+#   bytes 2-5   expiry as unix seconds, 0 for none
+#   byte 6      pass id length n
+#   bytes 7..   pass id, n bytes of UTF-8
+#   rest        optional extra fields as compact JSON, opaque to the verifier
+COMPACT_V1 = 1
+_HEADER = struct.Struct(">BBIB")
+ACTIONS = (None, "check-in", "check-out")
+
+# Prefix of the text form used in sync payloads, the journal and the scan log
+COMPACT_PREFIX = "pc1:"
+
+# pass_id: str, expires: unix seconds or None, action: "check-in", "check-out" or None
+CompactPass = namedtuple("CompactPass", "pass_id expires action")
+
+
+def is_compact(plaintext):
+    """True if a decrypted payload uses the compact binary layout rather than JSON."""
+    return len(plaintext) > 0 and plaintext[0] == COMPACT_V1
+
+
+def encode_compact(pass_id, expires=None, action=None, extra=b""):
+    """Build a version 1 compact pass plaintext (for issuers, tests and tooling)."""
+    pid = pass_id.encode()
+    if len(pid) > 255:
+        raise ValueError("pass id longer than 255 bytes")
+    return _HEADER.pack(COMPACT_V1, ACTIONS.index(action), int(expires or 0), len(pid)) + pid + extra
+
+
+def parse_compact(plaintext):
+    """Read pass id, expiry and action straight from the fixed header; raises ValueError if malformed.
+
+    Nothing past the pass id is decoded. The plaintext bytes themselves are the
+    canonical form, so they serve as the dedup and verdict cache key as is.
+    """
+    if len(plaintext) < _HEADER.size:
+        raise ValueError("compact pass too short")
+    version, action, expires, length = _HEADER.unpack_from(plaintext)
+    if version != COMPACT_V1:
+        raise ValueError(f"unsupported compact pass version {version}")
+    if action >= len(ACTIONS):
+        raise ValueError(f"unknown action code {action}")
+    end = _HEADER.size + length
+    if len(plaintext) < end:
+        raise ValueError("compact pass id truncated")
+    try:
+        pass_id = bytes(plaintext[_HEADER.size:end]).decode()
+    except UnicodeDecodeError:
+        raise ValueError("compact pass id is not valid UTF-8")
+    return CompactPass(pass_id, expires or None, ACTIONS[action])
+
+
+def is_expired(compact, now=None):
+    return compact.expires is not None and compact.expires <= (time.time() if now is None else now)
+
+
+def compact_text(plaintext):
+    """Text form of a compact pass for JSON bodies and logs: 'pc1:' + base64 of the plaintext."""
+    return COMPACT_PREFIX + base64.b64encode(plaintext).decode()
+
+
+def describe(plaintext):
+    """Human-readable form of a decrypted payload, compact or JSON (for the decrypt command)."""
+    if not is_compact(plaintext):
+        return plaintext.decode()
+    compact = parse_compact(plaintext)
+    extra = bytes(plaintext[_HEADER.size + len(compact.pass_id.encode()):])
+    return (f"compact v{COMPACT_V1}: id={compact.pass_id} action={compact.action or 'any'}"
+            f" expires={compact.expires or 'never'}" + (f" extra={extra.decode(errors='replace')}" if extra else ""))
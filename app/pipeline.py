@@ -0,0 +1,143 @@
+import time
+import threading
+import logging
+from collections import deque
+from app.metrics import histogram
+
+STAGE_LATENCY = histogram("passito_stage_seconds", "Scan pipeline stage latency", ("stage",))
+
+
+class DropOldestQueue:
+    """Bounded FIFO that discards the oldest item instead of blocking the producer."""
+
+    def __init__(self, maxsize=4):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None on timeout or after close()."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class StageStats:
+    """Per-stage latency accumulator, reset each time it is reported.
+
+    Every sample also goes into the long-lived passito_stage_seconds histogram.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._hist = STAGE_LATENCY.labels(stage=name)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def record(self, seconds):
+        self._hist.observe(seconds)
+        with self._lock:
+            self._count += 1
+            self._total += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            count, total, peak = self._count, self._total, self._max
+            if reset:
+                self._count, self._total, self._max = 0, 0.0, 0.0
+        avg_ms = (total / count * 1000) if count else 0.0
+        return {"stage": self.name, "count": count, "avg_ms": avg_ms, "max_ms": peak * 1000}
+
+    def time(self):
+        return _StageTimer(self)
+
+
+class _StageTimer:
+    def __init__(self, stats):
+        self._stats = stats
+        self._t0 = 0.0
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stats.record(time.perf_counter() - self._t0)
+        return False
+
+
+def log_stage_stats(stages, interval):
+    """Log one line per stage with count, mean and max latency over the last interval."""
+    for stage in stages:
+        snap = stage.snapshot(reset=True)
+        if snap["count"]:
+            logging.debug("Stage %-8s n=%-4d rate=%.1f/s avg=%.1f ms max=%.1f ms",
+                          snap["stage"], snap["count"], snap["count"] / interval,
+                          snap["avg_ms"], snap["max_ms"])
+
+
+class LatestPerSource:
+    """Newest-item slot per source; consumers are served round-robin across sources.
+
+    With several cameras feeding one decoder pool, a single newest-item slot would
+    let a fast camera overwrite a slow one's frames. Here each source keeps its own
+    newest item and get() returns the one that has waited longest.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, source, item):
+        """Store the newest item for a source; returns the item it replaced, if any."""
+        with self._cond:
+            replaced = self._items.get(source)
+            if replaced is not None:
+                self.dropped += 1
+            # An existing source keeps its place in line; only the payload is refreshed
+            self._items[source] = item
+            self._cond.notify()
+            return replaced
+
+    def get(self, timeout=None):
+        """Return (source, item) for the longest-waiting source, or None."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            source = next(iter(self._items))
+            return source, self._items.pop(source)
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
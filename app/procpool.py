@@ -0,0 +1,189 @@
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from collections import Counter
+from multiprocessing import shared_memory
+import numpy as np
+from app.metrics import counter
+
+WORKER_RESTARTS = counter("passito_decode_worker_restarts_total",
+                          "Decoder processes that died and were replaced")
+
+
+class SharedFrameRing:
+    """Fixed ring of frame slots in one shared-memory block.
+
+    Frames are copied into a free slot with a single memcpy and workers map the
+    same block, so no numpy array is pickled across the process boundary.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+    def view(self, slot, shape, dtype=np.uint8):
+        """numpy view of a slot's frame; valid until the slot is reused."""
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot, frame):
+        self.view(slot, frame.shape, frame.dtype)[...] = frame
+
+    def close(self):
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _worker(ring_name, slots, slot_bytes, decoder_factory, tasks, results):
+    """Worker process: owns one decoder and reads frames out of the shared ring."""
+    import cv2
+    cv2.setLogLevel(0)
+    ring = SharedFrameRing(slots, slot_bytes, name=ring_name)
+    decoder = decoder_factory()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        slot, seq, shape, roi, tag = task
+        frame = ring.view(slot, shape)
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            frame = frame[y0:y1, x0:x1]
+        try:
+            data, points = decoder.decode(frame)
+        except Exception:
+            data, points = None, None
+        # Drop the view before the slot can be reused, and send back only payload and corners
+        del frame
+        results.put((slot, seq, data or None, None if points is None else np.asarray(points).tolist(), tag))
+    ring.close()
+
+
+class ProcessDecodePool:
+    """Pool of decoder processes fed through a SharedFrameRing.
+
+    `submit` copies a frame into a free slot and returns immediately; results
+    come back through `get_result`, which also returns the slot to the ring.
+    With no free slot the frame is dropped, which is the right call for a live
+    camera: a newer frame will follow.
+
+    Each worker has its own task queue, so the pool knows which slots a worker
+    holds. A worker that dies (OOM kill, crash in a native decoder) is replaced
+    and its slots go back to the ring; the frames it held are dropped.
+    """
+
+    def __init__(self, workers, decoder_factory, slot_bytes=640 * 480 * 3, slots=None, check_interval=1.0):
+        self.workers = workers
+        self.slots = slots or workers * 2
+        self.ring = SharedFrameRing(self.slots, slot_bytes)
+        self._free = queue.Queue()
+        for i in range(self.slots):
+            self._free.put(i)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._decoder_factory = decoder_factory
+        self._results = self._ctx.Queue()
+        self._lock = threading.Lock()
+        # slot -> (worker, seq); a result only frees its slot if it matches the current assignment
+        self._assigned = {}
+        self._seq = 0
+        self._procs = [None] * workers
+        self._tasks = [None] * workers
+        for i in range(workers):
+            self._spawn(i)
+        self.check_interval = check_interval
+        self._checked = time.monotonic()
+        self.dropped = 0
+        self.restarts = 0
+        self._warned = False
+
+    def _spawn(self, i):
+        tasks = self._ctx.Queue()
+        proc = self._ctx.Process(target=_worker, name=f"qr-decode-proc-{i}", daemon=True,
+                                 args=(self.ring.name, self.slots, self.ring.slot_bytes, self._decoder_factory,
+                                       tasks, self._results))
+        proc.start()
+        self._procs[i], self._tasks[i] = proc, tasks
+
+    def submit(self, frame, roi=None, tag=None, timeout=None):
+        """Queue a frame for decoding. Returns False if it was dropped."""
+        if frame.nbytes > self.ring.slot_bytes:
+            if not self._warned:
+                logging.warning("Frame of %d bytes exceeds decode slot size (%d); skipping",
+                                frame.nbytes, self.ring.slot_bytes)
+                self._warned = True
+            self.dropped += 1
+            return False
+        try:
+            slot = self._free.get(timeout=timeout) if timeout else self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        self.ring.write(slot, frame)
+        with self._lock:
+            # The worker holding the fewest slots gets the frame
+            load = Counter(worker for worker, _ in self._assigned.values())
+            worker = min(range(self.workers), key=lambda i: load[i])
+            self._seq += 1
+            self._assigned[slot] = (worker, self._seq)
+            self._tasks[worker].put((slot, self._seq, frame.shape, roi, tag))
+        return True
+
+    def get_result(self, timeout=None):
+        """Return (data, points, tag) for the next finished frame, or None on timeout."""
+        self.check_workers()
+        try:
+            slot, seq, data, points, tag = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            current = self._assigned.get(slot)
+            if current is None or current[1] != seq:
+                # The slot was reclaimed from a dead worker after this result was sent
+                return None
+            del self._assigned[slot]
+        self._free.put(slot)
+        if points is not None:
+            points = np.asarray(points, dtype=np.float32)
+        return data, points, tag
+
+    def check_workers(self, force=False):
+        """Replace dead workers and reclaim their slots; runs at most every `check_interval` seconds."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        for i, proc in enumerate(self._procs):
+            if proc.is_alive():
+                continue
+            with self._lock:
+                lost = [slot for slot, (worker, _) in self._assigned.items() if worker == i]
+                for slot in lost:
+                    del self._assigned[slot]
+                # Anything still queued for the dead worker is dropped with it
+                self._tasks[i].cancel_join_thread()
+                self._tasks[i].close()
+                self._spawn(i)
+            for slot in lost:
+                self._free.put(slot)
+            self.dropped += len(lost)
+            self.restarts += 1
+            WORKER_RESTARTS.inc()
+            logging.warning("Decode worker %s exited with code %s; restarted it and reclaimed %d slot(s)",
+                            proc.name, proc.exitcode, len(lost))
+
+    def close(self):
+        for tasks in self._tasks:
+            tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        self.ring.close()
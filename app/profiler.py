@@ -0,0 +1,199 @@
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+
+# Stage of a sample: the innermost frame matching one of these (path fragment, function or None) wins
+STAGE_RULES = (
+    ("Cryptodome/", None, "decrypt"),
+    ("app/crypto.py", None, "decrypt"),
+    ("app/payload.py", None, "normalize"),
+    ("app/cache.py", None, "cache"),
+    ("app/passlist.py", None, "passlist"),
+    ("app/detector.py", "prepare_scan", "normalize"),
+    ("app/decoders.py", None, "decode"),
+    ("app/procpool.py", None, "decode"),
+    ("app/gate.py", None, "gate"),
+    ("app/capture.py", None, "capture"),
+    ("app/adaptive.py", None, "capture"),
+    ("pygame/", None, "feedback"),
+    ("gpiozero/", None, "feedback"),
+    ("app/feedback.py", None, "feedback"),
+    ("requests/", None, "http"),
+    ("urllib3/", None, "http"),
+    ("http/client.py", None, "http"),
+    ("aiohttp/", None, "http"),
+    ("app/server.py", None, "http"),
+    ("app/journal.py", None, "journal"),
+    ("app/scanlog.py", None, "scan_log"),
+    ("app/sync.py", None, "sync"),
+    ("app/metrics.py", None, "metrics"),
+    ("app/control.py", None, "control"),
+    ("app/stub.py", None, "stub"),
+    ("http/server.py", None, "serve"),
+    ("socketserver.py", None, "serve"),
+)
+
+# Fallback by thread name (numbered suffixes stripped) when no frame matches a rule
+THREAD_STAGES = {
+    "qr-capture": "capture", "aio-capture": "capture", "qr-decode": "decode", "aio-decode": "decode",
+    "qr-dispatch": "decode", "qr-collect": "decode", "qr-verify": "verify", "sync-scheduler": "sync",
+    "feedback": "feedback", "journal-uploader": "journal", "scan-log": "scan_log", "api-heartbeat": "http",
+    "passlist-sync": "passlist", "metrics-http": "metrics", "control-socket": "control",
+}
+
+# A thread whose innermost Python frame is in one of these is blocked, not working
+WAIT_FILES = ("threading.py", "queue.py", "selectors.py")
+
+_NUMBERED = re.compile(r"[-_]\d+$")
+# Python's default names, "Thread-3 (target)"
+_DEFAULT_NAME = re.compile(r"^Thread-\d+(?: \((.+)\))?$")
+
+
+def _short_path(filename):
+    filename = filename.replace("\\", "/")
+    for marker in ("site-packages/", "dist-packages/"):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return "/".join(filename.rsplit("/", 2)[-2:])
+
+
+def _thread_group(name):
+    for prefix in THREAD_STAGES:
+        if name.startswith(prefix):
+            return prefix
+    default = _DEFAULT_NAME.match(name)
+    if default:
+        return default.group(1) or "Thread"
+    return _NUMBERED.sub("", name)
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler over every Python thread of this process.
+
+    A daemon thread snapshots all stacks every `interval` seconds for
+    `duration` seconds (0 runs until stop) and attributes each sample to a
+    pipeline stage from the stack itself (STAGE_RULES, then the thread name),
+    or to "wait" when the thread is blocked on a lock, queue or selector.
+    Nothing in the pipeline is instrumented, so the profiler costs nothing
+    until it is started. C calls (cap.read, detectAndDecode, AES, time.sleep)
+    are charged to their Python caller; decodes in --decode-mode process run
+    in other processes and are not sampled.
+
+    Stacks are written in the collapsed format ("stage;thread;frame;... count")
+    that flamegraph.pl, inferno and speedscope read.
+    """
+
+    def __init__(self, duration=30.0, interval=0.01, output="profile.folded", report=True):
+        self.duration = duration
+        self.interval = interval
+        self.output = output
+        # Print the summary to stderr when the duration runs out
+        self.report = report
+        self.stacks = Counter()
+        self.stages = Counter()
+        self.threads = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._written = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        logging.info("Profiling for %s (%.0f Hz) into %s",
+                     f"{self.duration:.0f} s" if self.duration else "the whole run", 1 / self.interval, self.output)
+        return self
+
+    @property
+    def finished(self):
+        return self._written
+
+    def stop(self):
+        """Stop sampling early and write the output; returns the summary."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
+        return self.finish()
+
+    def _run(self):
+        me = threading.get_ident()
+        t0 = time.perf_counter()
+        deadline = t0 + self.duration if self.duration else float("inf")
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self._sample(names.get(ident, f"thread-{ident}"), frame)
+            self.samples += 1
+            self.elapsed = time.perf_counter() - t0
+        if not self._stop.is_set() and self.report:
+            print(format_summary(self.finish()), file=sys.stderr)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = _short_path(code.co_filename)
+            label = self._labels[code] = (f"{code.co_name} ({path})", path, code.co_name)
+        return label
+
+    def _sample(self, thread_name, frame):
+        frames = []
+        while frame is not None:
+            frames.append(self._label(frame.f_code))
+            frame = frame.f_back
+        group = _thread_group(thread_name)
+        stage = None
+        if frames and frames[0][1].rsplit("/", 1)[-1] in WAIT_FILES:
+            stage = "wait"
+        else:
+            # Innermost first
+            for _, path, func in frames:
+                stage = next((s for fragment, fn, s in STAGE_RULES
+                              if fragment in path and (fn is None or fn == func)), None)
+                if stage is not None:
+                    break
+        stage = stage or THREAD_STAGES.get(group, "other")
+        stack = ";".join([stage, group] + [label for label, _, _ in reversed(frames)])
+        self.stacks[stack] += 1
+        self.stages[stage] += 1
+        self.threads[group] += 1
+
+    def summary(self):
+        """Samples and estimated seconds per stage (all threads together) and per thread."""
+        per_sample = self.elapsed / self.samples if self.samples else 0.0
+        total = sum(self.stages.values()) or 1
+
+        def table(counter):
+            return {name: {"samples": n, "seconds": round(n * per_sample, 3), "percent": round(100.0 * n / total, 1)}
+                    for name, n in counter.most_common()}
+
+        return {"duration_s": round(self.elapsed, 3), "samples": self.samples,
+                "interval_ms": round(per_sample * 1000, 3), "output": self.output,
+                "stages": table(self.stages), "threads": table(self.threads)}
+
+    def finish(self):
+        """Write the collapsed stacks once; returns the summary."""
+        with self._lock:
+            if not self._written and self.output:
+                with open(self.output, "w") as f:
+                    for stack, count in sorted(self.stacks.items()):
+                        f.write(f"{stack} {count}\n")
+                self._written = True
+                logging.info("Profile of %d samples written to %s", self.samples, self.output)
+        return self.summary()
+
+
+def format_summary(summary):
+    """Per-stage table of a SamplingProfiler summary."""
+    lines = [f"Profile: {summary['samples']} samples over {summary['duration_s']:.1f} s "
+             f"(every {summary['interval_ms']:.1f} ms) -> {summary['output']}",
+             f"{'stage':<12} {'samples':>8} {'thread-s':>9} {'share':>6}"]
+    for stage, row in summary["stages"].items():
+        lines.append(f"{stage:<12} {row['samples']:>8} {row['seconds']:>9.2f} {row['percent']:>5.1f}%")
+    return "\n".join(lines)
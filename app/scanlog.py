@@ -0,0 +1,279 @@
+import os
+import re
+import gzip
+import json
+import time
+import shutil
+import threading
+import logging
+from collections import deque
+from app.metrics import counter
+
+SCAN_LOG_RECORDS = counter("passito_scan_log_records_total", "Scan log records, by outcome", ("status",))
+
+_SEGMENT = re.compile(r"^scans-(\d{8})\.ndjson(\.gz)?$")
+
+
+def _segment_name(seq, compressed=False):
+    return f"scans-{seq:08d}.ndjson" + (".gz" if compressed else "")
+
+
+def parse_cursor(text):
+    """Parse a 'segment:offset' cursor as printed by `ScanLog.read`; None means the start."""
+    if not text:
+        return None
+    seq, _, offset = text.partition(":")
+    return int(seq), int(offset or 0)
+
+
+def format_cursor(cursor):
+    return f"{cursor[0]}:{cursor[1]}"
+
+
+class ScanLog:
+    """Append-only log of scans as newline-delimited JSON, in size-rotated segments.
+
+    `append` only queues the record; a writer thread serializes whatever has
+    queued up, writes it in one call and fsyncs once per batch (group commit).
+    When the active segment reaches `segment_bytes` it is sealed, gzipped and
+    a new one is started; only the newest `keep` segments are retained. Opening
+    the log lists the directory and stats one file, so startup cost does not
+    depend on how many scans have been recorded. A record torn by a crash
+    mid-write is cut off the active segment on open, and readers skip (and
+    count in `corrupt`) any line that still fails to parse.
+    """
+
+    def __init__(self, directory="scanlog", segment_bytes=4 << 20, keep=16, flush_interval=0.5,
+                 max_pending=10000, fsync=True, readonly=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.keep = max(1, keep)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.dropped = 0
+        self.corrupt = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._file = self._thread = None
+        if readonly:
+            # Readers (e.g. the `scans` command) neither create files nor start a writer
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._clean_compaction()
+        segments = self.segments()
+        self._seq = segments[-1][0] if segments else 1
+        if segments and segments[-1][2]:
+            # The newest segment was already compacted; never append to a gzip file
+            self._seq += 1
+        else:
+            self._truncate_torn(os.path.join(directory, _segment_name(self._seq)))
+        self._file = open(os.path.join(directory, _segment_name(self._seq)), "ab")
+        self._size = self._file.tell()
+        self._thread = threading.Thread(target=self._run, name="scan-log", daemon=True)
+        self._thread.start()
+
+    def segments(self):
+        """[(seq, path, compressed)] of the segments on disk, oldest first."""
+        found = {}
+        if not os.path.isdir(self.directory):
+            return []
+        for name in os.listdir(self.directory):
+            m = _SEGMENT.match(name)
+            if m:
+                seq, compressed = int(m.group(1)), bool(m.group(2))
+                # Mid-compaction both forms exist; the .gz is complete once it has its final name
+                if seq not in found or compressed:
+                    found[seq] = (seq, os.path.join(self.directory, name), compressed)
+        return sorted(found.values())
+
+    def _clean_compaction(self):
+        # Undo what a crash during _compact leaves behind: a half-written .tmp, or a plain
+        # segment next to its finished .gz (readers would otherwise see its records twice)
+        names = set(os.listdir(self.directory))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                stale = _SEGMENT.match(name[:-len(".tmp")]) is not None
+            else:
+                stale = _SEGMENT.match(name) is not None and name + ".gz" in names
+            if stale:
+                logging.warning("Removing scan log leftover %s from an interrupted compaction", path)
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.warning("Could not remove %s: %s", path, e)
+
+    @staticmethod
+    def _truncate_torn(path):
+        # A crash mid-write can leave a partial last record; the next append would merge with it
+        try:
+            f = open(path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                logging.warning("Dropping %d bytes of a torn record at the end of %s", size - end, path)
+                f.truncate(end)
+
+    def append(self, record):
+        """Queue one record (a JSON-serializable dict); never blocks on disk I/O."""
+        with self._cond:
+            if self._closed or self._thread is None:
+                return
+            if len(self._queue) >= self.max_pending:
+                # The disk cannot keep up; keep the newest scans
+                self._queue.popleft()
+                self.dropped += 1
+                SCAN_LOG_RECORDS.labels("dropped").inc()
+            self._queue.append(record)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                closed = self._closed
+            if not closed:
+                # Let a burst of scans accumulate so it costs one write and one fsync
+                time.sleep(self.flush_interval)
+            with self._cond:
+                batch = list(self._queue)
+                self._queue.clear()
+            if batch:
+                try:
+                    self._write(batch)
+                except (OSError, TypeError, ValueError) as e:
+                    logging.error("Scan log write failed: %s", str(e))
+            if closed:
+                break
+        self._file.close()
+
+    def _write(self, batch):
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch).encode()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._size += len(data)
+        SCAN_LOG_RECORDS.labels("written").inc(len(batch))
+        if self._size >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        sealed = self._file.name
+        self._file.close()
+        self._seq += 1
+        self._file = open(os.path.join(self.directory, _segment_name(self._seq)), "ab")
+        self._size = 0
+        self._compact(sealed)
+
+    def _compact(self, sealed):
+        # Sealed segments are never written again, so they are gzipped and old ones dropped
+        try:
+            with open(sealed, "rb") as src, gzip.open(sealed + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(sealed + ".tmp", sealed + ".gz")
+            os.remove(sealed)
+        except OSError as e:
+            logging.warning("Could not compact scan log segment %s: %s", sealed, e)
+        segments = self.segments()
+        for _, path, _ in segments[:max(0, len(segments) - self.keep)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def read(self, cursor=None, limit=None):
+        """Records written after `cursor`, and the cursor to resume from.
+
+        A cursor is (segment, byte offset into its uncompressed text), so a
+        reader picks up exactly where it left off instead of rescanning the log.
+        Offsets in a segment survive its compaction. A cursor that points at a
+        segment that has since been dropped resumes at the oldest one left.
+        """
+        seq, offset = cursor or (0, 0)
+        records = []
+        for s, path, compressed in self.segments():
+            if s < seq:
+                continue
+            if s > seq:
+                seq, offset = s, 0
+            opener = gzip.open if compressed else open
+            try:
+                with opener(path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            # Partially written record; read it next time
+                            break
+                        offset += len(line)
+                        record = self._parse(line)
+                        if record is None:
+                            continue
+                        records.append(record)
+                        if limit and len(records) >= limit:
+                            return records, (seq, offset)
+            except FileNotFoundError:
+                # Compacted between listing and opening; the next read picks up the .gz
+                break
+        return records, (seq, offset)
+
+    def end(self):
+        """Cursor just past the last record on disk, for readers that only want new scans."""
+        segments = self.segments()
+        if not segments:
+            return 0, 0
+        seq, path, compressed = segments[-1]
+        if compressed:
+            return seq + 1, 0
+        return seq, os.path.getsize(path)
+
+    def tail(self, n=20):
+        """The last `n` records, read from the newest segments only."""
+        out = []
+        for _, path, compressed in reversed(self.segments()):
+            opener = gzip.open if compressed else open
+            try:
+                with opener(path, "rb") as f:
+                    # The last line may still be in flight; only newline-terminated records count
+                    lines = f.read().split(b"\n")[:-1]
+            except FileNotFoundError:
+                # Compacted between listing and opening
+                continue
+            for line in reversed(lines):
+                record = self._parse(line) if line else None
+                if record is not None:
+                    out.insert(0, record)
+                    if len(out) >= n:
+                        return out
+        return out
+
+    def _parse(self, line):
+        """A record from one line, or None (counted) if the line is not valid JSON."""
+        try:
+            return json.loads(line)
+        except ValueError:
+            self.corrupt += 1
+            SCAN_LOG_RECORDS.labels("corrupt").inc()
+            return None
+
+    def close(self):
+        """Flush anything queued and close the active segment."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
@@ -1,74 +1,240 @@
 import os
+import gzip
+import json
+import time
+import threading
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from app.system import get_machine_id
+from app.metrics import counter, histogram
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG if os.getenv("DEBUG", "0") == "1" else logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Test the availability of the Server API
-def test_api_availability(api_url, auth_token, timeout=5.0):
-    logging.debug("Testing API availability")
-    logging.debug(f"API URL: {api_url}")
-    logging.debug(f"Auth Token: {auth_token}")
+# Shared with the async client so both runtimes report the same series
+API_LATENCY = histogram("passito_api_request_seconds", "API request latency by endpoint and HTTP status",
+                        ("endpoint", "status"))
+API_RETRIES = counter("passito_api_retries_total", "Transport-level retries by endpoint", ("endpoint",))
+
+# Bodies smaller than this are sent as is; gzip costs more than it saves on them
+COMPRESS_MIN_BYTES = 1024
+
+
+def encode_body(data, compress=False):
+    """JSON-encode a request body, gzipped when asked and worth it; returns (bytes, extra_headers)."""
+    body = json.dumps(data, separators=(',', ':')).encode()
+    if compress and len(body) >= COMPRESS_MIN_BYTES:
+        return gzip.compress(body, compresslevel=5), {'Content-Encoding': 'gzip'}
+    return body, {}
+
+
+def _retry_count(response):
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    return len(getattr(retries, "history", ()) or ())
+
 
-    test_endpoint = f"{api_url.rstrip('/')}/test"
+class ApiClient:
+    """Long-lived API client that owns a pooled keep-alive session.
 
-    try:
+    Connections are reused across calls, transient connect failures and 502/503/504
+    responses are retried with exponential backoff, and API health is tracked by an
+    optional background heartbeat rather than probed before every request.
+    """
+
+    def __init__(self, api_url, auth_token, connect_timeout=3.05, read_timeout=5.0,
+                 retries=2, backoff=0.3, pool_size=4):
+        self.api_url = api_url.rstrip('/')
+        self.auth_token = auth_token
+        self.timeout = (connect_timeout, read_timeout)
+        self.available = None
+        # Optional features the server lists in its /test reply (e.g. "sync_bulk", "gzip");
+        # None until a /test reply has been seen or when the server does not list any
+        self.features = None
+        self._heartbeat = None
+        self._stop = threading.Event()
+
+        retry = Retry(total=retries, connect=retries, read=0, status=retries,
+                      backoff_factor=backoff, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {auth_token}',
+            'Content-Type': 'application/json',
+        })
+
+    def _url(self, endpoint):
+        return f"{self.api_url}/{endpoint}"
+
+    def test(self, timeout=None):
+        """POST to /test and return True if the API reports a healthy status."""
+        logging.debug("Testing API availability")
+        logging.debug(f"API URL: {self.api_url}")
         data = {
             'name': 'RPI-Verifier',
-            'auth_token': auth_token
+            'auth_token': self.auth_token
         }
-        response = requests.post(test_endpoint, json=data, timeout=timeout)
+        t0 = time.perf_counter()
+        response = None
+        try:
+            response = self.session.post(self._url("test"), json=data, timeout=timeout or self.timeout)
+            self._observe("test", t0, response)
+
+            # Raises an HTTPError for bad responses (4xx, 5xx)
+            response.raise_for_status()
+
+            # Check the response status and message
+            body = response.json()
+            # Anything but a JSON object (a list, a bare string) is not a healthy reply
+            healthy = isinstance(body, dict)
+            if healthy and isinstance(body.get("features"), list):
+                self.features = set(body["features"])
+            if str(response.status_code).startswith('2') and healthy and body.get("status", False):
+                logging.debug("API Response: %s", body.get("message"))
+                self.available = True
+            else:
+                logging.warning("API is available but returned an unexpected response.")
+                logging.warning(body)
+                self.available = False
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if response is None:
+                self._observe("test", t0, None, e)
+            logging.error("API test failed.")
+            logging.error(f"Reason: {str(e)}")
+            self.available = False
+        return self.available
+
+    def request(self, endpoint, data, debug=False, timeout=None, headers=None, compress=False):
+        """POST data to an endpoint; returns the decoded JSON or {"error": ...}.
+
+        With `compress` the body is gzipped (Content-Encoding: gzip); only ask
+        for it when the server lists "gzip" in its features. Errors carry the
+        HTTP status as "status_code" when the server answered.
+        """
+        t0 = time.perf_counter()
+        response = None
+        try:
+            if debug:
+                logging.debug("Sending request to endpoint: %s", endpoint)
+                logging.debug("Data: %s", data)
 
-        # Raises an HTTPError for bad responses (4xx, 5xx)
-        response.raise_for_status()
+            body, extra = encode_body(data, compress)
+            if extra:
+                headers = dict(headers or {}, **extra)
+            response = self.session.post(self._url(endpoint), data=body, headers=headers,
+                                         timeout=timeout or self.timeout)
+            self._observe(endpoint, t0, response)
+            response.raise_for_status()
+            body = response.json()
+            logging.info("Request successful: %s", body)
+            self.available = True
+            return body
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if response is None:
+                self._observe(endpoint, t0, None, e)
+            logging.error("Request failed.")
+            logging.error(f"Reason: {str(e)}")
+            if isinstance(e, requests.exceptions.ConnectionError):
+                self.available = False
+            if response is not None:
+                return {"error": str(e), "status_code": response.status_code}
+            return {"error": str(e)}
 
-        # Check the response status and message
-        if str(response.status_code).startswith('2') and response.json().get("status", False):
-            logging.debug("API Response: %s", response.json().get("message"))
-            return True
+    def fetch(self, endpoint, data, etag=None, timeout=None):
+        """Conditional POST for versioned resources.
+
+        Returns (status_code, body, etag); status is 304 with body None when the
+        server's copy still matches `etag`, and None if the request failed.
+        """
+        t0 = time.perf_counter()
+        headers = {'If-None-Match': etag} if etag else None
+        try:
+            response = self.session.post(self._url(endpoint), json=data, headers=headers,
+                                         timeout=timeout or self.timeout)
+        except requests.exceptions.RequestException as e:
+            self._observe(endpoint, t0, None, e)
+            logging.error("Request to %s failed: %s", endpoint, str(e))
+            return None, None, None
+        self._observe(endpoint, t0, response)
+        body = None
+        if response.status_code == 200:
+            try:
+                body = response.json()
+            except ValueError:
+                return None, None, None
+        return response.status_code, body, response.headers.get('ETag')
+
+    @staticmethod
+    def _observe(endpoint, t0, response, error=None):
+        if response is not None:
+            status = str(response.status_code)
+            retries = _retry_count(response)
+            if retries:
+                API_RETRIES.labels(endpoint).inc(retries)
         else:
-            logging.warning("API is available but returned an unexpected response.")
-            logging.warning(response.json())
-            return False
-    except requests.exceptions.RequestException as e:
-        logging.error("API test failed.")
-        logging.error(f"Reason: {str(e)}")
-        return False
+            status = "timeout" if isinstance(error, requests.exceptions.Timeout) else "error"
+        API_LATENCY.labels(endpoint, status).observe(time.perf_counter() - t0)
+
+    def is_active(self, machine_id=None):
+        """Check if this device (or the given machine id) is active on the server."""
+        return self.request("is_active", {'machine_id': machine_id or get_machine_id()})
+
+    def start_heartbeat(self, interval=60.0):
+        """Probe /test every `interval` seconds on a daemon thread to keep `available` fresh."""
+        if self._heartbeat is not None:
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.wait(interval):
+                was = self.available
+                if self.test() != was:
+                    logging.info("API availability changed: %s", "up" if self.available else "down")
+
+        self._heartbeat = threading.Thread(target=_run, name="api-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def close(self):
+        self._stop.set()
+        self._heartbeat = None
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# Return the shared client for this API url and token, creating it on first use
+def get_client(api_url, auth_token):
+    key = (api_url.rstrip('/'), auth_token)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ApiClient(api_url, auth_token,
+                               connect_timeout=float(os.getenv("API_CONNECT_TIMEOUT", "3.05")),
+                               read_timeout=float(os.getenv("API_READ_TIMEOUT", "5.0")),
+                               retries=int(os.getenv("API_RETRIES", "2")))
+            _clients[key] = client
+        return client
+
+
+# Test the availability of the Server API
+def test_api_availability(api_url, auth_token, timeout=5.0):
+    return get_client(api_url, auth_token).test(timeout=timeout)
+
 
 # Send a request to the server API
-def send_request(api_url, auth_token, endpoint, data, debug=False, timeout=5.0):
-    if not test_api_availability(api_url, auth_token):
-        logging.error("Exiting due to API unavailability.")
-        exit(1)
-
-    headers = {
-        'Authorization': f'Bearer {auth_token}',
-        'Content-Type': 'application/json',
-    }
-
-    try:
-        if debug:
-            logging.debug("Sending request to endpoint: %s", endpoint)
-            logging.debug("Data: %s", data)
-
-        response = requests.post(f"{api_url.rstrip('/')}/{endpoint}", headers=headers, json=data, timeout=timeout)
-        response.raise_for_status()
-        logging.info("Request successful: %s", response.json())
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error("Request failed.")
-        logging.error(f"Reason: {str(e)}")
-        return {"error": str(e)}
+def send_request(api_url, auth_token, endpoint, data, debug=False, timeout=None, headers=None,
+                 compress=False):
+    return get_client(api_url, auth_token).request(endpoint, data, debug=debug, timeout=timeout,
+                                                   headers=headers, compress=compress)
 
 
 # Check if the device is active on the server
 def is_active(api_url, auth_token):
-    # Uses send_request to check if the device is active
-    data = {
-        'machine_id': get_machine_id()
-    }
-    
-    return send_request(api_url, auth_token, "is_active", data)
+    return get_client(api_url, auth_token).is_active()
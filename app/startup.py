@@ -0,0 +1,138 @@
+import sys
+import time
+import logging
+import importlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StartupProfiler:
+    """Wall-clock timings of startup phases, from any thread; does nothing when disabled."""
+
+    def __init__(self, enabled=False, t0=None):
+        self.enabled = enabled
+        self.t0 = t0 if t0 is not None else time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.perf_counter())
+
+    def mark(self, name):
+        if self.enabled:
+            now = time.perf_counter()
+            self._add(name, now, now)
+
+    def _add(self, name, start, end):
+        with self._lock:
+            self.phases.append((name, start - self.t0, end - start, threading.current_thread().name))
+
+    def report(self, file=None):
+        """Print phases in start order: offset from CLI start, duration, and thread."""
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        print(f"{'phase':<32} {'start ms':>9} {'took ms':>9}  thread", file=file)
+        for name, start, took, thread in phases:
+            print(f"{name:<32} {start * 1000:>9.1f} {took * 1000:>9.1f}  {thread}", file=file)
+        print(f"{'total':<32} {(time.perf_counter() - self.t0) * 1000:>9.1f}", file=file)
+
+
+class HardwareWarmup:
+    """Starts the slow parts of `start` in parallel, before they are needed.
+
+    Each camera is opened on its own thread, the audio mixer is initialized and
+    the feedback sounds decoded on another, the decoder backend is chosen on a
+    third, and the heavy modules are imported on a fourth. Meanwhile the main
+    thread is free for registration and API checks; the results are collected
+    when the detector is built.
+    """
+
+    def __init__(self, sources, decoder="auto", sounds=(), profiler=None):
+        self.profiler = profiler or StartupProfiler()
+        self._sources = list(sources)
+        self._pool = ThreadPoolExecutor(max_workers=len(self._sources) + 3, thread_name_prefix="warmup")
+        self._imports = self._pool.submit(self._import, ("numpy", "cv2", "Cryptodome.Cipher.AES",
+                                                         "app.detector"))
+        self._caps = [self._pool.submit(self._open_camera, s) for s in self._sources]
+        self._mixer = self._pool.submit(self._init_mixer, tuple(sounds))
+        self._decoder = self._pool.submit(self._resolve_decoder, decoder)
+
+    def _import(self, modules):
+        for name in modules:
+            with self.profiler.phase(f"import {name}"):
+                importlib.import_module(name)
+
+    def _open_camera(self, source):
+        with self.profiler.phase(f"open camera {source.name}"):
+            return source.open()
+
+    def _init_mixer(self, sounds):
+        with self.profiler.phase("import pygame"):
+            import pygame
+        with self.profiler.phase("mixer init"):
+            # A small mixer buffer keeps the delay between a verdict and its beep short
+            pygame.mixer.init(buffer=512)
+        from app.feedback import load_sound
+        with self.profiler.phase("load sounds"):
+            for path in sounds:
+                load_sound(path)
+        return pygame
+
+    def _resolve_decoder(self, decoder):
+        from app.decoders import resolve_decoder
+        with self.profiler.phase(f"decoder {decoder}"):
+            return resolve_decoder(decoder)
+
+    def sources(self):
+        """CameraSources wrapping the opened captures; raises if a camera failed to open."""
+        from app.camera import CameraSource
+        opened = []
+        try:
+            for source, fut in zip(self._sources, self._caps):
+                cap = fut.result()
+                opened.append(CameraSource(cap, gate=source.gate, action=source.action, name=source.name))
+        except Exception:
+            self.close()
+            raise
+        return opened
+
+    def decoder_factory(self):
+        return self._decoder.result()
+
+    def player(self):
+        """The initialized pygame module, or None if audio is unavailable."""
+        try:
+            return self._mixer.result()
+        except Exception as e:
+            logging.warning("Audio unavailable: %s", e)
+            return None
+
+    def wait_imports(self):
+        self._imports.result()
+
+    def done(self):
+        """Let the warm-up threads exit once every result has been collected."""
+        self._pool.shutdown(wait=False)
+
+    def close(self):
+        """Release any camera that was opened, e.g. when startup is aborted."""
+        for fut in self._caps:
+            try:
+                cap = fut.result()
+            except Exception:
+                continue
+            if cap.isOpened():
+                cap.release()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,134 @@
+import json
+import gzip
+import time
+import random
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            body = {}
+        with server.lock:
+            server.counts[endpoint] = server.counts.get(endpoint, 0) + 1
+            second = int(time.time())
+            server.timeline[second] = server.timeline.get(second, 0) + 1
+        delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        fault = server.fault()
+        status, payload = fault if fault is not None else server.respond(endpoint, body)
+        with server.lock:
+            server.statuses[status] = server.statuses.get(status, 0) + 1
+        out = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, fmt, *args):
+        logging.debug("stub: " + fmt, *args)
+
+
+class StubApiServer(ThreadingHTTPServer):
+    """Local stand-in for the Passito verifier API, for benchmarks and tests.
+
+    Serves /test, /register, /is_active, /sync, /sync_bulk and /passes under any prefix
+    and answers every scan as valid. `latency` adds a fixed delay per request.
+    `features` is what /test advertises (None lists nothing, like an older
+    server); with `bulk=False` /sync_bulk answers 404.
+
+    Faults for load tests: `jitter` adds up to that many seconds of random
+    latency, `error_rate` answers that fraction of requests with 503, and
+    `outage(start, duration)` answers everything with 503 for a time window
+    (wall-clock seconds, so worker processes can share the schedule).
+    `counts`, `statuses`, `timeline` (requests per wall-clock second) and
+    `connections` (TCP connections accepted) record what the server saw.
+    """
+
+    daemon_threads = True
+    # Load tests open one keep-alive connection per virtual verifier at once
+    request_queue_size = 256
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__((host, port), _StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.outages = []
+        self.statuses = {}
+        self.timeline = {}
+        self.features = ["sync_bulk", "gzip"]
+        self.bulk = True
+        # Pass ids served from /passes as one full snapshot; None answers 404 like an older server
+        self.passes = None
+        self.counts = {}
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/verifiers"
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def outage(self, start, duration):
+        """Answer every request with 503 from `start` (time.time()) for `duration` seconds."""
+        self.outages.append((start, start + duration))
+        return self
+
+    def fault(self):
+        """(status, payload) of an injected failure for this request, or None to answer normally."""
+        now = time.time()
+        if any(start <= now < end for start, end in self.outages):
+            return 503, {"status": False, "message": "Service unavailable (outage)"}
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, {"status": False, "message": "Service unavailable (injected)"}
+        return None
+
+    def respond(self, endpoint, body):
+        """Return (http_status, json_payload) for a request."""
+        if endpoint == "test":
+            reply = {"status": True, "message": "Stub API available"}
+            if self.features is not None:
+                reply["features"] = list(self.features)
+            return 200, reply
+        if endpoint == "register":
+            return 200, {"status": True, "message": "Device registered"}
+        if endpoint == "is_active":
+            return 200, {"status": True, "ok": True}
+        if endpoint == "sync":
+            return 200, {"status": True, "message": "Synced"}
+        if endpoint == "sync_bulk" and self.bulk:
+            items = body.get("items") or []
+            return 200, {"status": True, "results": [{"status": True, "id": item.get("id")} for item in items]}
+        if endpoint == "passes" and self.passes is not None:
+            return 200, {"version": 1, "full": True, "valid": list(self.passes), "revoked": []}
+        return 404, {"status": False, "message": f"Unknown endpoint: {endpoint}"}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
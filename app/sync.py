@@ -1,93 +1,316 @@
-import hashlib
+import os
 import time
 import threading
 import logging
-from app.server import send_request
-try:
-    import pygame
-except Exception:
-    pygame = None
+from collections import deque
+from concurrent.futures import Future
+from app.server import get_client
+from app.journal import JournalUploader, step
+from app.metrics import counter
+from app.feedback import verdict_event
+
+SYNCED_SCANS = counter("passito_synced_scans_total", "Scans sent by the live sync, by outcome", ("status",))
+SYNC_REQUESTS = counter("passito_sync_requests_total", "Live sync requests, by kind", ("kind",))
+
+# A bulk endpoint answering with one of these does not exist on this server
+BULK_UNSUPPORTED = (404, 405, 501)
+
+
+def single_payload(data, key, meta):
+    """Body and headers for a one-scan sync request."""
+    payload = dict(meta or {}, data=data)
+    headers = None
+    if key is not None:
+        payload["id"] = key
+        headers = {"Idempotency-Key": key}
+    return payload, headers
+
+
+def bulk_payload(batch):
+    """Body for a bulk sync of (data, key, meta, ...) items."""
+    return {"items": [dict(meta or {}, id=key, data=data) for data, key, meta, *_ in batch]}
+
+
+def answered(resp):
+    """True if a sync response is a server verdict rather than a transport or HTTP error."""
+    return bool(resp) and not (isinstance(resp, dict) and resp.get("error"))
+
+
+def split_results(batch, resp):
+    """Per-scan verdicts from a bulk response, matched by id when the server echoes ids.
+
+    Scans the server did not answer individually get the response as a whole,
+    or None when the request failed.
+    """
+    if not answered(resp):
+        return [None] * len(batch)
+    results = resp.get("results") if isinstance(resp, dict) else None
+    if not isinstance(results, list):
+        return [resp] * len(batch)
+    by_id = {r.get("id"): r for r in results if isinstance(r, dict) and r.get("id") is not None}
+    out = []
+    for i, (_, key, *_rest) in enumerate(batch):
+        if key is not None and key in by_id:
+            result = by_id[key]
+        elif not by_id and i < len(results):
+            result = results[i]
+        else:
+            result = resp
+        # An item the server failed on stays in the journal for the uploader to retry
+        out.append(result if answered(result) else None)
+    return out
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._ts = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self._tokens >= 1.0 or self.rate <= 0:
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self._tokens = max(0.0, self._tokens - 1.0)
+
 
 class DataSync:
-    def __init__(self, file_path="qr_data.txt", api_url=None, auth_token=None, endpoint="sync"):
-        self.file_path = file_path
+    """Non-blocking sync scheduler with client-side micro-batching.
+
+    Scans are queued by `sync_with_server`, which returns a Future immediately.
+    A dedicated thread collects them for up to `batch_window` seconds or
+    `max_batch` scans, then sends them under a token-bucket rate limit as one
+    bulk request (gzipped when the server lists "gzip" in its features), and
+    resolves each scan's Future with its own verdict. When the server lacks the
+    bulk endpoint the batch is sent as per-scan requests instead, so none are
+    dropped and the detector never sleeps on a sync.
+    """
+
+    def __init__(self, api_url=None, auth_token=None, endpoint="sync",
+                 journal=None, rate=None, burst=None, max_batch=None, bulk_endpoint="sync_bulk",
+                 feedback=None, batch_window=None):
         self.api_url = api_url
         self.auth_token = auth_token
         self.endpoint = endpoint
-        self.last_hash = None
-        self._lock = threading.Lock()
-        self._last_sync_ts = 0.0
-        self._pending_data = None
-        self._min_interval_secs = 2.0  # minimum gap between sync calls
-        # Preload a short success sound for snappy feedback
-        self._success_sound = None
-        if pygame is not None:
-            try:
-                self._success_sound = pygame.mixer.Sound("sounds/success.mp3")
-            except Exception:
-                self._success_sound = None
-
-    def _compute_file_hash(self):
-        """Compute a hash of the file contents."""
+        self.bulk_endpoint = bulk_endpoint
+        self.max_batch = max_batch or int(os.getenv("SYNC_BATCH_SIZE", "20"))
+        self.batch_window = (batch_window if batch_window is not None
+                             else float(os.getenv("SYNC_BATCH_WINDOW_MS", "100")) / 1000.0)
+        # Cleared when the server turns out not to have the bulk endpoint or not to accept gzip
+        self._bulk_ok = True
+        self._gzip_ok = True
+        # Default keeps the previous pacing of one request every 2 s, with a small burst
+        self._bucket = TokenBucket(rate if rate is not None else float(os.getenv("SYNC_RATE", "0.5")),
+                                   burst if burst is not None else float(os.getenv("SYNC_BURST", "2")))
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        # Verdicts are announced through the shared feedback service, if one is given
+        self.feedback = feedback
+        # Every scan is journaled first; anything the live sync misses is bulk-uploaded later
+        self.journal = journal
+        self.uploader = None
+        if journal is not None and api_url and auth_token:
+            self.uploader = JournalUploader(journal, api_url, auth_token, endpoint=bulk_endpoint, sync=self)
+            self.uploader.start()
+
+    def record(self, data, meta=None):
+        """Journal a verified scan and return its idempotency key (None without a journal)."""
+        if self.journal is None:
+            return None
         try:
-            with open(self.file_path, "r") as file:
-                file_data = file.read()
-                return hashlib.md5(file_data.encode()).hexdigest()
-        except FileNotFoundError:
-            logging.warning("File not found while computing hash.")
+            return self.journal.append(data, meta)
+        except Exception as e:
+            logging.error("Failed to journal scan: %s", str(e))
             return None
 
-    def _read_data_from_file(self):
-        """Read unique data from the file."""
-        try:
-            with open(self.file_path, "r") as file:
-                return [line.strip() for line in file if line.strip()]
-        except FileNotFoundError:
-            logging.warning("File not found while reading data.")
-            return []
-
-    def sync_with_server(self, data, player):
-        """Sync data with the server with a lock and rate limit to avoid bursts."""
+    def sync_with_server(self, data, player=None, key=None, callback=None, meta=None):
+        """Queue data for sync and return a Future resolving to the server verdict.
+
+        The result is the response dict for this scan, or None if the sync
+        failed. Never blocks the caller. `callback`, if given, is called with
+        the Future once the server has answered. `meta` (gate, action) is sent
+        alongside the scan.
+        """
+        fut = Future()
+        if callback is not None:
+            fut.add_done_callback(callback)
         if not self.api_url or not self.auth_token:
             logging.error("API URL or auth token not provided. Sync aborted.")
-            return False
-
-        now = time.time()
-
-        # Coalesce if a sync is ongoing or within cooldown window
-        if self._lock.locked() or (now - self._last_sync_ts) < self._min_interval_secs:
-            self._pending_data = data
-            return False
-
-        ok = False
-        with self._lock:
-            resp = send_request(self.api_url, self.auth_token,
-                                self.endpoint, {"data": data}, debug=True)
-            # Treat dict with 'error' as failure
-            if isinstance(resp, dict) and resp.get("error"):
-                ok = False
-            else:
-                ok = bool(resp)
-
-            if ok:
-                logging.info("Data synchronization completed successfully.")
+            fut.set_result(None)
+            return fut
+
+        self._ensure_started()
+        with self._cond:
+            self._queue.append((data, key, meta, fut))
+            self._cond.notify()
+        return fut
+
+    def pending(self):
+        return len(self._queue)
+
+    def set_rate(self, rate, burst=None):
+        """Replace the rate limit; a rate of 0 disables it."""
+        self._bucket = TokenBucket(rate, burst if burst is not None else self._bucket.burst)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="sync-scheduler", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._queue and not self._stop.is_set():
+                    self._cond.wait(1.0)
+            if self._stop.is_set():
+                break
+
+            # Give a burst a moment to gather so it goes out as one request
+            deadline = time.monotonic() + self.batch_window
+            with self._cond:
+                while len(self._queue) < self.max_batch and not self._stop.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            # Wait for a token; anything queued meanwhile rides along in the same request
+            delay = self._bucket.wait_time()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            self._bucket.take()
+
+            with self._cond:
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            if batch:
                 try:
-                    if self._success_sound is not None:
-                        # Play success sound without blocking to keep valid flow snappy
-                        self._success_sound.play()
+                    self._send(batch)
                 except Exception:
-                    pass
-                self._last_sync_ts = time.time()
-            else:
-                logging.error("Failed to sync data with the server.")
-
-        # If something new arrived during the sync, send the latest once after delay
-        if self._pending_data is not None:
-            remaining = self._min_interval_secs - (time.time() - self._last_sync_ts)
-            if remaining > 0:
-                time.sleep(remaining)
-            pending = self._pending_data
-            self._pending_data = None
-            return self.sync_with_server(pending, player)
-
-        return ok
+                    # One bad batch must not stop the scheduler; the journal still holds its scans
+                    logging.exception("Sync of %d scan(s) failed", len(batch))
+                    for _, _, _, fut in batch:
+                        if not fut.done():
+                            fut.set_result(None)
+
+        # Resolve anything left so waiters are not stuck; the journal still holds the scans
+        with self._cond:
+            while self._queue:
+                self._queue.popleft()[3].set_result(None)
+
+    def bulk_allowed(self, features):
+        """Whether to use the bulk endpoint, given the features the server listed (None if unknown)."""
+        if features is not None:
+            return "sync_bulk" in features and self._bulk_ok
+        return self._bulk_ok
+
+    def gzip_allowed(self, features):
+        return self._gzip_ok and "gzip" in (features or ())
+
+    def bulk_rejected(self, status, compressed):
+        """Handle an HTTP error from the bulk endpoint.
+
+        Returns "plain" to resend without gzip, "single" to fall back to
+        per-scan requests, or None when the error is not about support.
+        """
+        if compressed and status == 415:
+            logging.warning("Server rejected a gzipped sync; sending uncompressed from now on")
+            self._gzip_ok = False
+            return "plain"
+        if status in BULK_UNSUPPORTED:
+            logging.warning("Server has no /%s endpoint; syncing scans one by one", self.bulk_endpoint)
+            self._bulk_ok = False
+            return "single"
+        return None
+
+    def _send(self, batch):
+        t0 = time.perf_counter()
+        client = get_client(self.api_url, self.auth_token)
+        steps = self.exchange(batch, client.features)
+        request, results = step(steps)
+        while request is not None:
+            endpoint, body, headers, compress = request
+            request, results = step(steps, client.request(endpoint, body, debug=True, headers=headers,
+                                                          compress=compress))
+        logging.debug("Sync of %d scan(s) finished in %.1f ms", len(batch), (time.perf_counter() - t0) * 1000)
+        keys = self.settle(batch, results)
+        if keys and self.journal is not None:
+            self.journal.ack(keys)
+        self.resolve(batch, results)
+
+    def exchange(self, batch, features):
+        """Generator behind _send, given the features the server listed.
+
+        Yields (endpoint, body, headers, compress) for each request to make and
+        expects its response sent back; returns the per-scan results. Use
+        app.journal.step to drive it; the async runtime sends the same requests
+        over its own client.
+        """
+        results = None
+        if len(batch) > 1 and self.bulk_allowed(features):
+            results = yield from self._exchange_bulk(batch, features)
+        if results is None:
+            results = []
+            for data, key, meta, *_ in batch:
+                payload, headers = single_payload(data, key, meta)
+                SYNC_REQUESTS.labels("single").inc()
+                resp = yield self.endpoint, payload, headers, False
+                results.append(resp if answered(resp) else None)
+        return results
+
+    def _exchange_bulk(self, batch, features):
+        """Send a batch in one request; returns per-scan results, or None to fall back to single calls."""
+        compress = self.gzip_allowed(features)
+        SYNC_REQUESTS.labels("bulk").inc()
+        resp = yield self.bulk_endpoint, bulk_payload(batch), None, compress
+        action = self.bulk_rejected(resp.get("status_code") if isinstance(resp, dict) else None, compress)
+        if action == "plain":
+            return (yield from self._exchange_bulk(batch, features))
+        if action == "single":
+            return None
+        return split_results(batch, resp)
+
+    def settle(self, batch, results):
+        """Count how a sent batch went; returns the journal keys of the scans the server answered."""
+        keys = [key for (_, key, *_rest), result in zip(batch, results) if key is not None and result is not None]
+        ok = sum(1 for result in results if result is not None)
+        SYNCED_SCANS.labels("ok").inc(ok)
+        SYNCED_SCANS.labels("failed").inc(len(batch) - ok)
+        if ok:
+            logging.info("Data synchronization completed successfully.")
+        if ok < len(batch):
+            logging.error("Failed to sync %d of %d scan(s) with the server.", len(batch) - ok, len(batch))
+        return keys
+
+    def resolve(self, batch, results):
+        """Announce each scan's verdict and resolve its future."""
+        for (*_, fut), result in zip(batch, results):
+            if self.feedback is not None:
+                # The feedback service coalesces these, so a bulk reply gives one beep per outcome
+                self.feedback.notify(verdict_event(result))
+            fut.set_result(result)
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self.uploader is not None:
+            self.uploader.stop()
@@ -1,3 +1,8 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
 import requests
 
 # Read machine ID from /etc/machine-id
@@ -11,29 +16,52 @@ def get_machine_id():
             "The file /etc/machine-id does not exist on this system.")
 
 
+# Providers raced for the public IP; each answers JSON {"ip": ...} or the bare address
+IP_PROVIDERS = [
+    ("https://api.ipify.org?format=json", "json", "ip"),
+    ("https://ifconfig.me/ip", "text", None),
+    ("https://ipinfo.io/ip", "text", None),
+    ("https://checkip.amazonaws.com", "text", None),
+]
+
+
+def _fetch_ip(url, mode, key, timeout):
+    try:
+        resp = requests.get(url, timeout=timeout)
+        resp.raise_for_status()
+        ip = resp.json().get(key) if mode == "json" else resp.text.strip()
+        return ip or None
+    except (requests.exceptions.RequestException, ValueError, AttributeError):
+        return None
+
+
 # Get the network IP address
 def get_public_ip(timeout: float = 3.0):
-    """Return the public IP address using multiple providers with fallbacks."""
-    providers = [
-        ("https://api.ipify.org?format=json", "json", "ip"),
-        ("https://ifconfig.me/ip", "text", None),
-        ("https://ipinfo.io/ip", "text", None),
-        ("https://checkip.amazonaws.com", "text", None),
-    ]
-
-    for url, mode, key in providers:
+    """Return the public IP address from whichever provider answers first.
+
+    All providers are asked at once on daemon threads, so a dead link costs
+    `timeout` seconds in total rather than per provider.
+    """
+    answers = queue.Queue()
+    for url, mode, key in IP_PROVIDERS:
+        threading.Thread(target=lambda u=url, m=mode, k=key: answers.put(_fetch_ip(u, m, k, timeout)),
+                         name="public-ip", daemon=True).start()
+    deadline = time.monotonic() + timeout
+    for _ in IP_PROVIDERS:
         try:
-            resp = requests.get(url, timeout=timeout)
-            resp.raise_for_status()
-            if mode == "json":
-                data = resp.json()
-                ip = data.get(key)
-            else:
-                ip = resp.text.strip()
-            if ip:
-                return ip
-        except requests.exceptions.RequestException:
-            continue
-
-    print("Unable to fetch public IP from all providers.")
+            ip = answers.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if ip:
+            return ip
+
+    logging.warning("Unable to fetch public IP from all providers.")
     return None
+
+
+# Look up the public IP on a background thread; the Future resolves to the address or None
+def public_ip_future(timeout: float = 3.0):
+    fut = Future()
+    threading.Thread(target=lambda: fut.set_result(get_public_ip(timeout)), name="public-ip-probe",
+                     daemon=True).start()
+    return fut
@@ -1,3 +1,6 @@
+import time
+_T0 = time.perf_counter()
+
 import argparse
 import json
 import logging
@@ -11,9 +14,7 @@ os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
 # Load .env early so version and other envs are available for help text
 load_dotenv(override=True)
 
-from app.auth import register_device, load_registration_state
-from app.server import test_api_availability, is_active, send_request
-from app.detector import CLIQRCodeDetector
+# Heavy modules (cv2, numpy, pygame, Cryptodome, requests) are imported by the subcommands that need them
 
 
 def setup_logging(debug: bool):
@@ -30,6 +31,37 @@ def ensure_config(config_path: str):
     os.environ['CONFIG_PATH'] = os.path.abspath(config_path)
 
 
+def ask_verifier(args, command, required=False, **params):
+    # Answer a command from the running verifier over its control socket; None means run it here instead
+    from app.control import control_call, default_socket_path, ControlUnavailable, ControlError
+    if getattr(args, 'local', False) and not required:
+        return None
+    try:
+        return control_call(command, **params)
+    except ControlError as e:
+        logging.error('Verifier answered with an error: %s', e)
+        sys.exit(1)
+    except (ControlUnavailable, OSError, ValueError) as e:
+        if required:
+            logging.error('No running verifier on the control socket %s (%s)', default_socket_path() or '-', e)
+            sys.exit(1)
+        logging.debug('Running %s locally: %s', command, e)
+        return None
+
+
+def start_control_socket(args, detector, api_url, auth_token):
+    # Serve status, stats, decrypt, flush and reload from this process to thin CLI clients
+    from app.control import ControlServer, VerifierControl, default_socket_path
+    path = getattr(args, 'control_socket', None) or default_socket_path()
+    if not path:
+        return None
+    try:
+        return ControlServer(path, VerifierControl(detector, api_url, auth_token, args.config)).start()
+    except OSError as e:
+        logging.warning('Control socket not started: %s', e)
+        return None
+
+
 def cmd_start(args):
     setup_logging(args.debug)
     load_dotenv(override=True)
@@ -41,21 +73,106 @@ def cmd_start(args):
 
     ensure_config(args.config)
 
-    if not register_device(api_url, auth_token):
+    from app.startup import StartupProfiler, HardwareWarmup
+    from app.camera import parse_camera_specs
+    profiler = StartupProfiler(getattr(args, 'profile_startup', False), t0=_T0)
+    profiler.mark('cli loaded')
+    use_async = getattr(args, 'use_async', False)
+    decoder = getattr(args, 'decoder', None) or os.getenv('DECODER', 'auto')
+    decode_mode = getattr(args, 'decode_mode', None) or os.getenv('DECODE_MODE', 'thread')
+    decode_workers = getattr(args, 'decode_workers', None) or (int(os.getenv('DECODE_WORKERS') or 0) or None)
+    gray = getattr(args, 'gray', False) or os.getenv('CAPTURE_GRAY', '0') == '1'
+    try:
+        sources = parse_camera_specs(getattr(args, 'cameras', None) or os.getenv('CAMERAS', '0'))
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+    # Cameras, audio, decoder selection and heavy imports warm up while we register
+    from app.feedback import DEFAULT_SOUNDS
+    warmup = HardwareWarmup(sources, decoder, sounds=DEFAULT_SOUNDS.values(), profiler=profiler)
+    with profiler.phase('register'):
+        from app.auth import register_device
+        # A registered gate checks the API and its public IP in the background instead of waiting
+        registered = register_device(api_url, auth_token, background=True)
+    if not registered:
+        warmup.close()
         logging.error('Device registration unsuccessful. Exiting...')
         sys.exit(1)
 
         logging.info('Initializing QR verification system...')
         from pygame import mixer
+
+    from app.server import get_client
+    heartbeat_secs = float(os.getenv('API_HEARTBEAT_SECS', '60'))
+    if not use_async:
+        # Availability was checked once during registration; keep it fresh in the background
+        get_client(api_url, auth_token).start_heartbeat(heartbeat_secs)
+    metrics_port = getattr(args, 'metrics_port', None) or int(os.getenv('METRICS_PORT') or 0)
+    if metrics_port:
+        from app.metrics import MetricsServer
+        try:
+            MetricsServer(metrics_port, host=os.getenv('METRICS_HOST', '127.0.0.1')).start()
+        except OSError as e:
+            logging.warning('Metrics endpoint not started: %s', e)
+    passlist = None
+    passlist_interval = getattr(args, 'passlist_interval', None) or float(os.getenv('PASSLIST_INTERVAL') or 0)
+    if passlist_interval:
+        from app.passlist import PassIndex, PassListSync
+        # Prefetched pass list for local verdicts; refreshed in the background
+        passlist = PassIndex(os.getenv('PASSLIST_PATH', 'passes.idx'))
+        PassListSync(passlist, api_url, auth_token, interval=passlist_interval).start()
+    scan_log_dir = os.getenv('SCAN_LOG_DIR', 'scanlog')
+    control = None
+    sampler = None
     try:
-        import pygame
-        pygame.mixer.init()
-        pygame.mixer.music.load("sounds/success.mp3")
-        detector = CLIQRCodeDetector(api_url=api_url, auth_token=auth_token)
-        detector.detect_and_save(player=pygame)
+        with profiler.phase('wait for warm-up'):
+            warmup.wait_imports()
+            pygame = warmup.player()
+            sources = warmup.sources()
+            decoder = warmup.decoder_factory()
+        warmup.done()
+        from app.detector import CLIQRCodeDetector
+        with profiler.phase('detector init'):
+            if use_async:
+                # The async runtime owns syncing, so the detector gets no API credentials
+                detector = CLIQRCodeDetector(api_url=None, auth_token=None, decoder=decoder,
+                                             sources=sources, decode_workers=decode_workers, gray=gray,
+                                             passlist=passlist, scan_log_dir=scan_log_dir)
+            else:
+                detector = CLIQRCodeDetector(api_url=api_url, auth_token=auth_token, decoder=decoder,
+                                             sources=sources, decode_mode=decode_mode,
+                                             decode_workers=decode_workers, gray=gray, passlist=passlist,
+                                             scan_log_dir=scan_log_dir)
+        control = start_control_socket(args, detector, api_url, auth_token)
+        profiler.mark('ready to scan')
+        profiler.report()
+        sampler = start_sampling_profiler(args)
+        if use_async:
+            from app.aio import AsyncVerifier
+            verifier = AsyncVerifier(detector, api_url, auth_token, heartbeat_secs=heartbeat_secs)
+            if control is not None:
+                control.handler.runtime = verifier
+            verifier.run()
+        else:
+            detector.detect_and_save(player=pygame)
     except Exception as e:
         logging.error(f"Failed to start detector: {e}")
         sys.exit(1)
+    finally:
+        if control is not None:
+            control.stop()
+        if sampler is not None and not sampler.finished:
+            from app.profiler import format_summary
+            print(format_summary(sampler.stop()), file=sys.stderr)
+
+
+def start_sampling_profiler(args, report=True):
+    # Only imported and started with --profile; without it nothing is sampled or hooked
+    if getattr(args, 'profile', None) is None:
+        return None
+    from app.profiler import SamplingProfiler
+    return SamplingProfiler(duration=args.profile, output=args.profile_output, report=report).start()
 
 
 def cmd_register(args):
@@ -67,18 +184,26 @@ def cmd_register(args):
         logging.error('API_URL and AUTH_TOKEN are required (arguments or environment variables).')
         sys.exit(1)
     ensure_config(args.config)
+    from app.auth import register_device
     ok = register_device(api_url, auth_token)
     sys.exit(0 if ok else 2)
 
 
 def cmd_test_api(args):
     setup_logging(args.debug)
+    if not (args.api_url or args.auth_token):
+        # The running verifier answers over its warm keep-alive session
+        resp = ask_verifier(args, 'test_api')
+        if resp is not None:
+            print(json.dumps(resp))
+            sys.exit(0 if resp.get('ok') else 3)
     load_dotenv(override=True)
     api_url = args.api_url or os.getenv('API_URL')
     auth_token = args.auth_token or os.getenv('AUTH_TOKEN')
     if not api_url or not auth_token:
         logging.error('API_URL and AUTH_TOKEN are required (arguments or environment variables).')
         sys.exit(1)
+    from app.server import test_api_availability
     ok = test_api_availability(api_url, auth_token)
     print(json.dumps({"ok": ok}))
     sys.exit(0 if ok else 3)
@@ -86,29 +211,179 @@ def cmd_test_api(args):
 
 def cmd_is_active(args):
     setup_logging(args.debug)
-    load_dotenv(override=True)
-    api_url = args.api_url or os.getenv('API_URL')
-    auth_token = args.auth_token or os.getenv('AUTH_TOKEN')
-    if not api_url or not auth_token:
-        logging.error('API_URL and AUTH_TOKEN are required (arguments or environment variables).')
-        sys.exit(1)
-    resp = is_active(api_url, auth_token)
+    resp = None if args.api_url or args.auth_token else ask_verifier(args, 'is_active')
+    if resp is None:
+        load_dotenv(override=True)
+        api_url = args.api_url or os.getenv('API_URL')
+        auth_token = args.auth_token or os.getenv('AUTH_TOKEN')
+        if not api_url or not auth_token:
+            logging.error('API_URL and AUTH_TOKEN are required (arguments or environment variables).')
+            sys.exit(1)
+        from app.server import is_active
+        resp = is_active(api_url, auth_token)
     print(json.dumps(resp or {}))
     sys.exit(0 if resp and (resp.get('ok') or resp.get('status') in (True, 'success')) else 4)
 
 
 def cmd_config(args):
     setup_logging(args.debug)
+    reply = ask_verifier(args, 'config')
+    if reply is not None and reply.get('path') == os.path.abspath(args.config):
+        print(json.dumps(reply.get('state') or {}, indent=2))
+        return
     ensure_config(args.config)
+    from app.auth import load_registration_state
     state = load_registration_state() or {}
     print(json.dumps(state, indent=2))
 
 
 def cmd_decrypt(args):
-    # Utility to decrypt a QR payload for debugging
-    from app.detector import CLIQRCodeDetector
-    det = CLIQRCodeDetector(api_url=None, auth_token=None)
-    print(det.decrypt_qr_data(args.data, args.secret))
+    # Utility to decrypt a QR payload for debugging; needs only the crypto module, not the camera
+    setup_logging(args.debug)
+    reply = ask_verifier(args, 'decrypt', data=args.data, secret=args.secret)
+    if reply is not None:
+        print(reply['plaintext'] if reply.get('ok') else f"Decryption failed: {reply.get('error')}")
+        return
+    from app.crypto import PassCrypto
+    from app.payload import describe
+    secret = args.secret or 'passito'
+    result = PassCrypto([secret]).decrypt(args.data, secret, raw=True)
+    if not result.ok:
+        print(f"Decryption failed: {result.error}")
+        return
+    try:
+        print(describe(result.plaintext))
+    except ValueError as e:
+        print(f"Invalid payload: {e}")
+
+
+def cmd_stats(args):
+    # Dump the metrics of a running verifier
+    setup_logging(args.debug)
+    from app.metrics import format_snapshot
+    if not args.metrics_url:
+        reply = ask_verifier(args, 'metrics' if args.prometheus else 'stats')
+        if reply is not None:
+            print(reply if args.prometheus else format_snapshot(reply), end='' if args.prometheus else '\n')
+            return
+    import requests
+    base = (args.metrics_url or f"http://127.0.0.1:{int(os.getenv('METRICS_PORT') or 9108)}").rstrip('/')
+    try:
+        resp = requests.get(base + ('/metrics' if args.prometheus else '/metrics.json'), timeout=3)
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logging.error('Could not read metrics from %s: %s (is the verifier running with METRICS_PORT set?)',
+                      base, e)
+        sys.exit(2)
+    print(resp.text if args.prometheus else format_snapshot(resp.json()))
+
+
+def cmd_scans(args):
+    # Print scan log records as NDJSON; with --since/--follow only what was appended after a cursor
+    setup_logging(args.debug)
+    from app.scanlog import ScanLog, parse_cursor, format_cursor
+    log = ScanLog(args.dir or os.getenv('SCAN_LOG_DIR', 'scanlog'), readonly=True)
+    if args.since is None and not args.follow:
+        for record in log.tail(args.tail):
+            print(json.dumps(record, separators=(',', ':')))
+        return
+    try:
+        cursor = parse_cursor(args.since)
+    except ValueError:
+        logging.error("Invalid cursor '%s' (expected SEGMENT:OFFSET)", args.since)
+        sys.exit(2)
+    if cursor is None and args.follow:
+        # Following with no cursor starts at the end, like tail -f
+        cursor = log.end()
+    try:
+        while True:
+            records, cursor = log.read(cursor)
+            for record in records:
+                print(json.dumps(record, separators=(',', ':')), flush=True)
+            if not args.follow:
+                break
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    print(f"cursor {format_cursor(cursor)}", file=sys.stderr)
+
+
+def cmd_status(args):
+    # State of the running verifier as JSON; exits 1 when none is running, so it doubles as a health check
+    setup_logging(args.debug)
+    print(json.dumps(ask_verifier(args, 'status', required=True), indent=2))
+
+
+def cmd_flush(args):
+    setup_logging(args.debug)
+    print(json.dumps(ask_verifier(args, 'flush', required=True)))
+
+
+def cmd_reload(args):
+    setup_logging(args.debug)
+    print(json.dumps(ask_verifier(args, 'reload', required=True), indent=2))
+
+
+def cmd_bench(args):
+    # Replay recorded frames through the scan path against a local stub API
+    setup_logging(args.debug)
+    from app.bench import BenchRunner, format_report, write_report
+    decoder = args.decoder or os.getenv('DECODER', 'auto')
+    runner = BenchRunner(inputs=args.inputs, decoder=decoder, gate=not args.no_gate, loops=args.loops,
+                         passes=args.passes, dedup=not args.no_dedup, sync_rate=args.sync_rate,
+                         stub_latency=args.stub_latency / 1000.0, passlist=args.passlist,
+                         compact=args.compact, profile=args.profile, profile_output=args.profile_output)
+    try:
+        report = runner.run()
+    except RuntimeError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    print(format_report(report))
+    if args.output:
+        write_report(report, args.output)
+        if args.output != '-':
+            logging.info('Bench report written to %s', args.output)
+
+
+def cmd_loadtest(args):
+    # Simulate a fleet of verifiers against a local stub API with injected latency, errors and outages
+    setup_logging(args.debug)
+    if not args.debug:
+        # Hundreds of virtual clients logging every failed request drown the report
+        logging.disable(logging.ERROR)
+    from app.loadtest import LoadTest, format_report
+    outage = None
+    if args.outage:
+        try:
+            start, _, secs = args.outage.partition(':')
+            outage = (float(start), float(secs))
+        except ValueError:
+            logging.disable(logging.NOTSET)
+            logging.error("Invalid outage '%s' (expected START:SECONDS)", args.outage)
+            sys.exit(2)
+    test = LoadTest(verifiers=args.verifiers, processes=args.processes, duration=args.duration,
+                    scan_rate=args.scan_rate, heartbeat_secs=args.heartbeat, latency=args.latency / 1000.0,
+                    jitter=args.jitter / 1000.0, error_rate=args.error_rate, outage=outage,
+                    drain_timeout=args.drain_timeout, sync_rate=args.sync_rate)
+    report = test.run()
+    logging.disable(logging.NOTSET)
+    print(format_report(report))
+    if args.output:
+        if args.output == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+            logging.info('Load test report written to %s', args.output)
+
+
+def add_profile_arguments(parser, what):
+    parser.add_argument('--profile', type=float, metavar='SECS',
+                        help=f'Sample all threads of {what} for SECS seconds (0 = until it ends) and print '
+                             'where the time goes per pipeline stage')
+    parser.add_argument('--profile-output', dest='profile_output', default='profile.folded', metavar='PATH',
+                        help='Collapsed stacks for flamegraph.pl/speedscope (default: profile.folded)')
 
 
 def build_parser():
@@ -119,16 +394,41 @@ def build_parser():
         "Common commands:\n"
         "  passito-verifier               # Start (default)\n"
         "  passito-verifier start --debug\n"
+        "  passito-verifier start --async\n"
+        "  passito-verifier start --camera 0,gate=main,action=check-in --camera 2,gate=main,action=check-out\n"
         "  passito-verifier register --api-url http://passito.local --auth-token TOKEN\n"
         "  passito-verifier test-api --api-url http://passito.local --auth-token TOKEN\n"
         "  passito-verifier is-active --api-url http://passito.local --auth-token TOKEN\n"
         "  passito-verifier config --config config.json\n"
-        "  passito-verifier decrypt --data <base64> --secret passito\n\n"
+        "  passito-verifier decrypt --data <base64> --secret passito\n"
+        "  passito-verifier bench recordings/gate1.mp4 frames/ --output bench.json\n"
+        "  passito-verifier loadtest -n 200 --processes 4 --error-rate 0.05 --outage 20:15\n"
+        "  passito-verifier start --metrics-port 9108   # then: passito-verifier stats\n"
+        "  passito-verifier scans --follow\n"
+        "  passito-verifier status          # ask the running verifier over its control socket\n"
+        "  passito-verifier reload          # re-read .env, config, PASS_SECRETS and the pass list\n"
+        "  passito-verifier --profile-startup start\n"
+        "  passito-verifier start --profile 60   # then: flamegraph.pl profile.folded > profile.svg\n\n"
         "Environment variables:\n"
-        "  API_URL, AUTH_TOKEN, CONFIG_PATH, VERSION\n\n"
+        "  API_URL, AUTH_TOKEN, CONFIG_PATH, VERSION\n"
+        "  API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_RETRIES, API_HEARTBEAT_SECS\n"
+        "  SYNC_RATE, SYNC_BURST, SYNC_BATCH_SIZE, SYNC_BATCH_WINDOW_MS, DECODER, PASS_SECRETS\n"
+        "  VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL, CAMERAS (';'-separated camera specs)\n"
+        "  DECODE_MODE, DECODE_WORKERS, CAPTURE_GRAY, METRICS_PORT, METRICS_HOST\n"
+        "  PASSLIST_INTERVAL, PASSLIST_PATH, PASSLIST_MAX_AGE, PASS_ID_FIELD\n"
+        "  SCAN_LOG_DIR, SCAN_LOG_SEGMENT_MB, SCAN_LOG_KEEP\n"
+        "  CAPTURE_IDLE_FPS (0 = fixed rate), CAPTURE_THROTTLED_FPS, CAPTURE_HIGH_RES (e.g. 1280x720)\n"
+        "  CAPTURE_TEMP_LIMIT, CAPTURE_LOAD_LIMIT\n"
+        "  LED_PINS (e.g. success=17,denied=27,offline=22)\n"
+        "  PUBLIC_IP_TTL (seconds a looked-up public IP is trusted, default 86400; 0 disables the\n"
+        "    background refresh, which otherwise runs at most once a minute)\n"
+        "  CONTROL_SOCKET (default passito-verifier.sock in $XDG_RUNTIME_DIR, else in a private\n"
+        "    /tmp/passito-UID directory; empty disables)\n\n"
         "Notes:\n"
         "  - The 'start' command is the default; you can omit it.\n"
         "  - CLI flags override environment variables when provided.\n"
+        "  - is-active, test-api, config, decrypt and stats are answered by the running verifier\n"
+        "    when there is one (without --api-url/--auth-token); --local runs them in-process.\n"
     )
     parser = argparse.ArgumentParser(
         prog=f'passito-verifier v{version}',
@@ -142,10 +442,37 @@ def build_parser():
     parser.add_argument('--api-url', dest='api_url', help='API base url')
     parser.add_argument('--auth-token', dest='auth_token', help='Auth token')
     parser.add_argument('--version', action='version', version=f'%(prog)s {version}')
+    parser.add_argument('--profile-startup', dest='profile_startup', action='store_true',
+                        help='Print an import and initialization timing breakdown once scanning starts')
+    parser.add_argument('--local', action='store_true',
+                        help='Run commands in this process instead of asking a running verifier')
 
     sub = parser.add_subparsers(dest='command', required=False, metavar='command', title=f'Commands')
 
     p_start = sub.add_parser('start', help='Start QR verifier loop')
+    p_start.add_argument('--decoder', choices=['auto', 'cascade', 'opencv', 'zbar', 'wechat'],
+                         help='QR decoder backend (default: auto, benchmarked at startup)')
+    p_start.add_argument('--camera', dest='cameras', action='append', metavar='SPEC',
+                         help='Camera source, repeatable: SOURCE[,gate=NAME][,action=check-in|check-out] '
+                              '(SOURCE: device index, /dev/videoN, or RTSP/file URL)')
+    p_start.add_argument('--decode-mode', dest='decode_mode', choices=['thread', 'process'],
+                         help='Decode in threads (default) or in worker processes via shared memory '
+                              '(ignored with --async)')
+    p_start.add_argument('--decode-workers', dest='decode_workers', type=int,
+                         help='Number of decode workers (default: one per camera plus one, up to CPU count)')
+    p_start.add_argument('--gray', action='store_true',
+                         help='Capture a single luma plane when the camera backend supports it')
+    p_start.add_argument('--async', dest='use_async', action='store_true',
+                         help='Run on a single asyncio event loop (requires aiohttp)')
+    p_start.add_argument('--metrics-port', dest='metrics_port', type=int,
+                         help='Serve Prometheus metrics on this port (/metrics and /metrics.json)')
+    p_start.add_argument('--passlist-interval', dest='passlist_interval', type=float, metavar='SECS',
+                         help='Prefetch the pass list every SECS seconds and verify listed passes locally')
+    p_start.add_argument('--control-socket', dest='control_socket', metavar='PATH',
+                         help='Unix socket for status/stats/decrypt/flush/reload (default: CONTROL_SOCKET)')
+    p_start.add_argument('--profile-startup', dest='profile_startup', action='store_true',
+                         default=argparse.SUPPRESS, help='Print a startup timing breakdown')
+    add_profile_arguments(p_start, 'the live loop')
     p_start.set_defaults(func=cmd_start)
 
     p_reg = sub.add_parser('register', help='Register device with server')
@@ -162,9 +489,76 @@ def build_parser():
 
     p_dec = sub.add_parser('decrypt', help='Decrypt a QR payload')
     p_dec.add_argument('--data', required=True, help='Base64 AES-GCM payload')
-    p_dec.add_argument('--secret', default='passito', help='Shared secret')
+    p_dec.add_argument('--secret', help="Shared secret (default: the running verifier's keys, else passito)")
     p_dec.set_defaults(func=cmd_decrypt)
 
+    p_stats = sub.add_parser('stats', help='Show metrics of the running verifier')
+    p_stats.add_argument('--metrics-url', dest='metrics_url',
+                         help='Metrics endpoint base URL (default: http://127.0.0.1:$METRICS_PORT, or 9108)')
+    p_stats.add_argument('--prometheus', action='store_true', help='Print the raw Prometheus text format')
+    p_stats.set_defaults(func=cmd_stats)
+
+    p_status = sub.add_parser('status', help='Show the state of the running verifier')
+    p_status.set_defaults(func=cmd_status)
+
+    p_flush = sub.add_parser('flush', help="Drop the running verifier's verdict cache and dedup window")
+    p_flush.set_defaults(func=cmd_flush)
+
+    p_reload = sub.add_parser('reload', help='Make the running verifier re-read .env, config, secrets and pass list')
+    p_reload.set_defaults(func=cmd_reload)
+
+    p_scans = sub.add_parser('scans', help='Show recent scans from the scan log')
+    p_scans.add_argument('--dir', help='Scan log directory (default: SCAN_LOG_DIR or scanlog)')
+    p_scans.add_argument('--tail', type=int, default=20, help='Number of recent scans to show')
+    p_scans.add_argument('--since', metavar='CURSOR',
+                         help="Only scans after this cursor (printed to stderr by the previous run; '0:0' for all)")
+    p_scans.add_argument('--follow', '-f', action='store_true', help='Keep printing new scans as they arrive')
+    p_scans.set_defaults(func=cmd_scans)
+
+    p_bench = sub.add_parser('bench', help='Benchmark the scan pipeline on recorded frames')
+    p_bench.add_argument('inputs', nargs='*', metavar='INPUT',
+                         help='Video files or directories of frames (default: synthetic passes)')
+    p_bench.add_argument('--output', '-o', help="Write the JSON report to this file ('-' for stdout)")
+    p_bench.add_argument('--decoder', choices=['auto', 'cascade', 'opencv', 'zbar', 'wechat'],
+                         help='QR decoder backend (default: DECODER or auto)')
+    p_bench.add_argument('--loops', type=int, default=1, help='Replay frame directories this many times')
+    p_bench.add_argument('--passes', type=int, default=5, help='Distinct passes in the synthetic input')
+    p_bench.add_argument('--no-gate', dest='no_gate', action='store_true', help='Decode every frame')
+    p_bench.add_argument('--no-dedup', dest='no_dedup', action='store_true',
+                         help='Sync every decoded frame instead of deduplicating repeats')
+    p_bench.add_argument('--sync-rate', dest='sync_rate', type=float, default=0,
+                         help='Sync requests per second (default: 0, unlimited)')
+    p_bench.add_argument('--stub-latency', dest='stub_latency', type=float, default=0,
+                         help='Added stub API latency in milliseconds')
+    p_bench.add_argument('--passlist', action='store_true',
+                         help='Verify synthetic passes from a prefetched local pass list')
+    p_bench.add_argument('--compact', action='store_true',
+                         help='Encode synthetic passes in the compact binary layout instead of JSON')
+    add_profile_arguments(p_bench, 'the frame replay')
+    p_bench.set_defaults(func=cmd_bench)
+
+    p_load = sub.add_parser('loadtest', help='Simulate a fleet of verifiers against a faulty stub API')
+    p_load.add_argument('--verifiers', '-n', type=int, default=10, help='Number of virtual verifiers')
+    p_load.add_argument('--processes', type=int, default=1,
+                        help='Spread verifiers over this many worker processes (default: 1, threads only)')
+    p_load.add_argument('--duration', type=float, default=30, help='Seconds of scanning')
+    p_load.add_argument('--scan-rate', dest='scan_rate', type=float, default=0.5,
+                        help='Mean scans per second per verifier (Poisson arrivals)')
+    p_load.add_argument('--heartbeat', type=float, default=10, metavar='SECS',
+                        help='Seconds between is_active heartbeats per verifier')
+    p_load.add_argument('--latency', type=float, default=20, help='Stub API latency in milliseconds')
+    p_load.add_argument('--jitter', type=float, default=0, help='Extra random stub latency, up to this many ms')
+    p_load.add_argument('--error-rate', dest='error_rate', type=float, default=0,
+                        help='Fraction of requests the stub answers with 503')
+    p_load.add_argument('--outage', metavar='START:SECONDS',
+                        help='Answer everything with 503 for SECONDS, starting START seconds into the run')
+    p_load.add_argument('--drain-timeout', dest='drain_timeout', type=float, default=120,
+                        help='Seconds to wait for journal backlogs to drain after scanning stops')
+    p_load.add_argument('--sync-rate', dest='sync_rate', type=float,
+                        help='Sync requests per second per verifier (default: SYNC_RATE)')
+    p_load.add_argument('--output', '-o', help="Write the JSON report to this file ('-' for stdout)")
+    p_load.set_defaults(func=cmd_loadtest)
+
     return parser
 
 
@@ -179,5 +573,3 @@ def main(argv=None):
 
 if __name__ == '__main__':
     main()
-
-
@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from app.aio import AsyncVerifier
+from app.bench import ReplayCapture, synthetic_frames
+from app.camera import CameraSource
+from app.crypto import PassCrypto
+from app.detector import CLIQRCodeDetector
+from app.stub import StubApiServer
+
+
+@pytest.fixture
+def stub():
+    stub = StubApiServer().start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def detector(tmp_path):
+    # Built the way `start --async` builds it: no API credentials, the runtime owns syncing
+    blank = np.zeros((120, 160, 3), dtype=np.uint8)
+    detector = CLIQRCodeDetector(api_url=None, auth_token=None, decode_workers=1, gate=False,
+                                 decoder="opencv", sources=[CameraSource(ReplayCapture([blank]), name="replay")],
+                                 journal_path=str(tmp_path / "scans.db"), scan_log_dir=None)
+    yield detector
+    detector.release_resources()
+
+
+async def run_until(verifier, done, timeout=5.0):
+    main = asyncio.create_task(verifier._main())
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.02)
+    finally:
+        main.cancel()
+        await asyncio.gather(main, return_exceptions=True)
+
+
+def test_journal_backlog_is_uploaded_by_the_async_runtime(stub, detector):
+    assert detector.sync.uploader is None
+    for n in range(3):
+        detector.sync.record(f"scan-{n}", {"gate": "main"})
+    verifier = AsyncVerifier(detector, stub.url, "token")
+    try:
+        verifier.uploader.grace_secs = 0
+        asyncio.run(run_until(verifier, lambda: detector.journal.pending_count() == 0))
+    finally:
+        verifier._decode_pool.shutdown(wait=False)
+        verifier._capture_pool.shutdown(wait=False)
+    assert detector.journal.pending_count() == 0
+    assert stub.counts.get("sync_bulk") == 1
+    assert verifier.uploader._thread is None
+
+
+def test_scans_are_verified_and_synced_through_the_shared_steps(stub, tmp_path):
+    crypto = PassCrypto(["passito"])
+    # Looped, since the runtime drops frames while the decoder is busy; the dedup window absorbs repeats
+    frames, pass_ids = synthetic_frames(crypto, passes=2)
+    detector = CLIQRCodeDetector(api_url=None, auth_token=None, decode_workers=1, gate=False, decoder="opencv",
+                                 secrets=["passito"], sources=[CameraSource(ReplayCapture(frames, loops=100), name="replay")],
+                                 journal_path=str(tmp_path / "scans.db"), scan_log_dir=None)
+    verifier = AsyncVerifier(detector, stub.url, "token", rate=0)
+    journal = detector.journal
+
+    def synced():
+        return journal._conn.execute("SELECT COUNT(*) FROM scans WHERE acked = 1").fetchone()[0] == len(pass_ids)
+
+    try:
+        asyncio.run(run_until(verifier, synced))
+        assert synced()
+        assert journal.pending_count() == 0
+        assert sum(stub.counts.get(name, 0) for name in ("sync", "sync_bulk")) >= 1
+        assert detector.verdicts.stats()["entries"] == len(pass_ids)
+    finally:
+        verifier._decode_pool.shutdown(wait=False)
+        verifier._capture_pool.shutdown(wait=False)
+        detector.release_resources()
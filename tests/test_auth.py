@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+from app import auth
+
+
+class Stop(Exception):
+    pass
+
+
+class FakeState:
+    def __init__(self, checked_at):
+        self.checked_at = checked_at
+
+    def get(self):
+        return {'ip_checked_at': self.checked_at}
+
+
+def test_keep_ip_fresh_is_disabled_by_a_zero_ttl(monkeypatch):
+    slept = []
+    monkeypatch.setattr(auth.time, "sleep", slept.append)
+    auth._keep_ip_fresh("http://api", "token", FakeState(0), 0)
+    assert slept == []
+
+
+def test_keep_ip_fresh_never_sleeps_less_than_the_floor(monkeypatch):
+    slept = []
+
+    def sleep(secs):
+        slept.append(secs)
+        if len(slept) == 3:
+            raise Stop()
+
+    monkeypatch.setattr(auth.time, "sleep", sleep)
+    monkeypatch.setattr(auth, "refresh_public_ip", lambda *args: None)
+    with pytest.raises(Stop):
+        auth._keep_ip_fresh("http://api", "token", FakeState(time.time()), 1)
+    assert slept == [auth.MIN_IP_REFRESH_SECS] * 3
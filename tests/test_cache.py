@@ -0,0 +1,72 @@
+from app.cache import DedupWindow, VerdictCache, payload_key
+
+
+def test_payload_key_is_the_same_for_str_and_bytes():
+    assert payload_key("abc") == payload_key(b"abc")
+    assert payload_key("abc") != payload_key("abd")
+
+
+def test_dedup_window_suppresses_repeats_until_ttl():
+    window = DedupWindow(ttl=5.0)
+    assert not window.seen("a", now=0.0)
+    assert window.seen("a", now=1.0)
+    assert window.seen("a", now=4.9)
+    assert window.hits == 2
+    # Hits do not extend the window
+    assert not window.seen("a", now=5.0)
+
+
+def test_dedup_window_expires_old_keys_only():
+    window = DedupWindow(ttl=2.0)
+    window.seen("a", now=0.0)
+    window.seen("b", now=1.5)
+    assert not window.seen("c", now=2.5)
+    assert len(window) == 2
+    assert window.seen("b", now=3.0)
+    window.clear()
+    assert len(window) == 0
+
+
+def test_verdict_cache_ttl_and_pass_expiry():
+    cache = VerdictCache(ttl=60.0)
+    cache.put("k", {"status": True}, now=0.0)
+    cache.put("short", {"status": True}, pass_expiry=10, now=0.0)
+    assert cache.get("k", now=59.0) == {"status": True}
+    assert cache.get("short", now=9.0) is not None
+    assert cache.get("short", now=10.0) is None
+    assert cache.get("k", now=61.0) is None
+    assert cache.stats() == {"entries": 0, "hits": 2, "misses": 2}
+
+
+def test_verdict_cache_evicts_least_recently_used():
+    cache = VerdictCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_server_invalidation_by_pass_id():
+    cache = VerdictCache()
+    cache.put("in", {"status": True}, pass_id="P1")
+    cache.put("out", {"status": True}, pass_id="P1")
+    cache.put("other", {"status": True}, pass_id=2)
+    cache.apply_server_invalidation({"invalidate": ["P1", "unknown"]})
+    assert cache.get("in") is None and cache.get("out") is None
+    assert cache.get("other") is not None
+    # Numeric ids from JSON match the string form
+    cache.apply_server_invalidation({"invalidate": [2]})
+    assert cache.get("other") is None
+
+
+def test_server_invalidation_wildcard_and_index_cleanup():
+    cache = VerdictCache(max_entries=1)
+    cache.put("a", 1, pass_id="A")
+    cache.put("b", 2, pass_id="B")
+    assert "A" not in cache._by_pass
+    cache.apply_server_invalidation({"invalidate": "*"})
+    assert cache.get("b") is None
+    assert cache._by_pass == {}
+    cache.apply_server_invalidation("not a dict")
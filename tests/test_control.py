@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+import pytest
+
+from app.control import ControlError, ControlServer, ControlUnavailable, control_call
+
+
+class FakeHandler:
+    COMMANDS = ("echo", "status", "boom")
+
+    def echo(self, text, times=1):
+        return text * times
+
+    def status(self):
+        return {"running": True}
+
+    def boom(self):
+        raise RuntimeError("exploded")
+
+    def hidden(self):
+        return "never"
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are short-lived and length-limited, so stay out of deep pytest dirs
+    directory = tempfile.mkdtemp(prefix="passito-test-")
+    yield os.path.join(directory, "control.sock")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def server(socket_path):
+    # Bound but not serving; dispatch needs no thread
+    server = ControlServer(socket_path, FakeHandler())
+    yield server
+    server.server_close()
+
+
+def dispatch(server, request):
+    return server.dispatch(request if isinstance(request, bytes) else json.dumps(request).encode())
+
+
+def test_dispatch_calls_listed_commands(server):
+    assert dispatch(server, {"cmd": "echo", "args": {"text": "ab", "times": 2}}) == {"ok": True, "result": "abab"}
+    assert dispatch(server, {"cmd": "status"}) == {"ok": True, "result": {"running": True}}
+
+
+@pytest.mark.parametrize("request_line", [b"not json", b"[]", b'{"args": {}}', b'{"cmd": "status", "args": [1]}'])
+def test_dispatch_rejects_malformed_requests(server, request_line):
+    assert dispatch(server, request_line) == {"ok": False, "error": "malformed request"}
+
+
+def test_dispatch_refuses_unlisted_commands(server):
+    for name in ("hidden", "__init__", "nope"):
+        assert dispatch(server, {"cmd": name})["error"] == f"unknown command: {name}"
+
+
+def test_dispatch_checks_arguments_before_calling(server):
+    reply = dispatch(server, {"cmd": "echo", "args": {"txt": "a"}})
+    assert not reply["ok"] and reply["error"].startswith("bad arguments for echo")
+    assert not dispatch(server, {"cmd": "status", "args": {"verbose": True}})["ok"]
+
+
+def test_dispatch_reports_handler_errors(server):
+    assert dispatch(server, {"cmd": "boom"}) == {"ok": False, "error": "exploded"}
+
+
+def test_socket_round_trip(socket_path):
+    server = ControlServer(socket_path, FakeHandler()).start()
+    try:
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o660
+        assert control_call("echo", path=socket_path, text="hi") == "hi"
+        with pytest.raises(ControlError, match="exploded"):
+            control_call("boom", path=socket_path)
+    finally:
+        server.stop()
+
+
+def test_stale_socket_is_replaced(socket_path):
+    ControlServer(socket_path, FakeHandler()).server_close()
+    assert os.path.exists(socket_path)
+    server = ControlServer(socket_path, FakeHandler()).start()
+    try:
+        assert control_call("status", path=socket_path) == {"running": True}
+        with pytest.raises(OSError, match="already listening"):
+            ControlServer(socket_path, FakeHandler())
+    finally:
+        server.stop()
+    assert not os.path.exists(socket_path)
+
+
+def test_no_verifier(socket_path):
+    with pytest.raises(ControlUnavailable):
+        control_call("status", path=socket_path)
+    with pytest.raises(ControlUnavailable):
+        control_call("status", path="")
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.bench import ReplayCapture
+from app.camera import CameraSource
+from app.crypto import PassCrypto
+from app.detector import CLIQRCodeDetector, decode_roi
+from app.journal import step
+
+
+@pytest.fixture
+def detector(tmp_path):
+    blank = np.zeros((120, 160, 3), dtype=np.uint8)
+    source = CameraSource(ReplayCapture([blank]), name="north", gate="north", action="check-in")
+    detector = CLIQRCodeDetector(decode_workers=1, gate=False, decoder="opencv", secrets=["passito"],
+                                 sources=[source], journal_path=str(tmp_path / "scans.db"), scan_log_dir=None)
+    yield detector
+    detector.release_resources()
+
+
+def encrypted(pass_id):
+    return PassCrypto(["passito"]).encrypt(json.dumps({"id": pass_id, "name": "A"}))
+
+
+def test_server_bound_scan_is_journaled_then_finished_with_the_verdict(detector):
+    steps = detector.scan(encrypted("p1"))
+    request, _ = step(steps)
+    data, key, meta = request
+    assert json.loads(data) == {"id": "p1", "name": "A"}
+    assert meta == {"gate": "north", "action": "check-in"}
+    assert [row[0] for row in detector.journal.pending()] == [key]
+    assert step(steps, {"status": True, "message": "Welcome"}) == (None, None)
+    assert detector.verdicts.stats()["entries"] == 1
+    detector.verdicts.invalidate_passes(["p1"])
+    assert detector.verdicts.stats()["entries"] == 0
+
+
+def test_repeat_scans_are_dropped_or_answered_from_the_cache(detector):
+    steps = detector.scan(encrypted("p2"))
+    step(steps)
+    step(steps, {"status": True})
+    # Inside the dedup window the same payload is dropped outright
+    assert step(detector.scan(encrypted("p2"))) == (None, None)
+    detector.dedup.clear()
+    assert step(detector.scan(encrypted("p2"))) == (None, None)
+    assert detector.verdicts.hits == 1
+    assert detector.journal.pending_count() == 1
+
+
+def test_undecryptable_payloads_never_reach_the_journal(detector):
+    assert step(detector.scan("not a pass")) == (None, None)
+    assert detector.journal.pending_count() == 0
+
+
+def test_decode_roi_crops_before_decoding():
+    class Recorder:
+        def decode(self, image):
+            return "data", image.shape
+
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    assert decode_roi(Recorder(), image)[1] == (100, 200, 3)
+    assert decode_roi(Recorder(), image, (10, 20, 60, 50))[1] == (30, 50, 3)
+
+
+def test_sinks_see_decoded_payloads_and_how_each_scan_ended(detector):
+    decoded, ended = [], []
+    detector.decoded_sink = decoded.append
+    detector.scan_sink = lambda idx, source, verdict, seconds: ended.append((source, verdict))
+    payload = encrypted("p3")
+    detector._handle_decoded(0, None, (120, 160, 3), payload, None)
+    detector._handle_decoded(0, None, (120, 160, 3), None, None)
+    assert decoded == [(payload, 0)]
+    steps = detector.scan(payload)
+    step(steps)
+    step(steps, {"status": True})
+    step(detector.scan(payload))
+    detector.dedup.clear()
+    step(detector.scan(payload))
+    assert ended == [("server", {"status": True}), ("dropped", None), ("cache", {"status": True})]
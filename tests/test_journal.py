@@ -0,0 +1,145 @@
+import pytest
+
+from app.journal import DEAD_LETTER, JournalUploader, ScanJournal, rejected, step
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = ScanJournal(str(tmp_path / "scans.db"))
+    yield journal
+    journal.close()
+
+
+def run(uploader, responses, features=("bulk",)):
+    """Drive one drain with canned responses; returns (requests made, result)."""
+    requests = []
+    steps = uploader.drain(features)
+    request, result = step(steps)
+    while request is not None:
+        requests.append(request)
+        response = responses(request) if callable(responses) else responses.pop(0)
+        request, result = step(steps, response)
+    return requests, result
+
+
+def test_rejected():
+    assert rejected({"error": "bad", "status_code": 400})
+    assert rejected({"error": "bad", "status_code": 422})
+    assert not rejected({"error": "throttled", "status_code": 429})
+    assert not rejected({"error": "auth", "status_code": 401})
+    assert not rejected({"error": "down", "status_code": 503})
+    assert not rejected({"error": "timeout"})
+    assert not rejected(None)
+
+
+def test_append_pending_ack(journal):
+    first = journal.append("a", meta={"gate": "north"})
+    second = journal.append("b")
+    rows = journal.pending()
+    assert [(key, data, meta) for key, data, _, meta in rows] == [(first, "a", {"gate": "north"}), (second, "b", {})]
+    journal.ack([first])
+    assert [r[0] for r in journal.pending()] == [second]
+    assert journal.pending_count() == 1
+    assert journal.pending(older_than=60) == []
+
+
+def test_pending_rows_survive_a_restart(tmp_path):
+    path = str(tmp_path / "scans.db")
+    journal = ScanJournal(path)
+    keys = [journal.append(str(n)) for n in range(3)]
+    journal.ack(keys[:1])
+    journal.close()
+    reopened = ScanJournal(path)
+    try:
+        assert [r[0] for r in reopened.pending()] == keys[1:]
+    finally:
+        reopened.close()
+
+
+def test_dead_letter_needs_enough_attempts(journal):
+    key = journal.append("bad")
+    journal.mark_attempt([key])
+    assert journal.dead_letter([key], max_attempts=2) == 0
+    journal.mark_attempt([key])
+    assert journal.dead_letter([key], max_attempts=2) == 1
+    assert journal.pending_count() == 0
+    assert journal.dead_count() == 1
+    row = journal._conn.execute("SELECT acked FROM scans WHERE key = ?", (key,)).fetchone()
+    assert row[0] == DEAD_LETTER
+
+
+def test_bulk_upload_acks_the_batch(journal):
+    keys = [journal.append(str(n), meta={"gate": "g"}) for n in range(3)]
+    uploader = JournalUploader(journal, "http://api", "token", grace_secs=0)
+    requests, result = run(uploader, [{"status": True}])
+    assert result is True
+    endpoint, body, headers, _ = requests[0]
+    assert endpoint == "sync_bulk"
+    assert [item["id"] for item in body["items"]] == keys
+    assert body["items"][0]["gate"] == "g"
+    assert headers["Idempotency-Key"] == keys[0] + "-" + keys[-1]
+    assert journal.pending_count() == 0
+    assert run(uploader, [])[1] is None
+
+
+def test_transient_failure_keeps_rows_and_backs_off(journal):
+    journal.append("a")
+    uploader = JournalUploader(journal, "http://api", "token", grace_secs=0)
+    _, result = run(uploader, [{"error": "down", "status_code": 503}])
+    assert result is False
+    assert journal.pending_count() == 1
+    assert uploader.delay_after(result) >= 0.8
+
+
+def test_rejected_batch_is_bisected_and_the_bad_row_dead_lettered(journal):
+    keys = [journal.append(str(n)) for n in range(4)]
+    bad = keys[2]
+
+    def server(request):
+        endpoint, body, _, _ = request
+        ids = [item["id"] for item in body["items"]] if "items" in body else [body["id"]]
+        return {"error": "invalid", "status_code": 400} if bad in ids else {"status": True}
+
+    uploader = JournalUploader(journal, "http://api", "token", grace_secs=0, max_attempts=2)
+    for _ in range(20):
+        if not journal.pending_count():
+            break
+        run(uploader, server)
+    assert journal.pending_count() == 0
+    assert journal.dead_count() == 1
+    assert journal._conn.execute("SELECT acked FROM scans WHERE key = ?", (bad,)).fetchone()[0] == DEAD_LETTER
+
+
+class FakeSync:
+    endpoint = "sync"
+
+    def bulk_allowed(self, features):
+        return "bulk" in features
+
+    def gzip_allowed(self, features):
+        return False
+
+    def bulk_rejected(self, status, compressed):
+        return "single" if status == 404 else None
+
+
+def test_falls_back_to_single_requests_without_a_bulk_endpoint(journal):
+    keys = [journal.append(str(n)) for n in range(2)]
+    uploader = JournalUploader(journal, "http://api", "token", grace_secs=0, sync=FakeSync())
+    requests, result = run(uploader, [{"error": "missing", "status_code": 404}, {"status": True}, {"status": True}])
+    assert result is True
+    assert [r[0] for r in requests] == ["sync_bulk", "sync", "sync"]
+    assert [r[1]["id"] for r in requests[1:]] == keys
+    assert journal.pending_count() == 0
+    # Without the bulk feature the bulk endpoint is not even tried
+    journal.append("x")
+    requests, _ = run(uploader, [{"status": True}], features=())
+    assert [r[0] for r in requests] == ["sync"]
+
+
+def test_single_requests_stop_at_a_transient_failure(journal):
+    keys = [journal.append(str(n)) for n in range(3)]
+    uploader = JournalUploader(journal, "http://api", "token", grace_secs=0, sync=FakeSync())
+    _, result = run(uploader, [{"status": True}, {"error": "down", "status_code": 502}], features=())
+    assert result is False
+    assert [r[0] for r in journal.pending()] == keys[1:]
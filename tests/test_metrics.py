@@ -0,0 +1,70 @@
+import random
+
+from app.metrics import EXPORT_BOUNDS, Registry, _bucket_index, _bucket_upper, standalone_histogram
+
+
+def test_buckets_are_contiguous_and_bound_their_values():
+    for us in list(range(0, 5000)) + [10 ** k for k in range(4, 11)]:
+        idx = _bucket_index(us)
+        upper = _bucket_upper(idx)
+        assert us < upper
+        if idx > 0:
+            assert _bucket_upper(idx - 1) <= us
+
+
+def test_relative_error_stays_within_one_sub_bucket():
+    for us in (17, 100, 999, 12345, 987654, 10 ** 9):
+        upper = _bucket_upper(_bucket_index(us))
+        assert (upper - us) / us <= 0.125 + 1e-9
+
+
+def test_percentiles_follow_the_distribution():
+    hist = standalone_histogram()
+    for ms in range(1, 1001):
+        hist.observe(ms / 1000.0)
+    assert hist.count == 1000
+    assert abs(hist.sum - 500.5) < 1e-6
+    for p in (50, 95, 99):
+        assert p / 100.0 <= hist.percentile(p) <= p / 100.0 * 1.13
+    assert hist.percentile(100) == hist.max == 1.0
+
+
+def test_empty_histogram_has_no_percentile():
+    assert standalone_histogram().percentile(50) is None
+
+
+def test_merge_equals_observing_everything_in_one():
+    rng = random.Random(7)
+    values = [rng.expovariate(20) for _ in range(500)]
+    whole, left, right = standalone_histogram(), standalone_histogram(), standalone_histogram()
+    for i, v in enumerate(values):
+        whole.observe(v)
+        (left if i % 2 else right).observe(v)
+    left.merge(right.state())
+    counts, count, total, peak = left.state()
+    assert counts == whole.counts and count == whole.count and peak == whole.max
+    assert abs(total - whole.sum) < 1e-9
+
+
+def test_cumulative_counts_are_monotonic_and_complete():
+    hist = standalone_histogram()
+    for v in (0.0001, 0.003, 0.003, 0.2, 7.0, 50.0):
+        hist.observe(v)
+    cumulative = hist.cumulative()
+    assert len(cumulative) == len(EXPORT_BOUNDS)
+    assert cumulative == sorted(cumulative)
+    assert cumulative[EXPORT_BOUNDS.index(0.0005)] == 1
+    assert cumulative[EXPORT_BOUNDS.index(0.005)] == 3
+    assert cumulative[-1] == 5
+
+
+def test_registry_renders_histogram_series():
+    registry = Registry()
+    registry.histogram("demo_seconds", "Demo", ("endpoint",)).labels("sync").observe(0.02)
+    registry.counter("demo_total", "Demo").inc(3)
+    text = registry.render()
+    assert 'demo_seconds_bucket{endpoint="sync",le="0.025"} 1' in text
+    assert 'demo_seconds_count{endpoint="sync"} 1' in text
+    assert "demo_total 3" in text
+    snapshot = registry.snapshot()
+    assert snapshot["demo_seconds"]["series"][0]["count"] == 1
@@ -0,0 +1,90 @@
+import os
+import struct
+
+import pytest
+
+from app.passlist import (FETCHED_AT, FETCHED_AT_OFFSET, REVOKED, VALID, PassIndex, normalize_expiry,
+                          pass_digest)
+
+
+def build(path, ids, **kwargs):
+    index = PassIndex(str(path))
+    index.write({pass_digest(i): state for i, state in ids.items()}, version=3, **kwargs)
+    return index
+
+
+def test_missing_file_means_an_empty_list(tmp_path):
+    index = PassIndex(str(tmp_path / "passes.idx"))
+    assert index.lookup("a") is None
+    assert index.entries() == {}
+    assert index.age == float("inf")
+
+
+def test_write_lookup_reload_round_trip(tmp_path):
+    path = tmp_path / "passes.idx"
+    ids = {f"pass-{n}": (VALID if n % 3 else REVOKED, 1700000000 + n) for n in range(200)}
+    build(path, ids, etag="W/abc", cursor="c-9", fetched_at=1234.5)
+    reopened = PassIndex(str(path))
+    assert (reopened.version, reopened.count) == (3, 200)
+    assert (reopened.etag, reopened.cursor, reopened.fetched_at) == ("W/abc", "c-9", 1234.5)
+    for pass_id, found in ids.items():
+        assert reopened.lookup(pass_id) == found
+    assert reopened.lookup("pass-200") is None
+    assert reopened.entries() == {pass_digest(i): found for i, found in ids.items()}
+
+
+def test_invalid_file_keeps_the_previous_mapping(tmp_path):
+    path = tmp_path / "passes.idx"
+    index = build(path, {"a": (VALID, 0)})
+    # Replaced, like write() does; the old mapping stays valid
+    for garbage in (b"garbage" * 20, b"X" * 4096):
+        (tmp_path / "new").write_bytes(garbage)
+        os.replace(tmp_path / "new", path)
+        assert not index.reload()
+    assert index.lookup("a") == (VALID, 0)
+
+
+def test_touch_persists_fetched_at(tmp_path):
+    path = tmp_path / "passes.idx"
+    index = build(path, {"a": (VALID, 0)}, fetched_at=1.0)
+    index.touch()
+    on_disk, = FETCHED_AT.unpack_from(path.read_bytes(), FETCHED_AT_OFFSET)
+    assert on_disk == index.fetched_at > 1.0
+    assert PassIndex(str(path)).fetched_at == on_disk
+
+
+def test_verdicts(tmp_path):
+    index = build(tmp_path / "passes.idx", {"ok": (VALID, 0), "old": (VALID, 1), "gone": (REVOKED, 0)})
+    assert index.verdict("ok", max_age=60)["status"] is True
+    assert index.verdict("old", max_age=60)["message"] == "Pass expired"
+    assert index.verdict("gone", max_age=60)["message"] == "Pass revoked"
+    assert index.verdict("unknown", max_age=60) is None
+    assert index.verdict(None, max_age=60) is None
+    index.fetched_at = 1.0
+    assert index.verdict("ok", max_age=60) is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, 0),
+    ("", 0),
+    (0, 0),
+    (1700000000, 1700000000),
+    (1700000000.9, 1700000000),
+    (1700000000123, 1700000000),
+    ("1700000000", 1700000000),
+    ("2023-11-14T22:13:20Z", 1700000000),
+    ("2023-11-14T22:13:20", 1700000000),
+    ("2023-11-15T00:13:20+02:00", 1700000000),
+])
+def test_normalize_expiry(value, expected):
+    assert normalize_expiry(value) == expected
+
+
+@pytest.mark.parametrize("value", ["tomorrow", -5, True, [1], 2 ** 40 * 1000 * 1000])
+def test_normalize_expiry_rejects(value):
+    with pytest.raises(ValueError):
+        normalize_expiry(value)
+
+
+def test_header_offset_matches_the_layout():
+    assert FETCHED_AT_OFFSET == struct.calcsize("<8sQ")
@@ -0,0 +1,54 @@
+import pytest
+
+from app.payload import (COMPACT_PREFIX, compact_text, describe, encode_compact, is_compact, is_expired,
+                         parse_compact)
+
+
+def test_round_trip():
+    plaintext = encode_compact("pass-42", expires=1893456000, action="check-out", extra=b'{"n":"A"}')
+    assert is_compact(plaintext)
+    compact = parse_compact(plaintext)
+    assert compact.pass_id == "pass-42"
+    assert compact.expires == 1893456000
+    assert compact.action == "check-out"
+
+
+def test_defaults_mean_no_expiry_and_any_action():
+    compact = parse_compact(encode_compact("x"))
+    assert compact.expires is None and compact.action is None
+    assert not is_expired(compact)
+
+
+def test_json_is_never_compact():
+    assert not is_compact(b'{"id": 1}')
+    assert not is_compact(b"")
+
+
+def test_expiry():
+    compact = parse_compact(encode_compact("x", expires=100))
+    assert is_expired(compact, now=100)
+    assert not is_expired(compact, now=99)
+
+
+@pytest.mark.parametrize("plaintext, message", [
+    (b"\x01\x00", "too short"),
+    (b"\x02\x00\x00\x00\x00\x00\x00", "version"),
+    (b"\x01\x07\x00\x00\x00\x00\x00", "action"),
+    (b"\x01\x00\x00\x00\x00\x00\x05ab", "truncated"),
+    (b"\x01\x00\x00\x00\x00\x00\x02\xff\xfe", "UTF-8"),
+])
+def test_malformed_passes_are_rejected(plaintext, message):
+    with pytest.raises(ValueError, match=message):
+        parse_compact(plaintext)
+
+
+def test_long_pass_ids_are_refused():
+    with pytest.raises(ValueError):
+        encode_compact("x" * 256)
+
+
+def test_text_forms():
+    plaintext = encode_compact("abc", action="check-in")
+    assert compact_text(plaintext).startswith(COMPACT_PREFIX)
+    assert "id=abc" in describe(plaintext) and "action=check-in" in describe(plaintext)
+    assert describe(b'{"id":1}') == '{"id":1}'
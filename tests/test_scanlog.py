@@ -0,0 +1,115 @@
+import os
+import gzip
+
+import pytest
+
+from app.scanlog import ScanLog, format_cursor, parse_cursor
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "scanlog")
+
+
+def open_log(directory, **kwargs):
+    kwargs.setdefault("flush_interval", 0)
+    kwargs.setdefault("fsync", False)
+    return ScanLog(directory, **kwargs)
+
+
+def write(directory, records, **kwargs):
+    log = open_log(directory, **kwargs)
+    for record in records:
+        log.append(record)
+    log.close()
+
+
+def test_cursor_text_round_trip():
+    assert parse_cursor("") is None
+    assert parse_cursor("3:120") == (3, 120)
+    assert parse_cursor("3") == (3, 0)
+    assert format_cursor((3, 120)) == "3:120"
+
+
+def test_records_survive_reopen_in_order(directory):
+    write(directory, [{"n": n} for n in range(5)])
+    write(directory, [{"n": n} for n in range(5, 8)])
+    records, _ = ScanLog(directory, readonly=True).read()
+    assert [r["n"] for r in records] == list(range(8))
+
+
+def test_rotation_compacts_and_drops_old_segments(directory):
+    # Every batch crosses segment_bytes, so each one seals a segment
+    for batch in range(6):
+        write(directory, [{"n": batch, "pad": "x" * 100}] * 3, segment_bytes=200, keep=3)
+    segments = ScanLog(directory, readonly=True).segments()
+    assert [seq for seq, _, _ in segments] == [5, 6, 7]
+    assert [compressed for _, _, compressed in segments] == [True, True, False]
+    with gzip.open(segments[0][1]) as f:
+        assert f.read().endswith(b"}\n")
+    assert {r["n"] for r in ScanLog(directory, readonly=True).read()[0]} == {4, 5}
+
+
+def test_cursor_resumes_across_rotation(directory):
+    write(directory, [{"n": n, "pad": "x" * 40} for n in range(10)], segment_bytes=150, keep=100)
+    reader = ScanLog(directory, readonly=True)
+    first, cursor = reader.read(limit=4)
+    rest, cursor = reader.read(cursor)
+    assert [r["n"] for r in first + rest] == list(range(10))
+    assert reader.read(cursor) == ([], cursor)
+    write(directory, [{"n": 10}], segment_bytes=150, keep=100)
+    more, _ = reader.read(cursor)
+    assert [r["n"] for r in more] == [10]
+
+
+def test_end_skips_existing_records(directory):
+    write(directory, [{"n": 0}])
+    reader = ScanLog(directory, readonly=True)
+    cursor = reader.end()
+    write(directory, [{"n": 1}])
+    assert reader.read(cursor)[0] == [{"n": 1}]
+
+
+def test_tail_spans_segments(directory):
+    write(directory, [{"n": n, "pad": "x" * 40} for n in range(10)], segment_bytes=150, keep=100)
+    assert [r["n"] for r in ScanLog(directory, readonly=True).tail(5)] == [5, 6, 7, 8, 9]
+
+
+def test_torn_tail_is_truncated_on_open(directory):
+    write(directory, [{"n": 0}])
+    _, path, _ = ScanLog(directory, readonly=True).segments()[-1]
+    with open(path, "ab") as f:
+        f.write(b'{"n": 1, "trunc')
+    write(directory, [{"n": 2}])
+    reader = ScanLog(directory, readonly=True)
+    assert [r["n"] for r in reader.read()[0]] == [0, 2]
+    assert reader.corrupt == 0
+
+
+def test_corrupt_lines_are_skipped_and_counted(directory):
+    write(directory, [{"n": 0}])
+    _, path, _ = ScanLog(directory, readonly=True).segments()[-1]
+    with open(path, "ab") as f:
+        f.write(b"not json\n")
+    write(directory, [{"n": 1}])
+    reader = ScanLog(directory, readonly=True)
+    assert [r["n"] for r in reader.read()[0]] == [0, 1]
+    assert [r["n"] for r in reader.tail(5)] == [0, 1]
+    assert reader.corrupt == 2
+
+
+def test_interrupted_compaction_is_cleaned_up(directory):
+    write(directory, [{"n": n, "pad": "x" * 40} for n in range(4)], segment_bytes=150, keep=100)
+    seq, gz_path, compressed = ScanLog(directory, readonly=True).segments()[0]
+    assert compressed
+    plain = gz_path[:-len(".gz")]
+    with gzip.open(gz_path) as src, open(plain, "wb") as dst:
+        dst.write(src.read())
+    with open(plain + ".tmp", "wb") as f:
+        f.write(b"partial")
+    # Readers already prefer the finished .gz
+    assert [r["n"] for r in ScanLog(directory, readonly=True).read()[0]] == list(range(4))
+    open_log(directory).close()
+    names = {p.rsplit("/", 1)[-1] for _, p, _ in ScanLog(directory, readonly=True).segments()}
+    assert plain.rsplit("/", 1)[-1] not in names
+    assert not os.path.exists(plain) and not os.path.exists(plain + ".tmp")
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from app.server import ApiClient, send_request
+from app.stub import StubApiServer
+
+
+class ScriptedStub(StubApiServer):
+    """Stub that answers with the queued HTTP statuses first, then normally."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.script = []
+        self.test_reply = None
+
+    def fault(self):
+        with self.lock:
+            if self.script:
+                return self.script.pop(0), {"status": False, "message": "scripted"}
+        return super().fault()
+
+    def respond(self, endpoint, body):
+        if endpoint == "test" and self.test_reply is not None:
+            return 200, self.test_reply
+        return super().respond(endpoint, body)
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = ScriptedStub().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stub(server):
+    with server.lock:
+        server.counts.clear()
+        server.connections = 0
+    server.script, server.test_reply, server.latency, server.outages = [], None, 0.0, []
+    return server
+
+
+@pytest.fixture
+def client(stub):
+    client = ApiClient(stub.url, "token", backoff=0)
+    yield client
+    client.close()
+
+
+def test_one_keep_alive_connection_serves_every_call(stub, client):
+    for n in range(5):
+        assert client.request("sync", {"data": n}) == {"status": True, "message": "Synced"}
+    assert client.test()
+    assert stub.counts == {"sync": 5, "test": 1}
+    assert stub.connections == 1
+
+
+@pytest.mark.parametrize("status", [502, 503, 504])
+def test_gateway_errors_are_retried(stub, client, status):
+    stub.script = [status, status]
+    assert client.request("sync", {"data": "x"}) == {"status": True, "message": "Synced"}
+    assert stub.counts["sync"] == 3
+
+
+def test_retries_are_bounded(stub, client):
+    stub.script = [503] * 5
+    resp = client.request("sync", {"data": "x"})
+    assert resp["status_code"] == 503
+    assert stub.counts["sync"] == 3
+
+
+@pytest.mark.parametrize("status", [400, 500])
+def test_other_errors_are_not_retried(stub, client, status):
+    stub.script = [status]
+    resp = client.request("sync", {"data": "x"})
+    assert resp["status_code"] == status and "error" in resp
+    assert stub.counts["sync"] == 1
+
+
+def test_read_timeout_returns_an_error_quickly(stub):
+    stub.latency = 0.5
+    client = ApiClient(stub.url, "token", read_timeout=0.1, backoff=0)
+    try:
+        t0 = time.perf_counter()
+        resp = client.request("sync", {"data": "x"})
+        assert time.perf_counter() - t0 < 0.45
+        assert "error" in resp and "status_code" not in resp
+        assert client.available is False
+    finally:
+        client.close()
+
+
+def test_send_request_does_not_probe_test(stub):
+    assert send_request(stub.url, "token", "sync", {"data": "x"}) == {"status": True, "message": "Synced"}
+    assert send_request(stub.url, "token", "sync", {"data": "y"})["status"] is True
+    assert stub.counts == {"sync": 2}
+
+
+def test_test_reads_status_and_features(stub, client):
+    assert client.test() is True
+    assert client.features == {"sync_bulk", "gzip"}
+    stub.test_reply = {"status": False}
+    assert client.test() is False
+
+
+@pytest.mark.parametrize("reply", [["ok"], "ok", 1])
+def test_test_treats_a_non_object_reply_as_unavailable(stub, client, reply):
+    stub.test_reply = reply
+    assert client.test() is False
+    assert client.available is False
+
+
+def test_heartbeat_tracks_availability(stub, client):
+    client.start_heartbeat(interval=0.05)
+    deadline = time.monotonic() + 2.0
+    while stub.counts.get("test", 0) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.available is True
+    stub.outage(time.time(), 60)
+    deadline = time.monotonic() + 2.0
+    while client.available and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.available is False
+    client.close()
+    seen = stub.counts["test"]
+    time.sleep(0.15)
+    assert stub.counts["test"] == seen
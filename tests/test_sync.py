@@ -0,0 +1,145 @@
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+from app.journal import step
+from app.stub import StubApiServer
+from app.sync import DataSync, answered, bulk_payload, split_results
+
+
+def batch(*keys):
+    return [("data-%s" % k, k, {"gate": "main"}, None) for k in keys]
+
+
+def test_answered():
+    assert answered({"status": True})
+    assert not answered(None)
+    assert not answered({})
+    assert not answered({"error": "boom", "status_code": 500})
+
+
+def test_bulk_payload_carries_ids_and_meta():
+    body = bulk_payload(batch("a", "b"))
+    assert body == {"items": [{"gate": "main", "id": "a", "data": "data-a"},
+                              {"gate": "main", "id": "b", "data": "data-b"}]}
+
+
+def test_results_are_matched_by_echoed_id():
+    resp = {"results": [{"id": "b", "status": False}, {"id": "a", "status": True}]}
+    assert split_results(batch("a", "b"), resp) == [{"id": "a", "status": True}, {"id": "b", "status": False}]
+
+
+def test_scans_missing_from_an_id_keyed_reply_get_the_whole_response():
+    resp = {"status": True, "results": [{"id": "a", "status": True}]}
+    out = split_results(batch("a", "b"), resp)
+    assert out[0] == {"id": "a", "status": True}
+    assert out[1] is resp
+
+
+def test_results_without_ids_are_matched_by_position():
+    resp = {"results": [{"status": True}, {"status": False}]}
+    assert split_results(batch("a", "b"), resp) == resp["results"]
+
+
+def test_failed_items_stay_unanswered():
+    resp = {"results": [{"id": "a", "status": True}, {"id": "b", "error": "bad pass"}]}
+    assert split_results(batch("a", "b"), resp) == [{"id": "a", "status": True}, None]
+
+
+def test_a_reply_without_results_answers_every_scan():
+    resp = {"status": True}
+    assert split_results(batch("a", "b"), resp) == [resp, resp]
+
+
+def test_a_failed_request_answers_none():
+    assert split_results(batch("a", "b"), {"error": "timeout"}) == [None, None]
+
+
+class BrokenJournal:
+    def append(self, data, meta=None):
+        return "k-" + data
+
+    def ack(self, keys):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    # Enough for the background uploader to find nothing to do
+    def pending(self, limit=200, older_than=0.0):
+        return []
+
+    def prune(self):
+        pass
+
+
+@pytest.fixture
+def stub():
+    stub = StubApiServer().start()
+    yield stub
+    stub.stop()
+
+
+def test_scheduler_survives_a_failing_batch(stub):
+    sync = DataSync(stub.url, "token", journal=BrokenJournal(), rate=0, batch_window=0)
+    try:
+        first = sync.sync_with_server("a", key=sync.record("a"))
+        assert first.result(timeout=5) is None
+        # The scheduler thread is still alive and serving
+        second = sync.sync_with_server("b")
+        assert second.result(timeout=5) == {"status": True, "message": "Synced"}
+        assert sync._thread.is_alive()
+    finally:
+        sync.close()
+
+
+def run_exchange(sync, batch, responses, features=("sync_bulk", "gzip")):
+    """Drive DataSync.exchange with canned responses; returns (requests made, results)."""
+    requests = []
+    steps = sync.exchange(batch, features)
+    request, results = step(steps)
+    while request is not None:
+        requests.append(request)
+        request, results = step(steps, responses.pop(0))
+    return requests, results
+
+
+def test_exchange_sends_a_batch_in_one_bulk_request():
+    sync = DataSync()
+    requests, results = run_exchange(sync, batch("a", "b"), [
+        {"results": [{"id": "a", "status": True}, {"id": "b", "status": False}]}])
+    assert [(r[0], r[3]) for r in requests] == [("sync_bulk", True)]
+    assert results == [{"id": "a", "status": True}, {"id": "b", "status": False}]
+
+
+def test_exchange_falls_back_to_single_requests():
+    sync = DataSync()
+    requests, results = run_exchange(sync, batch("a", "b"), [
+        {"error": "not found", "status_code": 404}, {"status": True}, {"error": "down", "status_code": 503}])
+    assert [r[0] for r in requests] == ["sync_bulk", "sync", "sync"]
+    assert requests[1][1] == {"gate": "main", "data": "data-a", "id": "a"}
+    assert requests[1][2] == {"Idempotency-Key": "a"}
+    assert results == [{"status": True}, None]
+    # Remembered: the next batch goes out one by one straight away
+    requests, _ = run_exchange(sync, batch("c", "d"), [{"status": True}, {"status": True}])
+    assert [r[0] for r in requests] == ["sync", "sync"]
+
+
+def test_exchange_resends_uncompressed_when_gzip_is_refused():
+    sync = DataSync()
+    requests, results = run_exchange(sync, batch("a", "b"), [
+        {"error": "unsupported", "status_code": 415}, {"status": True}])
+    assert [(r[0], r[3]) for r in requests] == [("sync_bulk", True), ("sync_bulk", False)]
+    assert results == [{"status": True}, {"status": True}]
+
+
+def test_a_single_scan_skips_the_bulk_endpoint():
+    requests, results = run_exchange(DataSync(), batch("a"), [{"status": True}])
+    assert [r[0] for r in requests] == ["sync"]
+
+
+def test_settle_and_resolve():
+    sync = DataSync()
+    items = [(data, key, meta, Future()) for data, key, meta, _ in batch("a", "b")] + [("x", None, None, Future())]
+    results = [{"status": True}, None, {"status": True}]
+    assert sync.settle(items, results) == ["a"]
+    sync.resolve(items, results)
+    assert [fut.result(timeout=0) for *_, fut in items] == results